@@ -1,7 +1,13 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
+import logging
 import os
-from typing import Dict, List, Optional
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
@@ -12,8 +18,24 @@ from langchain_deepseek import ChatDeepSeek
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_xai import ChatXAI
 
+from cache import SQLiteCache, get_cache
+from dedupe import ResultDeduper, dedupe_results
+from metrics import instrument, is_error_output, record_llm_call
+from ratelimit import get_limiter, session_scope
+from router import ROUTER_ENGINES, EngineRouter
+from policy import acall_with_policy, call_with_policy, get_policy, is_transient
+from quiz import Quiz, QuizOutput, empty_quiz, load_quiz, quiz_from_output
+from relevance import RelevanceSplit, split_by_relevance
+from tokens import (
+    get_token_counter,
+    split_into_chunks,
+    truncate_to_tokens,
+)
 from utils import (
+    SEARCH_TIMEOUT,
+    SearchFn,
     extract_text_from_file,
+    search_many,
     search_text,
     search_videos,
     search_projects,
@@ -25,20 +47,524 @@ load_dotenv()
 
 parser = StrOutputParser()
 
+logger = logging.getLogger(__name__)
+
+# LLM response cache: seconds to keep an answer, maximum entry count and total size.
+LLM_CACHE_TTL = float(os.getenv("STUDYMATE_LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("STUDYMATE_LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("STUDYMATE_LLM_CACHE_MAX_MB", "200")) * 1024 * 1024
+
+# Map-reduce summarization of long contexts: A4 condenses any context above
+# A4_MAX_CONTEXT_TOKENS by summarizing A4_CHUNK_TOKENS-sized chunks in parallel.
+A4_MAX_CONTEXT_TOKENS = int(os.getenv("STUDYMATE_A4_MAX_CONTEXT_TOKENS", "12000"))
+A4_CHUNK_TOKENS = int(os.getenv("STUDYMATE_A4_CHUNK_TOKENS", "3000"))
+A4_CHUNK_OVERLAP_TOKENS = int(os.getenv("STUDYMATE_A4_CHUNK_OVERLAP_TOKENS", "200"))
+A4_MAP_CONCURRENCY = int(os.getenv("STUDYMATE_A4_MAP_CONCURRENCY", "4"))
+A4_MAX_REDUCE_ROUNDS = 3
+# Tokens of an uploaded course given to A4 for one chapter. A course up to this size
+# is map-reduced whole; a larger one is narrowed to its passages most relevant to
+# the chapter (retrieval.py), which are then map-reduced like any long context.
+A4_RETRIEVAL_TOKENS = int(os.getenv("STUDYMATE_A4_RETRIEVAL_TOKENS", str(4 * A4_MAX_CONTEXT_TOKENS)))
+
+# A2 fast path: results scoring at least A2_KEEP_THRESHOLD are kept and those below
+# A2_DROP_THRESHOLD dropped without an LLM call; anything in between goes to the LLM.
+A2_FAST_PATH = os.getenv("STUDYMATE_A2_FAST_PATH", "1") != "0"
+A2_KEEP_THRESHOLD = float(os.getenv("STUDYMATE_A2_KEEP_THRESHOLD", "0.6"))
+A2_DROP_THRESHOLD = float(os.getenv("STUDYMATE_A2_DROP_THRESHOLD", "0.2"))
+
+# Token budget of each LLM agent: (prompt variable, maximum tokens). The variable is
+# cut at a paragraph boundary before the call when it is larger. Override a limit
+# with STUDYMATE_<AGENT>_MAX_INPUT_TOKENS, e.g. STUDYMATE_A7_AI_COMPANION_MAX_INPUT_TOKENS.
+AGENT_TOKEN_BUDGETS: Dict[str, Tuple[str, int]] = {
+    agent: (variable, int(os.getenv(f"STUDYMATE_{agent.upper()}_MAX_INPUT_TOKENS", str(limit))))
+    for agent, variable, limit in (
+        ("A2_Cleaner", "raw_results", 6000),
+        ("A4_Summarizer", "context", A4_MAX_CONTEXT_TOKENS),
+        ("A7_AI_Companion", "summary", 6000),
+        ("A9_Guide", "summary", 6000),
+    )
+}
+
+# (search function, query, max_results) issued by a web-search agent.
+SearchQuery = Tuple[SearchFn, str, int]
+
 
 class EngineError(RuntimeError):
     """Raised when an AI engine cannot be initialized (missing key, etc.)."""
 
 
+def _get_llm_cache() -> SQLiteCache:
+    return get_cache(
+        "llm",
+        max_entries=LLM_CACHE_MAX_ENTRIES,
+        max_bytes=LLM_CACHE_MAX_BYTES,
+        default_ttl=LLM_CACHE_TTL,
+        compress=True,
+    )
+
+
+def llm_cache_stats() -> Dict[str, Any]:
+    """
+    Return hit/miss counters and size of the LLM response cache.
+    """
+    return _get_llm_cache().stats()
+
+
+def _llm_cache_key(
+    prompt: ChatPromptTemplate,
+    llm,
+    inputs: Dict[str, Any],
+    schema: Optional[type] = None,
+) -> str:
+    """
+    Content address of one chain call: engine, model settings, prompt template and
+    inputs, plus the JSON schema of structured output (a pydantic model) if any.
+    """
+    engine = getattr(llm, "_llm_type", None) or type(llm).__name__
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", None)
+    temperature = getattr(llm, "temperature", None)
+    template_hash = hashlib.sha256(prompt.pretty_repr().encode("utf-8")).hexdigest()
+    if schema is None:
+        return SQLiteCache.make_key(engine, model, temperature, template_hash, inputs)
+    schema_json = json.dumps(schema.model_json_schema(), sort_keys=True)
+    schema_hash = hashlib.sha256(schema_json.encode("utf-8")).hexdigest()
+    return SQLiteCache.make_key(engine, model, temperature, template_hash, inputs, schema_hash)
+
+
+def _cache_lookup(
+    prompt: ChatPromptTemplate,
+    llm,
+    inputs: Dict[str, Any],
+    schema: Optional[type] = None,
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Return (cache key, cached answer). The key is None when the LLM cache is disabled.
+    """
+    if LLM_CACHE_TTL <= 0:
+        return None, None
+    key = _llm_cache_key(prompt, llm, inputs, schema)
+    return key, _get_llm_cache().get(key)
+
+
+def _cache_store(key: Optional[str], text: str) -> None:
+    if key is not None:
+        _get_llm_cache().set(key, text)
+
+
+def _engine_of(llm) -> str:
+    """
+    Engine code (openai/deepseek/gemini/grok) of a chat model, or its LangChain type.
+    """
+    llm_type = (getattr(llm, "_llm_type", None) or type(llm).__name__).lower()
+    for engine, marker in (
+        ("auto", "router"),
+        ("deepseek", "deepseek"),
+        ("gemini", "google"),
+        ("grok", "xai"),
+        ("openai", "openai"),
+    ):
+        if marker in llm_type:
+            return engine
+    return llm_type
+
+
+def _apply_token_budget(agent: str, llm, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return inputs with the agent's budgeted variable truncated to its token limit.
+    """
+    budget = AGENT_TOKEN_BUDGETS.get(agent)
+    if budget is None:
+        return inputs
+    variable, max_tokens = budget
+    value = inputs.get(variable)
+    if not isinstance(value, str):
+        return inputs
+    counter = get_token_counter(_engine_of(llm))
+    tokens = counter(value)
+    if tokens <= max_tokens:
+        return inputs
+    logger.warning(
+        "%s: %s has %d tokens, truncating to the %d token budget", agent, variable, tokens, max_tokens
+    )
+    value = truncate_to_tokens(value, max_tokens, counter=counter)
+    tokens = counter(value)
+    if tokens > max_tokens:
+        logger.error(
+            "%s: %s still has %d tokens after truncation (budget %d)", agent, variable, tokens, max_tokens
+        )
+    return {**inputs, variable: value}
+
+
+def _record_call(
+    agent: str,
+    prompt: ChatPromptTemplate,
+    llm,
+    inputs: Dict[str, Any],
+    output: Optional[str],
+    seconds: float,
+    cached: bool = False,
+) -> None:
+    """
+    Record latency, outcome and token counts of one chain call (output None = failed).
+    """
+    engine = _engine_of(llm)
+    counter = get_token_counter(engine)
+    if output is None:
+        record_llm_call(agent, engine, seconds, "error")
+        return
+    record_llm_call(
+        agent,
+        engine,
+        seconds,
+        "cached" if cached else "ok",
+        tokens_in=counter(prompt.format(**inputs)),
+        tokens_out=counter(output),
+    )
+
+
+def _hedge_llm(llm):
+    """
+    Chat model to hedge calls to llm with under its engine policy, or None.
+    """
+    engine = _engine_of(llm)
+    hedge_engine = get_policy(engine).hedge_engine
+    if not hedge_engine or hedge_engine == engine:
+        return None
+    try:
+        return get_llm(hedge_engine)
+    except EngineError as exc:
+        logger.warning("Hedging %s with %s is disabled: %s", engine, hedge_engine, exc)
+        return None
+
+
+def _batch_with_retries(chain, items: List[Dict[str, Any]], llm, max_concurrency: int) -> List[Any]:
+    """
+    chain.batch() with return_exceptions, re-sending items that failed transiently.
+    """
+    policy = get_policy(_engine_of(llm))
+    config = {"max_concurrency": max_concurrency}
+    # batch() runs items in worker threads that inherit this context but not the
+    # Streamlit session: bind it so the rate limiter queues them under the caller.
+    with session_scope():
+        outputs = chain.batch(items, config=config, return_exceptions=True)
+    for attempt in range(1, policy.retries + 1):
+        failed = [idx for idx, out in enumerate(outputs) if isinstance(out, Exception) and is_transient(out)]
+        if not failed:
+            break
+        time.sleep(policy.delay(attempt))
+        with session_scope():
+            retried = chain.batch([items[idx] for idx in failed], config=config, return_exceptions=True)
+        for idx, output in zip(failed, retried):
+            outputs[idx] = output
+    return outputs
+
+
+async def _abatch_with_retries(chain, items: List[Dict[str, Any]], llm, max_concurrency: int) -> List[Any]:
+    """
+    Async _batch_with_retries using chain.abatch().
+    """
+    policy = get_policy(_engine_of(llm))
+    config = {"max_concurrency": max_concurrency}
+    outputs = await chain.abatch(items, config=config, return_exceptions=True)
+    for attempt in range(1, policy.retries + 1):
+        failed = [idx for idx, out in enumerate(outputs) if isinstance(out, Exception) and is_transient(out)]
+        if not failed:
+            break
+        await asyncio.sleep(policy.delay(attempt))
+        retried = await chain.abatch([items[idx] for idx in failed], config=config, return_exceptions=True)
+        for idx, output in zip(failed, retried):
+            outputs[idx] = output
+    return outputs
+
+
+def _run_chain(agent: str, prompt: ChatPromptTemplate, llm, inputs: Dict[str, Any]) -> str:
+    """
+    Run prompt | llm | parser on inputs, serving identical calls from the LLM cache.
+
+    Inputs are first cut to the agent's token budget (AGENT_TOKEN_BUDGETS); latency,
+    tokens and cache hits of every call are recorded in metrics. The call follows the
+    engine's policy (policy.py): deadline, retries with backoff and optional hedging
+    to a second engine. Failures are returned as "[agent ERROR] ..." text and are
+    never cached.
+    """
+    inputs = _apply_token_budget(agent, llm, inputs)
+    started = time.perf_counter()
+    key, cached = _cache_lookup(prompt, llm, inputs)
+    if cached is not None:
+        _record_call(agent, prompt, llm, inputs, cached, time.perf_counter() - started, cached=True)
+        return cached
+
+    chain = prompt | llm | parser
+    hedge_llm = _hedge_llm(llm)
+    hedge = (lambda: (prompt | hedge_llm | parser).invoke(inputs)) if hedge_llm is not None else None
+    try:
+        result = call_with_policy(lambda: chain.invoke(inputs), get_policy(_engine_of(llm)), hedge)
+    except Exception as exc:
+        _record_call(agent, prompt, llm, inputs, None, time.perf_counter() - started)
+        return f"[{agent} ERROR] {exc}"
+
+    _record_call(agent, prompt, llm, inputs, result, time.perf_counter() - started)
+    _cache_store(key, result)
+    return result
+
+
+async def _arun_chain(
+    agent: str,
+    prompt: ChatPromptTemplate,
+    llm,
+    inputs: Dict[str, Any],
+) -> str:
+    """
+    Async counterpart of _run_chain using the chain's ainvoke().
+    """
+    inputs = _apply_token_budget(agent, llm, inputs)
+    started = time.perf_counter()
+    key, cached = _cache_lookup(prompt, llm, inputs)
+    if cached is not None:
+        _record_call(agent, prompt, llm, inputs, cached, time.perf_counter() - started, cached=True)
+        return cached
+
+    chain = prompt | llm | parser
+    hedge_llm = _hedge_llm(llm)
+    hedge = (lambda: (prompt | hedge_llm | parser).ainvoke(inputs)) if hedge_llm is not None else None
+    try:
+        result = await acall_with_policy(lambda: chain.ainvoke(inputs), get_policy(_engine_of(llm)), hedge)
+    except Exception as exc:
+        _record_call(agent, prompt, llm, inputs, None, time.perf_counter() - started)
+        return f"[{agent} ERROR] {exc}"
+
+    _record_call(agent, prompt, llm, inputs, result, time.perf_counter() - started)
+    _cache_store(key, result)
+    return result
+
+
+def _run_chain_batch(
+    agent: str,
+    prompt: ChatPromptTemplate,
+    llm,
+    inputs_list: List[Dict[str, Any]],
+    max_concurrency: int,
+) -> List[str]:
+    """
+    Batch counterpart of _run_chain using the chain's batch() API.
+
+    Inputs already in the LLM cache are answered from it; the rest are sent with at
+    most max_concurrency calls in flight, and items that fail transiently are sent
+    again per the engine policy. Each failed item becomes an "[agent ERROR] ..."
+    string without affecting the others.
+    """
+    inputs_list = [_apply_token_budget(agent, llm, inputs) for inputs in inputs_list]
+    started = time.perf_counter()
+    keys: List[Optional[str]] = []
+    results: List[str] = []
+    pending: List[int] = []
+    for idx, inputs in enumerate(inputs_list):
+        key, cached = _cache_lookup(prompt, llm, inputs)
+        keys.append(key)
+        results.append(cached or "")
+        if cached is None:
+            pending.append(idx)
+        else:
+            _record_call(agent, prompt, llm, inputs, cached, 0.0, cached=True)
+
+    if pending:
+        chain = prompt | llm | parser
+        outputs = _batch_with_retries(
+            chain, [inputs_list[idx] for idx in pending], llm, max_concurrency
+        )
+        # Items of a batch run concurrently, so each is charged the batch wall time.
+        seconds = time.perf_counter() - started
+        for idx, output in zip(pending, outputs):
+            if isinstance(output, Exception):
+                results[idx] = f"[{agent} ERROR] {output}"
+                _record_call(agent, prompt, llm, inputs_list[idx], None, seconds)
+            else:
+                results[idx] = output
+                _record_call(agent, prompt, llm, inputs_list[idx], output, seconds)
+                _cache_store(keys[idx], output)
+    return results
+
+
+async def _arun_chain_batch(
+    agent: str,
+    prompt: ChatPromptTemplate,
+    llm,
+    inputs_list: List[Dict[str, Any]],
+    max_concurrency: int,
+) -> List[str]:
+    """
+    Async counterpart of _run_chain_batch using the chain's abatch().
+    """
+    inputs_list = [_apply_token_budget(agent, llm, inputs) for inputs in inputs_list]
+    started = time.perf_counter()
+    keys: List[Optional[str]] = []
+    results: List[str] = []
+    pending: List[int] = []
+    for idx, inputs in enumerate(inputs_list):
+        key, cached = _cache_lookup(prompt, llm, inputs)
+        keys.append(key)
+        results.append(cached or "")
+        if cached is None:
+            pending.append(idx)
+        else:
+            _record_call(agent, prompt, llm, inputs, cached, 0.0, cached=True)
+
+    if pending:
+        chain = prompt | llm | parser
+        outputs = await _abatch_with_retries(
+            chain, [inputs_list[idx] for idx in pending], llm, max_concurrency
+        )
+        # Items of a batch run concurrently, so each is charged the batch wall time.
+        seconds = time.perf_counter() - started
+        for idx, output in zip(pending, outputs):
+            if isinstance(output, Exception):
+                results[idx] = f"[{agent} ERROR] {output}"
+                _record_call(agent, prompt, llm, inputs_list[idx], None, seconds)
+            else:
+                results[idx] = output
+                _record_call(agent, prompt, llm, inputs_list[idx], output, seconds)
+                _cache_store(keys[idx], output)
+    return results
+
+
+def _stream_chain(
+    agent: str,
+    prompt: ChatPromptTemplate,
+    llm,
+    inputs: Dict[str, Any],
+) -> Iterator[str]:
+    """
+    Streaming counterpart of _run_chain: yield text chunks as the model produces them.
+
+    A cached answer is yielded as a single chunk. The full text is cached once the
+    stream completes; a failure is yielded as a trailing "[agent ERROR] ..." chunk.
+    Transient failures are retried per the engine policy until the first chunk has
+    been yielded; the client's HTTP timeout bounds each attempt.
+    """
+    inputs = _apply_token_budget(agent, llm, inputs)
+    started = time.perf_counter()
+    key, cached = _cache_lookup(prompt, llm, inputs)
+    if cached is not None:
+        _record_call(agent, prompt, llm, inputs, cached, time.perf_counter() - started, cached=True)
+        yield cached
+        return
+
+    chain = prompt | llm | parser
+    policy = get_policy(_engine_of(llm))
+    chunks: List[str] = []
+    attempt = 0
+    while True:
+        try:
+            for chunk in chain.stream(inputs):
+                chunks.append(chunk)
+                yield chunk
+            break
+        except Exception as exc:
+            attempt += 1
+            # Retry only while nothing has been shown to the user yet.
+            if not chunks and attempt <= policy.retries and is_transient(exc):
+                time.sleep(policy.delay(attempt))
+                continue
+            _record_call(agent, prompt, llm, inputs, None, time.perf_counter() - started)
+            separator = "\n\n" if chunks else ""
+            yield f"{separator}[{agent} ERROR] {exc}"
+            return
+
+    result = "".join(chunks)
+    _record_call(agent, prompt, llm, inputs, result, time.perf_counter() - started)
+    _cache_store(key, result)
+
+
+# Environment variable holding the API key of each engine.
+ENGINE_API_KEYS: Dict[str, str] = {
+    "openai": "OPENAI_API_KEY",
+    "deepseek": "DEEPSEEK_API_KEY",
+    "gemini": "GOOGLE_API_KEY",
+    "grok": "XAI_API_KEY",
+}
+
+# engine -> (API key fingerprint, chat model) for clients built by get_llm.
+_llm_registry: Dict[str, Tuple[str, Any]] = {}
+_llm_registry_lock = threading.Lock()
+
+
 def get_llm(engine_code: str):
     """
-    Return a LangChain chat model based on engine_code.
+    Return the shared LangChain chat model for engine_code.
+
+    Chat models (and the HTTP connection pools inside them) are built once per
+    process and reused by every Streamlit session and rerun. The client is
+    rebuilt automatically when the engine's API key in the environment changes;
+    call reset_llm_clients() to drop clients explicitly.
+
+    "auto" returns the EngineRouter, which spreads requests over every engine that
+    has an API key (STUDYMATE_ROUTER_ENGINES) and falls back between them.
+    """
+    engine = (engine_code or "").lower()
+    if engine == "auto":
+        return _get_router()
+    env_var = ENGINE_API_KEYS.get(engine)
+    if env_var is None:
+        return _build_llm(engine_code)
+
+    fingerprint = hashlib.sha256((os.getenv(env_var) or "").encode("utf-8")).hexdigest()
+    with _llm_registry_lock:
+        entry = _llm_registry.get(engine)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+        llm = _build_llm(engine)
+        _llm_registry[engine] = (fingerprint, llm)
+        return llm
+
+
+_router: Optional[EngineRouter] = None
+
+
+def _get_router() -> EngineRouter:
+    global _router
+    with _llm_registry_lock:
+        if _router is None:
+            _router = EngineRouter(engines=ROUTER_ENGINES, resolve=get_llm)
+        return _router
+
+
+def reset_llm_clients(engine_code: Optional[str] = None) -> None:
+    """
+    Forget cached chat models, for one engine or for all of them.
+    """
+    with _llm_registry_lock:
+        if engine_code is None:
+            _llm_registry.clear()
+        else:
+            _llm_registry.pop(engine_code.lower(), None)
+        if _router is not None and engine_code in (None, "auto"):
+            _router.reset()
+
+
+def _client_limits(engine: str) -> Dict[str, Any]:
+    """
+    HTTP timeout, retry and rate-limit settings for an engine's client.
+
+    Retries are done by the chain runners under the engine policy, so the client's
+    own retries are disabled; its timeout ends calls the policy has abandoned.
+    Every client of the engine shares its process-wide FairRateLimiter. (The
+    OpenAI-compatible clients also return response headers, from which the "auto"
+    router reads the remaining rate limit.)
+    """
+    timeout = get_policy(engine).timeout
+    return {"timeout": timeout or None, "max_retries": 0, "rate_limiter": get_limiter(engine)}
+
+
+def _build_llm(engine_code: str):
+    """
+    Build a new LangChain chat model based on engine_code.
 
     engine_code:
       - "openai"  -> OpenAI (Chat GPT 5.1 in the UI)
       - "deepseek" -> Deepseek 3.1
       - "gemini" -> Gemini 3.1
       - "grok"   -> Grok 4.1
+    ("auto" is handled by get_llm, see EngineRouter.)
     """
     engine = (engine_code or "").lower()
 
@@ -52,6 +578,8 @@ def get_llm(engine_code: str):
             model="gpt-4.1-mini",
             temperature=0.2,
             api_key=api_key,
+            include_response_headers=True,
+            **_client_limits("openai"),
         )
 
     if engine == "deepseek":
@@ -64,6 +592,8 @@ def get_llm(engine_code: str):
             model="deepseek-chat",
             temperature=0.2,
             api_key=api_key,
+            include_response_headers=True,
+            **_client_limits("deepseek"),
         )
 
     if engine == "gemini":
@@ -76,6 +606,7 @@ def get_llm(engine_code: str):
             model="gemini-2.0-flash",
             temperature=0.2,
             google_api_key=api_key,
+            **_client_limits("gemini"),
         )
 
     if engine == "grok":
@@ -88,17 +619,18 @@ def get_llm(engine_code: str):
             model="grok-4",
             temperature=0.2,
             api_key=api_key,
+            include_response_headers=True,
+            **_client_limits("grok"),
         )
 
     raise EngineError(f"Unknown engine code '{engine_code}'. Use openai/deepseek/gemini/grok.")
 
 
-def a1_everything(subject: str, chapter: str) -> str:
-    """
-    A1_Everything: global web search for the specific chapter.
-    """
-    query = f"{subject} {chapter} course explanation pdf"
-    results = search_text(query, max_results=6)
+def _a1_queries(subject: str, chapter: str) -> List[SearchQuery]:
+    return [(search_text, f"{subject} {chapter} course explanation pdf", 6)]
+
+
+def _a1_format(results: List[Dict[str, str]]) -> str:
     if not results:
         return "No web results were found."
     lines: List[str] = []
@@ -110,12 +642,35 @@ def a1_everything(subject: str, chapter: str) -> str:
     return "\n\n".join(lines)
 
 
-def a2_cleaner(llm, subject: str, raw_results: str) -> str:
+def _search_parts(queries: List[SearchQuery], timeout: float = SEARCH_TIMEOUT) -> List[List[Dict[str, str]]]:
     """
-    A2_Cleaner: keep only information that is relevant to the subject.
+    Results of each of an agent's queries, in order. The queries run concurrently
+    through utils.search_many, each one bounded by timeout.
+    """
+    parts: List[List[Dict[str, str]]] = [[] for _ in queries]
+    for idx, results in search_many(dict(enumerate(queries)), timeout=timeout):
+        parts[idx] = results
+    return parts
+
+
+@instrument("a1_everything_results")
+def a1_everything_results(subject: str, chapter: str) -> List[Dict[str, str]]:
+    """
+    A1_Everything without formatting: the raw search result dicts, deduplicated.
+    """
+    return dedupe_results(_search_parts(_a1_queries(subject, chapter))[0])
+
+
+@instrument("a1_everything")
+def a1_everything(subject: str, chapter: str) -> str:
+    """
+    A1_Everything: global web search for the specific chapter.
+    """
+    return _a1_format(a1_everything_results(subject, chapter))
+
+
+A2_PROMPT = ChatPromptTemplate.from_template(
     """
-    prompt = ChatPromptTemplate.from_template(
-        """
 You are A2_Cleaner, a strict relevance filter for study material.
 
 User subject: {subject}
@@ -134,21 +689,93 @@ Task:
 
 Return ONLY the cleaned context, ready for summarization.
 """
+)
+
+
+@instrument("a2_cleaner")
+def a2_cleaner(llm, subject: str, raw_results: str) -> str:
+    """
+    A2_Cleaner: keep only information that is relevant to the subject.
+    """
+    return _run_chain("A2_Cleaner", A2_PROMPT, llm, {"subject": subject, "raw_results": raw_results})
+
+
+@instrument("a2_cleaner_async")
+async def a2_cleaner_async(llm, subject: str, raw_results: str) -> str:
+    """
+    Async A2_Cleaner for the pipeline runner.
+    """
+    return await _arun_chain(
+        "A2_Cleaner", A2_PROMPT, llm, {"subject": subject, "raw_results": raw_results}
     )
-    chain = prompt | llm | parser
-    try:
-        return chain.invoke({"subject": subject, "raw_results": raw_results})
-    except Exception as exc:
-        return f"[A2_Cleaner ERROR] {exc}"
 
 
-def a3_adapter(file) -> str:
+def _a2_fast_split(subject: str, chapter: str, results: List[Dict[str, str]]) -> RelevanceSplit:
+    results = [r for r in results if r.get("title") != "Search error"]
+    if not A2_FAST_PATH:
+        return RelevanceSplit(uncertain=results)
+    return split_by_relevance(
+        results,
+        subject,
+        chapter,
+        keep_threshold=A2_KEEP_THRESHOLD,
+        drop_threshold=A2_DROP_THRESHOLD,
+    )
+
+
+def _a2_format_kept(results: List[Dict[str, str]]) -> str:
+    if not results:
+        return "No relevant web results were found."
+    lines: List[str] = []
+    for r in results:
+        title = r.get("title") or "No title"
+        href = r.get("href") or r.get("url") or ""
+        body = r.get("body") or r.get("description") or ""
+        lines.append(f"- {title}: {body} ({href})" if href else f"- {title}: {body}")
+    return "\n".join(lines)
+
+
+@instrument("a2_cleaner_results")
+def a2_cleaner_results(llm, subject: str, chapter: str, results: List[Dict[str, str]]) -> str:
+    """
+    A2_Cleaner on structured A1 results, with a local fast path.
+
+    Each result is scored against the subject and chapter locally (relevance.py).
+    When every result is clearly relevant or clearly off-topic, the relevant ones
+    are returned directly without an LLM call; otherwise only the results that
+    were not dropped are sent to the LLM cleaner.
+    """
+    split = _a2_fast_split(subject, chapter, results)
+    if split.confident:
+        return _a2_format_kept(split.kept)
+    return a2_cleaner(llm, subject, _a1_format(split.kept + split.uncertain))
+
+
+@instrument("a2_cleaner_results_async")
+async def a2_cleaner_results_async(
+    llm,
+    subject: str,
+    chapter: str,
+    results: List[Dict[str, str]],
+) -> str:
+    """
+    Async a2_cleaner_results for the pipeline runner.
+    """
+    split = _a2_fast_split(subject, chapter, results)
+    if split.confident:
+        return _a2_format_kept(split.kept)
+    return await a2_cleaner_async(llm, subject, _a1_format(split.kept + split.uncertain))
+
+
+@instrument("a3_adapter")
+def a3_adapter(file, digest: Optional[str] = None) -> str:
     """
     A3_Adapter: file ingestion agent.
-    Uses utils.extract_text_from_file to read PDF / DOCX / TXT.
+    Uses utils.extract_text_from_file to read PDF / DOCX / TXT; digest is the
+    SHA-256 of the file when the caller already computed it.
     """
     try:
-        text = extract_text_from_file(file)
+        text = extract_text_from_file(file, digest)
         if not text.strip():
             return "Uploaded file contains no readable text."
         return text
@@ -156,12 +783,8 @@ def a3_adapter(file) -> str:
         return f"[A3_Adapter ERROR] Could not read file: {exc}"
 
 
-def a4_summarizer(llm, context: str, guide_mode: bool) -> str:
+A4_PROMPT = ChatPromptTemplate.from_template(
     """
-    A4_Summarizer: convert context into easy study notes.
-    """
-    prompt = ChatPromptTemplate.from_template(
-        """
 You are A4_Summarizer, a patient study coach.
 
 You receive context extracted from web results or from the student course file.
@@ -186,20 +809,146 @@ If guide_mode is True:
 
 Answer in the same language as the context if obvious, otherwise default to English.
 """
+)
+
+
+A4_MAP_PROMPT = ChatPromptTemplate.from_template(
+    """
+You are A4_Summarizer, a patient study coach.
+
+You receive part {part} of {parts} of a long course document.
+
+---------------- COURSE PART ----------------
+{context}
+---------------------------------------------
+
+Write compact notes for this part only, to be merged with the notes of the other parts:
+- List the key concepts and definitions, one bullet each.
+- Keep important formulas, rules and short examples.
+- Skip tables of contents, page headers and footers, and repeated boilerplate.
+
+Do not add an introduction or a conclusion.
+Answer in the same language as the course part.
+"""
+)
+
+
+def _a4_map_inputs(context: str) -> List[Dict[str, Any]]:
+    chunks = split_into_chunks(context, A4_CHUNK_TOKENS, A4_CHUNK_OVERLAP_TOKENS)
+    return [
+        {"context": chunk, "part": idx, "parts": len(chunks)}
+        for idx, chunk in enumerate(chunks, start=1)
+    ]
+
+
+def _a4_merge_notes(notes: List[str]) -> Tuple[str, Optional[str]]:
+    """
+    Join the notes of every course part, or return an error if any part failed:
+    a summary missing parts must not be cached or stored as complete. The notes
+    that succeeded are in the LLM cache, so a rerun only retries the failed parts.
+    """
+    if not notes:
+        return "", "[A4_Summarizer ERROR] Empty context."
+    failed = [note for note in notes if is_error_output(note)]
+    if failed:
+        reason = failed[0].split("] ", 1)[-1]
+        return "", (
+            f"[A4_Summarizer ERROR] {len(failed)} of {len(notes)} course parts could not "
+            f"be summarized: {reason}"
+        )
+    return "\n\n".join(notes), None
+
+
+def _a4_truncate(context: str, counter: Callable[[str], int]) -> str:
+    return truncate_to_tokens(context, A4_MAX_CONTEXT_TOKENS, counter=counter)
+
+
+def _a4_condense(llm, context: str) -> Tuple[str, Optional[str]]:
+    """
+    Map-reduce a context that is too long for one A4 prompt.
+
+    The context is split into overlapping chunks, each chunk is summarized in
+    parallel (at most A4_MAP_CONCURRENCY calls in flight), and the partial notes
+    replace the context. This repeats until the notes fit in
+    A4_MAX_CONTEXT_TOKENS; after A4_MAX_REDUCE_ROUNDS the remainder is truncated.
+    Returns (context, error) where error is set when any chunk failed. Sizes are
+    measured with the engine's token counter.
+    """
+    counter = get_token_counter(_engine_of(llm))
+    for _ in range(A4_MAX_REDUCE_ROUNDS):
+        if counter(context) <= A4_MAX_CONTEXT_TOKENS:
+            return context, None
+        notes = _run_chain_batch(
+            "A4_Summarizer", A4_MAP_PROMPT, llm, _a4_map_inputs(context), A4_MAP_CONCURRENCY
+        )
+        context, error = _a4_merge_notes(notes)
+        if error:
+            return "", error
+    return _a4_truncate(context, counter), None
+
+
+async def _a4_acondense(llm, context: str) -> Tuple[str, Optional[str]]:
+    """
+    Async counterpart of _a4_condense.
+    """
+    counter = get_token_counter(_engine_of(llm))
+    for _ in range(A4_MAX_REDUCE_ROUNDS):
+        if counter(context) <= A4_MAX_CONTEXT_TOKENS:
+            return context, None
+        notes = await _arun_chain_batch(
+            "A4_Summarizer", A4_MAP_PROMPT, llm, _a4_map_inputs(context), A4_MAP_CONCURRENCY
+        )
+        context, error = _a4_merge_notes(notes)
+        if error:
+            return "", error
+    return _a4_truncate(context, counter), None
+
+
+@instrument("a4_summarizer")
+def a4_summarizer(llm, context: str, guide_mode: bool) -> str:
+    """
+    A4_Summarizer: convert context into easy study notes.
+    Long contexts (e.g. a whole uploaded course) are map-reduced first.
+    """
+    context, error = _a4_condense(llm, context)
+    if error:
+        return error
+    return _run_chain("A4_Summarizer", A4_PROMPT, llm, {"context": context, "guide_mode": guide_mode})
+
+
+@instrument("a4_summarizer_async")
+async def a4_summarizer_async(llm, context: str, guide_mode: bool) -> str:
+    """
+    Async A4_Summarizer for the pipeline runner.
+    """
+    context, error = await _a4_acondense(llm, context)
+    if error:
+        return error
+    return await _arun_chain(
+        "A4_Summarizer", A4_PROMPT, llm, {"context": context, "guide_mode": guide_mode}
     )
-    chain = prompt | llm | parser
-    try:
-        return chain.invoke({"context": context, "guide_mode": guide_mode})
-    except Exception as exc:
-        return f"[A4_Summarizer ERROR] {exc}"
 
 
-def a5_collector_videos(subject: str, chapter: str) -> str:
+@instrument("a4_summarizer_stream")
+def a4_summarizer_stream(llm, context: str, guide_mode: bool) -> Iterator[str]:
     """
-    A5_Collector: search for video tutorials.
+    Streaming A4_Summarizer: yield the study notes in chunks as the model produces them.
+    The map stage for long contexts runs before the first chunk is yielded.
     """
-    query = f"{subject} {chapter} tutorial site:youtube.com OR site:youtu.be"
-    results = search_videos(query, max_results=5)
+    context, error = _a4_condense(llm, context)
+    if error:
+        yield error
+        return
+    yield from _stream_chain(
+        "A4_Summarizer", A4_PROMPT, llm, {"context": context, "guide_mode": guide_mode}
+    )
+
+
+def _a5_queries(subject: str, chapter: str) -> List[SearchQuery]:
+    return [(search_videos, f"{subject} {chapter} tutorial site:youtube.com OR site:youtu.be", 5)]
+
+
+def _a5_format(results: List[Dict[str, str]]) -> str:
     if not results:
         return "No videos found."
     lines: List[str] = []
@@ -210,15 +959,26 @@ def a5_collector_videos(subject: str, chapter: str) -> str:
     return "\n\n".join(lines)
 
 
-def a6_relations_projects(subject: str, chapter: str) -> str:
+@instrument("a5_collector_videos")
+def a5_collector_videos(subject: str, chapter: str, deduper: Optional[ResultDeduper] = None) -> str:
     """
-    A6_Relations: GitHub and DockerHub related projects.
+    A5_Collector: search for video tutorials.
+    deduper, when shared with other agents, drops the links they already show.
     """
-    query_code = f"{subject} {chapter} project example site:github.com"
-    query_docker = f"{subject} {chapter} lab exercise site:hub.docker.com"
-    results_code = search_projects(query_code, max_results=5)
-    results_docker = search_projects(query_docker, max_results=5)
+    return _a5_format(dedupe_results(_search_parts(_a5_queries(subject, chapter))[0], deduper))
+
+
+def _a6_queries(subject: str, chapter: str) -> List[SearchQuery]:
+    return [
+        (search_projects, f"{subject} {chapter} project example site:github.com", 5),
+        (search_projects, f"{subject} {chapter} lab exercise site:hub.docker.com", 5),
+    ]
+
 
+def _a6_format(
+    results_code: List[Dict[str, str]],
+    results_docker: List[Dict[str, str]],
+) -> str:
     if not results_code and not results_docker:
         return "No related open source projects were found."
 
@@ -240,12 +1000,33 @@ def a6_relations_projects(subject: str, chapter: str) -> str:
     return "\n\n---------------------\n\n".join(sections)
 
 
-def a7_ai_companion_quiz(llm, summary: str) -> str:
+@instrument("a6_relations_projects")
+def a6_relations_projects(subject: str, chapter: str, deduper: Optional[ResultDeduper] = None) -> str:
     """
-    A7_AI_Companion: generate quizzes and exercises from the summary.
+    A6_Relations: GitHub and DockerHub related projects.
+    deduper, when shared with other agents, drops the links they already show.
+    """
+    deduper = deduper or ResultDeduper()
+    results = [deduper.filter(part) for part in _search_parts(_a6_queries(subject, chapter))]
+    return _a6_format(*results)
+
+
+def _excerpts_block(excerpts: str) -> str:
+    """
+    Prompt section quoting passages of the student's own course, or "" without any.
+    """
+    if not excerpts.strip():
+        return ""
+    return (
+        "\nRelevant excerpts from the student's course (refer to them where useful):\n\n"
+        "---------------- COURSE ----------------\n"
+        f"{excerpts}\n"
+        "----------------------------------------\n"
+    )
+
+
+A7_PROMPT = ChatPromptTemplate.from_template(
     """
-    prompt = ChatPromptTemplate.from_template(
-        """
 You are A7_AI_Companion, a friendly quiz generator.
 
 Student summary notes:
@@ -253,7 +1034,7 @@ Student summary notes:
 ---------------- SUMMARY ----------------
 {summary}
 ----------------------------------------
-
+{excerpts}
 Create:
 1) Three multiple choice questions (MCQ) with 4 options (A,B,C,D) each.
 2) Two short open questions or exercises.
@@ -280,20 +1061,164 @@ E2: ...
 
 Keep questions clear and at beginner level.
 """
-    )
-    chain = prompt | llm | parser
+)
+
+
+def _a7_inputs(summary: str, excerpts: str = "") -> Dict[str, Any]:
+    return {"summary": summary, "excerpts": _excerpts_block(excerpts)}
+
+
+@instrument("a7_ai_companion_quiz")
+def a7_ai_companion_quiz(llm, summary: str, excerpts: str = "") -> str:
+    """
+    A7_AI_Companion: generate quizzes and exercises from the summary.
+    excerpts are passages of the uploaded course (retrieval.py) the quiz may cite.
+    """
+    return _run_chain("A7_AI_Companion", A7_PROMPT, llm, _a7_inputs(summary, excerpts))
+
+
+@instrument("a7_ai_companion_quiz_async")
+async def a7_ai_companion_quiz_async(llm, summary: str, excerpts: str = "") -> str:
+    """
+    Async A7_AI_Companion for the pipeline runner.
+    """
+    return await _arun_chain("A7_AI_Companion", A7_PROMPT, llm, _a7_inputs(summary, excerpts))
+
+
+A7_STRUCTURED_PROMPT = ChatPromptTemplate.from_template(
+    """
+You are A7_AI_Companion, a friendly quiz generator.
+
+Student summary notes:
+
+---------------- SUMMARY ----------------
+{summary}
+----------------------------------------
+{excerpts}
+Create:
+1) Three multiple choice questions (MCQ), each with exactly 4 options (A,B,C,D) and the letter of the correct one.
+2) Two short open questions or exercises.
+
+Keep questions clear and at beginner level.
+"""
+)
+
+
+def _a7_text_quiz(text: str) -> Quiz:
+    # Quiz parsed from A7's text format; one without questions counts as a failure.
+    quiz = load_quiz(text)
+    if not quiz["questions"] and not quiz.get("error"):
+        quiz["error"] = "[A7_AI_Companion ERROR] The answer contains no usable question."
+    return quiz
+
+
+def _a7_structured_fallback(llm, summary: str, excerpts: str, reason: Exception) -> Quiz:
+    logger.info("A7 structured output unavailable (%s); parsing the text format.", reason)
+    return _a7_text_quiz(a7_ai_companion_quiz(llm, summary, excerpts))
+
+
+@instrument("a7_ai_companion_quiz_structured")
+def a7_ai_companion_quiz_structured(llm, summary: str, excerpts: str = "") -> Quiz:
+    """
+    A7_AI_Companion returning the quiz as a dict (see quiz.py) instead of text.
+
+    Uses the model's structured output (tool calling / JSON schema), so there is
+    nothing to parse. Models without it, and answers that do not fit the schema,
+    fall back to the text format and quiz.parse_quiz. Failures give an empty quiz
+    with an "error" entry.
+    """
+    agent = "A7_AI_Companion"
+    inputs = _apply_token_budget(agent, llm, _a7_inputs(summary, excerpts))
+    started = time.perf_counter()
+    key, cached = _cache_lookup(A7_STRUCTURED_PROMPT, llm, inputs, QuizOutput)
+    if cached is not None:
+        seconds = time.perf_counter() - started
+        _record_call(agent, A7_STRUCTURED_PROMPT, llm, inputs, cached, seconds, cached=True)
+        return load_quiz(cached)
+
     try:
-        return chain.invoke({"summary": summary})
+        chain = A7_STRUCTURED_PROMPT | llm.with_structured_output(QuizOutput)
+    except NotImplementedError as exc:
+        return _a7_structured_fallback(llm, summary, excerpts, exc)
+    try:
+        output = call_with_policy(lambda: chain.invoke(inputs), get_policy(_engine_of(llm)))
+        quiz = quiz_from_output(output)
     except Exception as exc:
-        return f"[A7_AI_Companion ERROR] {exc}"
+        _record_call(agent, A7_STRUCTURED_PROMPT, llm, inputs, None, time.perf_counter() - started)
+        if is_transient(exc):
+            return empty_quiz(f"[{agent} ERROR] {exc}")
+        return _a7_structured_fallback(llm, summary, excerpts, exc)
+    if not quiz["questions"]:
+        return _a7_structured_fallback(llm, summary, excerpts, ValueError("no usable question"))
+
+    text = json.dumps(quiz, ensure_ascii=False)
+    _record_call(agent, A7_STRUCTURED_PROMPT, llm, inputs, text, time.perf_counter() - started)
+    _cache_store(key, text)
+    return quiz
 
 
-def a8_examiner(subject: str, chapter: str) -> str:
+@instrument("a7_ai_companion_quiz_structured_async")
+async def a7_ai_companion_quiz_structured_async(llm, summary: str, excerpts: str = "") -> Quiz:
     """
-    A8_Examiner: look for real past exams and PDFs.
+    Async a7_ai_companion_quiz_structured.
+    """
+    agent = "A7_AI_Companion"
+    inputs = _apply_token_budget(agent, llm, _a7_inputs(summary, excerpts))
+    started = time.perf_counter()
+    key, cached = _cache_lookup(A7_STRUCTURED_PROMPT, llm, inputs, QuizOutput)
+    if cached is not None:
+        seconds = time.perf_counter() - started
+        _record_call(agent, A7_STRUCTURED_PROMPT, llm, inputs, cached, seconds, cached=True)
+        return load_quiz(cached)
+
+    async def fallback(reason: Exception) -> Quiz:
+        logger.info("A7 structured output unavailable (%s); parsing the text format.", reason)
+        return _a7_text_quiz(await a7_ai_companion_quiz_async(llm, summary, excerpts))
+
+    try:
+        chain = A7_STRUCTURED_PROMPT | llm.with_structured_output(QuizOutput)
+    except NotImplementedError as exc:
+        return await fallback(exc)
+    try:
+        output = await acall_with_policy(lambda: chain.ainvoke(inputs), get_policy(_engine_of(llm)))
+        quiz = quiz_from_output(output)
+    except Exception as exc:
+        _record_call(agent, A7_STRUCTURED_PROMPT, llm, inputs, None, time.perf_counter() - started)
+        if is_transient(exc):
+            return empty_quiz(f"[{agent} ERROR] {exc}")
+        return await fallback(exc)
+    if not quiz["questions"]:
+        return await fallback(ValueError("no usable question"))
+
+    text = json.dumps(quiz, ensure_ascii=False)
+    _record_call(agent, A7_STRUCTURED_PROMPT, llm, inputs, text, time.perf_counter() - started)
+    _cache_store(key, text)
+    return quiz
+
+
+@instrument("a7_ai_companion_quiz_structured_batch_async")
+async def a7_ai_companion_quiz_structured_batch_async(
+    llm,
+    summaries: List[str],
+    max_concurrency: int = 4,
+) -> List[Quiz]:
+    """
+    a7_ai_companion_quiz_structured_async for many summaries, max_concurrency at a time.
     """
-    query = f"{subject} {chapter} exam pdf filetype:pdf"
-    results = search_exams(query, max_results=6)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def one(summary: str) -> Quiz:
+        async with semaphore:
+            return await a7_ai_companion_quiz_structured_async(llm, summary)
+
+    return list(await asyncio.gather(*(one(summary) for summary in summaries)))
+
+
+def _a8_queries(subject: str, chapter: str) -> List[SearchQuery]:
+    return [(search_exams, f"{subject} {chapter} exam pdf filetype:pdf", 6)]
+
+
+def _a8_format(results: List[Dict[str, str]]) -> str:
     if not results:
         return "No past exam PDFs could be found."
     lines: List[str] = []
@@ -304,26 +1229,84 @@ def a8_examiner(subject: str, chapter: str) -> str:
     return "\n\n".join(lines)
 
 
-def a9_guide(
-    llm,
-    summary: str,
-    self_score: Optional[int] = None,
-    total_questions: int = 3,
-) -> str:
+@instrument("a8_examiner")
+def a8_examiner(subject: str, chapter: str, deduper: Optional[ResultDeduper] = None) -> str:
     """
-    A9_Guide: generate a study roadmap based on performance and summary.
+    A8_Examiner: look for real past exams and PDFs.
+    deduper, when shared with other agents, drops the links they already show.
     """
-    if self_score is None or self_score < 0:
-        performance_text = (
-            "The student did not provide a quiz score. Assume average understanding."
-        )
-    else:
-        performance_text = (
-            f"The student reported {self_score} correct answers out of {total_questions} questions."
-        )
+    return _a8_format(dedupe_results(_search_parts(_a8_queries(subject, chapter))[0], deduper))
+
+
+# Broad searches whose results overlap the specialized agents; run_search_agents
+# formats them last so they only keep links no other agent shows.
+GENERAL_SEARCH_AGENTS = ("A1_Everything",)
 
-    prompt = ChatPromptTemplate.from_template(
-        """
+# Web-search agents that run_search_agents can fan out: name -> (queries, formatter).
+SEARCH_AGENTS: Dict[str, Tuple[Callable[[str, str], List[SearchQuery]], Callable[..., str]]] = {
+    "A1_Everything": (_a1_queries, _a1_format),
+    "A5_Collector": (_a5_queries, _a5_format),
+    "A6_Relations": (_a6_queries, _a6_format),
+    "A8_Examiner": (_a8_queries, _a8_format),
+}
+
+
+def run_search_agents(
+    subject: str,
+    chapter: str,
+    agents: Optional[Iterable[str]] = None,
+    timeout: float = SEARCH_TIMEOUT,
+    search_fn: Optional[SearchFn] = None,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Run the web-search agents concurrently and yield (agent_name, output) as each finishes.
+
+    agents selects entries of SEARCH_AGENTS (all of them by default). Every query of
+    every selected agent is issued at once through utils.search_many, so the whole
+    phase waits for the slowest query only. search_fn replaces the agents' own
+    search functions, e.g. with a local stub backend.
+
+    Results are deduplicated across agents (dedupe.ResultDeduper): the specialized
+    agents are yielded as they finish, while A1_Everything waits for them and drops
+    every link they show. This suits pages that list all search agents side by side;
+    build_study_pipeline does not hold A1 back, since A2 and A4 wait on it.
+    """
+    names = list(agents) if agents is not None else list(SEARCH_AGENTS)
+    jobs: Dict[Tuple[str, int], SearchQuery] = {}
+    parts: Dict[str, List[Optional[List[Dict[str, str]]]]] = {}
+    for name in names:
+        if name not in SEARCH_AGENTS:
+            raise ValueError(f"Unknown search agent '{name}'. Use one of {', '.join(SEARCH_AGENTS)}.")
+        build_queries, _ = SEARCH_AGENTS[name]
+        queries = build_queries(subject, chapter)
+        parts[name] = [None] * len(queries)
+        for idx, (agent_search_fn, query, max_results) in enumerate(queries):
+            jobs[(name, idx)] = (search_fn or agent_search_fn, query, max_results)
+
+    deduper = ResultDeduper()
+    waiting = set(names)
+    held: List[str] = []
+
+    def finish(name: str) -> Tuple[str, str]:
+        _, formatter = SEARCH_AGENTS[name]
+        return name, formatter(*(deduper.filter(part) for part in parts[name]))
+
+    for (name, idx), results in search_many(jobs, timeout=timeout):
+        parts[name][idx] = results
+        if any(part is None for part in parts[name]):
+            continue
+        waiting.discard(name)
+        if name in GENERAL_SEARCH_AGENTS:
+            held.append(name)
+        else:
+            yield finish(name)
+        if not waiting:
+            for general in held:
+                yield finish(general)
+
+
+A9_PROMPT = ChatPromptTemplate.from_template(
+    """
 You are A9_Guide, an academic coach.
 
 Student performance info:
@@ -334,7 +1317,7 @@ Summary of the chapter:
 ---------------- SUMMARY ----------------
 {summary}
 ----------------------------------------
-
+{excerpts}
 Create a step-by-step roadmap for mastering this chapter:
 - Start with a short diagnosis of the student's level (beginner, ok, or strong).
 - Then give a 5 to 7 step roadmap.
@@ -344,9 +1327,89 @@ Create a step-by-step roadmap for mastering this chapter:
 
 Use simple, encouraging language.
 """
+)
+
+
+def _a9_inputs(
+    summary: str,
+    self_score: Optional[int],
+    total_questions: int,
+    excerpts: str = "",
+) -> Dict[str, Any]:
+    if self_score is None or self_score < 0:
+        performance_text = (
+            "The student did not provide a quiz score. Assume average understanding."
+        )
+    else:
+        performance_text = (
+            f"The student reported {self_score} correct answers out of {total_questions} questions."
+        )
+    return {
+        "performance_text": performance_text,
+        "summary": summary,
+        "excerpts": _excerpts_block(excerpts),
+    }
+
+
+@instrument("a9_guide")
+def a9_guide(
+    llm,
+    summary: str,
+    self_score: Optional[int] = None,
+    total_questions: int = 3,
+    excerpts: str = "",
+) -> str:
+    """
+    A9_Guide: generate a study roadmap based on performance and summary.
+    excerpts are passages of the uploaded course (retrieval.py) the roadmap may cite.
+    """
+    return _run_chain(
+        "A9_Guide", A9_PROMPT, llm, _a9_inputs(summary, self_score, total_questions, excerpts)
     )
-    chain = prompt | llm | parser
-    try:
-        return chain.invoke({"performance_text": performance_text, "summary": summary})
-    except Exception as exc:
-        return f"[A9_Guide ERROR] {exc}"
+
+
+@instrument("a9_guide_async")
+async def a9_guide_async(
+    llm,
+    summary: str,
+    self_score: Optional[int] = None,
+    total_questions: int = 3,
+    excerpts: str = "",
+) -> str:
+    """
+    Async A9_Guide for the pipeline runner.
+    """
+    return await _arun_chain(
+        "A9_Guide", A9_PROMPT, llm, _a9_inputs(summary, self_score, total_questions, excerpts)
+    )
+
+
+@instrument("a9_guide_stream")
+def a9_guide_stream(
+    llm,
+    summary: str,
+    self_score: Optional[int] = None,
+    total_questions: int = 3,
+    excerpts: str = "",
+) -> Iterator[str]:
+    """
+    Streaming A9_Guide: yield the roadmap in chunks as the model produces them.
+    """
+    return _stream_chain(
+        "A9_Guide", A9_PROMPT, llm, _a9_inputs(summary, self_score, total_questions, excerpts)
+    )
+
+
+@instrument("a9_guide_batch_async")
+async def a9_guide_batch_async(
+    llm,
+    summaries: List[str],
+    max_concurrency: int = 4,
+    self_score: Optional[int] = None,
+    total_questions: int = 3,
+) -> List[str]:
+    """
+    A9_Guide for many summaries at once through the chain's abatch() API.
+    """
+    inputs = [_a9_inputs(s, self_score, total_questions) for s in summaries]
+    return await _arun_chain_batch("A9_Guide", A9_PROMPT, llm, inputs, max_concurrency)
@@ -5,6 +5,11 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+from metrics import start_metrics_server
+
+# Serve /metrics for Prometheus when STUDYMATE_METRICS_PORT is set (no-op otherwise).
+start_metrics_server()
+
 st.set_page_config(
     page_title="StudyMate AI",
     page_icon="🎓",
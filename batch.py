@@ -0,0 +1,246 @@
+"""
+Generate study packs for every chapter of a syllabus without the Streamlit UI.
+
+Each chapter runs the agent pipeline up to A4 (web search, cleaning, summary,
+videos, projects and exams) with at most --concurrency chapters in flight; the
+quizzes (A7, as structured quiz dicts) and roadmaps (A9) of all chapters are
+then generated in one batched phase. Every chapter is written to its own JSON
+file as soon as it progresses, so an interrupted run resumes where it stopped,
+and answers already produced are served from the LLM and search caches.
+
+Syllabus files are JSON ({"subject": ..., "chapters": [...]}, or a list of such
+objects) or plain text (first line the subject, then one chapter per line).
+
+Usage: python batch.py syllabus.json --engine openai [--out packs] [--concurrency 3]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from agents import (
+    EngineError,
+    a7_ai_companion_quiz_structured_batch_async,
+    a9_guide_batch_async,
+    get_llm,
+)
+from metrics import is_error_output
+from pipeline import build_study_pipeline
+
+# Nodes run per chapter before the batched A7/A9 phase.
+CHAPTER_NODES = ("A4_Summarizer", "A5_Collector", "A6_Relations", "A8_Examiner")
+# Nodes of the batched phase.
+BATCH_NODES = ("A7_AI_Companion", "A9_Guide")
+
+_BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def load_syllabus(path: str) -> List[Tuple[str, List[str]]]:
+    """
+    Read a syllabus file and return [(subject, [chapter, ...]), ...].
+    """
+    with open(path, "r", encoding="utf-8-sig") as fh:
+        raw = fh.read()
+
+    if path.lower().endswith(".json"):
+        data = json.loads(raw)
+        courses = data if isinstance(data, list) else [data]
+        syllabus: List[Tuple[str, List[str]]] = []
+        for course in courses:
+            chapters = [
+                chapter.get("title", "") if isinstance(chapter, dict) else str(chapter)
+                for chapter in course.get("chapters", [])
+            ]
+            syllabus.append((course["subject"].strip(), [c.strip() for c in chapters if c.strip()]))
+        return syllabus
+
+    lines = [
+        line.strip()
+        for line in raw.splitlines()
+        if line.strip() and not line.strip().startswith("#")
+    ]
+    if not lines:
+        raise ValueError(f"{path} is empty.")
+    subject = re.sub(r"^subject\s*:\s*", "", lines[0], flags=re.IGNORECASE)
+    chapters = [_BULLET_RE.sub("", line) for line in lines[1:]]
+    return [(subject, [c for c in chapters if c])]
+
+
+def _slug(text: str, max_length: int = 60) -> str:
+    slug = re.sub(r"[^\w]+", "-", text.lower(), flags=re.UNICODE).strip("-")
+    return slug[:max_length] or "untitled"
+
+
+def chapter_path(out_dir: str, subject: str, index: int, chapter: str) -> str:
+    return os.path.join(out_dir, _slug(subject), f"{index:02d}-{_slug(chapter)}.json")
+
+
+def _load(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _needs_chapter_run(pack: Dict[str, Any]) -> bool:
+    # True unless every per-chapter node (and its dependencies, such as A2) succeeded.
+    outputs = pack["outputs"]
+    if any(name not in BATCH_NODES for name in pack["errors"]):
+        return True
+    return any(name not in outputs or is_error_output(outputs[name]) for name in CHAPTER_NODES)
+
+
+def _save(path: str, pack: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(pack, fh, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+async def _run_chapter(
+    llm,
+    pack: Dict[str, Any],
+    path: str,
+    guide_mode: bool,
+    semaphore: asyncio.Semaphore,
+) -> None:
+    async with semaphore:
+        pipeline = build_study_pipeline(llm, pack["subject"], pack["chapter"], guide_mode=guide_mode)
+        result = await pipeline.subset(CHAPTER_NODES).arun()
+    pack["outputs"].update(result.outputs)
+    # Errors of the nodes that just ran are replaced; agents report most failures as
+    # "[Agent ERROR] ..." outputs, not exceptions.
+    for name in result.outputs:
+        pack["errors"].pop(name, None)
+    pack["errors"].update(
+        (name, output) for name, output in result.outputs.items() if is_error_output(output)
+    )
+    pack["errors"].update(result.errors)
+    pack["timings"] = {name: round(t.seconds, 3) for name, t in result.timings.items()}
+    pack["status"] = "summarized"
+    _save(path, pack)
+    print(f"  summarized {pack['subject']} / {pack['chapter']} in {result.total_seconds:.1f}s")
+
+
+async def run_batch(
+    syllabus: List[Tuple[str, List[str]]],
+    engine: str,
+    out_dir: str,
+    concurrency: int = 3,
+    guide_mode: bool = False,
+    force: bool = False,
+) -> Dict[str, int]:
+    """
+    Generate every missing pack of syllabus under out_dir and return counters.
+    """
+    llm = get_llm(engine)
+    packs: List[Tuple[str, Dict[str, Any]]] = []
+    skipped = 0
+    for subject, chapters in syllabus:
+        for index, chapter in enumerate(chapters, start=1):
+            path = chapter_path(out_dir, subject, index, chapter)
+            pack = None if force else _load(path)
+            if pack is not None and (pack.get("engine") != engine or pack.get("guide_mode") != guide_mode):
+                # Built with other options: start the chapter over.
+                pack = None
+            if pack is not None and pack.get("status") == "complete":
+                skipped += 1
+                continue
+            if pack is None:
+                pack = {
+                    "subject": subject,
+                    "chapter": chapter,
+                    "engine": engine,
+                    "guide_mode": guide_mode,
+                    "status": "pending",
+                    "outputs": {},
+                    "errors": {},
+                }
+            packs.append((path, pack))
+
+    # Phase 1: search and summarize each chapter, a few chapters at a time.
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    await asyncio.gather(
+        *(
+            _run_chapter(llm, pack, path, guide_mode, semaphore)
+            for path, pack in packs
+            if _needs_chapter_run(pack)
+        )
+    )
+
+    # Phase 2: quizzes and roadmaps for every summarized chapter, batched.
+    ready = [
+        (path, pack)
+        for path, pack in packs
+        if not is_error_output(pack["outputs"].get("A4_Summarizer", "[A4_Summarizer ERROR]"))
+    ]
+    summaries = [pack["outputs"]["A4_Summarizer"] for _, pack in ready]
+    if summaries:
+        quizzes, roadmaps = await asyncio.gather(
+            a7_ai_companion_quiz_structured_batch_async(llm, summaries, concurrency),
+            a9_guide_batch_async(llm, summaries, concurrency),
+        )
+        for (path, pack), quiz, roadmap in zip(ready, quizzes, roadmaps):
+            pack["outputs"]["A7_AI_Companion"] = quiz
+            pack["outputs"]["A9_Guide"] = roadmap
+            for name, output in zip(BATCH_NODES, (quiz, roadmap)):
+                if is_error_output(output):
+                    pack["errors"][name] = output["error"] if isinstance(output, dict) else output
+                else:
+                    pack["errors"].pop(name, None)
+            pack["status"] = "complete" if not pack["errors"] else "failed"
+            pack["generated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            _save(path, pack)
+
+    failed = 0
+    for path, pack in packs:
+        if pack["status"] != "complete":
+            pack["status"] = "failed"
+            _save(path, pack)
+            failed += 1
+    return {"generated": len(packs) - failed, "skipped": skipped, "failed": failed}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate study packs for a whole syllabus.")
+    parser.add_argument("syllabus", help="JSON or text syllabus file")
+    parser.add_argument("--engine", default="openai", help="openai, deepseek, gemini, grok or auto")
+    parser.add_argument("--out", default="packs", help="output directory (default: packs)")
+    parser.add_argument("--concurrency", type=int, default=3, help="chapters processed at once")
+    parser.add_argument("--guide", action="store_true", help="use the step-by-step guide mode")
+    parser.add_argument("--force", action="store_true", help="regenerate packs that are already complete")
+    args = parser.parse_args(argv)
+
+    try:
+        syllabus = load_syllabus(args.syllabus)
+    except (OSError, ValueError, KeyError) as exc:
+        print(f"Could not read syllabus: {exc}", file=sys.stderr)
+        return 2
+
+    total = sum(len(chapters) for _, chapters in syllabus)
+    print(f"{total} chapters in {len(syllabus)} course(s), engine {args.engine}")
+    started = time.perf_counter()
+    try:
+        counts = asyncio.run(
+            run_batch(syllabus, args.engine, args.out, args.concurrency, args.guide, args.force)
+        )
+    except EngineError as exc:
+        print(str(exc), file=sys.stderr)
+        return 2
+    print(
+        f"Done in {time.perf_counter() - started:.1f}s: {counts['generated']} generated, "
+        f"{counts['skipped']} already complete, {counts['failed']} failed (rerun to retry)."
+    )
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
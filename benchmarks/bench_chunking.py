@@ -0,0 +1,72 @@
+"""
+Benchmark tokens.split_into_chunks on page-sized paragraphs and check its overlap.
+
+Builds a synthetic course whose pages are each longer than the overlap (like PDF
+pages extracted by utils.extract_text_from_pdf), reports the time to chunk it and
+fails if a chunk exceeds its budget or two consecutive chunks share no text.
+
+Usage: python benchmarks/bench_chunking.py [--pages 20 200] [--chunk 3000] [--overlap 200]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tokens import count_tokens, split_into_chunks  # noqa: E402
+
+LOREM = (
+    "A limit describes the value a function approaches as its input approaches a point. "
+    "Continuity means the limit equals the value of the function at that point."
+)
+
+
+def make_course(pages: int, sentences_per_page: int = 24) -> str:
+    """
+    One paragraph per page, each page several hundred tokens long.
+    """
+    return "\n\n".join(
+        " ".join(f"Page {page} sentence {n}: {LOREM}" for n in range(sentences_per_page))
+        for page in range(1, pages + 1)
+    )
+
+
+def check_overlap(chunks: List[str], chunk_tokens: int) -> None:
+    """
+    Every chunk fits its budget and starts with text the previous chunk ends with.
+    """
+    for idx, chunk in enumerate(chunks):
+        size = count_tokens(chunk)
+        if size > chunk_tokens:
+            raise AssertionError(f"chunk {idx} has {size} tokens, above {chunk_tokens}")
+    for idx, (previous, chunk) in enumerate(zip(chunks, chunks[1:]), start=1):
+        head = chunk.split("\n\n", 1)[0]
+        if head not in previous:
+            raise AssertionError(f"chunk {idx} shares no text with chunk {idx - 1}")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--pages", type=int, nargs="+", default=[20, 200])
+    arg_parser.add_argument("--chunk", type=int, default=3000)
+    arg_parser.add_argument("--overlap", type=int, default=200)
+    args = arg_parser.parse_args()
+
+    for pages in args.pages:
+        text = make_course(pages)
+        started = time.perf_counter()
+        chunks = split_into_chunks(text, args.chunk, args.overlap)
+        elapsed = time.perf_counter() - started
+        check_overlap(chunks, args.chunk)
+        print(
+            f"{pages:>5} pages  {count_tokens(text):>9} tokens  {len(chunks):>4} chunks  "
+            f"{elapsed * 1000:8.1f} ms  overlap ok"
+        )
+
+
+if __name__ == "__main__":
+    main()
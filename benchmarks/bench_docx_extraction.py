@@ -0,0 +1,85 @@
+"""
+Benchmark utils.extract_text_from_docx against the original implementation.
+
+Generates large DOCX files (paragraphs interleaved with tables) with python-docx
+and reports wall time, peak Python memory and how much text each version returns.
+
+Usage: python benchmarks/bench_docx_extraction.py [--paragraphs 5000 20000]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document  # noqa: E402
+
+from utils import extract_text_from_docx  # noqa: E402
+
+SENTENCE = (
+    "An eigenvector of a matrix keeps its direction when the matrix is applied, "
+    "and the eigenvalue is the factor by which it is stretched."
+)
+
+
+def make_docx(paragraphs: int, table_every: int = 50, table_rows: int = 10) -> bytes:
+    """
+    Build a DOCX with the given number of paragraphs and a small table every table_every.
+    """
+    doc = Document()
+    for idx in range(paragraphs):
+        doc.add_paragraph(f"{idx}. {SENTENCE}")
+        if idx % table_every == table_every - 1:
+            table = doc.add_table(rows=table_rows, cols=3)
+            for row_idx, row in enumerate(table.rows):
+                row.cells[0].text = f"Term {idx}-{row_idx}"
+                row.cells[1].text = "Definition kept in a table cell"
+                row.cells[2].text = "Example"
+    out = BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def baseline_extract(file_obj) -> str:
+    """
+    The original implementation: copy the upload into a new BytesIO, read paragraphs only.
+    """
+    data = file_obj.read()
+    doc = Document(BytesIO(data))
+    return "\n".join(p.text for p in doc.paragraphs)
+
+
+def measure(label: str, fn: Callable[[], str]) -> None:
+    """
+    Time fn, then run it again under tracemalloc for peak memory.
+    """
+    started = time.perf_counter()
+    text = fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<12} {elapsed:8.2f} s   peak {peak / 1e6:7.1f} MB   {len(text):>10} chars")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--paragraphs", type=int, nargs="+", default=[5000, 20000])
+    args = arg_parser.parse_args()
+
+    for paragraphs in args.paragraphs:
+        data = make_docx(paragraphs)
+        print(f"\n{paragraphs} paragraphs ({len(data) / 1e6:.1f} MB):")
+        measure("baseline", lambda: baseline_extract(BytesIO(data)))
+        measure("streaming", lambda: extract_text_from_docx(BytesIO(data)))
+
+
+if __name__ == "__main__":
+    main()
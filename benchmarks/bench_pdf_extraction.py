@@ -0,0 +1,125 @@
+"""
+Benchmark utils.extract_text_from_pdf against the original serial implementation.
+
+Generates synthetic text PDFs with a few hundred pages and reports wall time and
+peak Python memory for each extraction mode.
+
+Usage: python benchmarks/bench_pdf_extraction.py [--pages 200 400] [--workers 2 4]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pypdf import PdfReader  # noqa: E402
+
+from utils import extract_text_from_pdf  # noqa: E402
+
+LOREM = (
+    "A limit describes the value a function approaches as its input approaches a point. "
+    "Continuity means the limit equals the value of the function at that point."
+)
+
+
+def make_pdf(pages: int, lines_per_page: int = 45) -> bytes:
+    """
+    Build a minimal PDF with pages full of Helvetica text, without extra dependencies.
+    """
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")  # placeholder, filled in once the page ids are known
+    page_ids = []
+    for page_no in range(pages):
+        lines = [f"Page {page_no + 1} line {n}: {LOREM[: 60 + n % 40]}" for n in range(lines_per_page)]
+        ops = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+        for line in lines:
+            ops.append(f"({line}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        content_id = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        page_ids.append(
+            add(
+                b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+                b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+                % (pages_id, font_id, content_id)
+            )
+        )
+    kids = b" ".join(b"%d 0 R" % pid for pid in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for idx, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (idx, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(
+        b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (len(objects) + 1, catalog_id, xref)
+    )
+    return out.getvalue()
+
+
+def baseline_extract(file_obj) -> str:
+    """
+    The original implementation: read every page serially into a list, then join.
+    """
+    reader = PdfReader(file_obj)
+    pages_text: List[str] = []
+    for page in reader.pages:
+        pages_text.append(page.extract_text() or "")
+    return "\n\n".join(pages_text)
+
+
+def measure(label: str, fn: Callable[[], str]) -> None:
+    """
+    Time fn, then run it again under tracemalloc for peak memory (in this process only).
+    """
+    started = time.perf_counter()
+    text = fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<24} {elapsed:8.2f} s   peak {peak / 1e6:7.1f} MB   {len(text):>10} chars")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--pages", type=int, nargs="+", default=[200, 400])
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    args = arg_parser.parse_args()
+
+    print(f"CPU count: {os.cpu_count()}")
+    for pages in args.pages:
+        data = make_pdf(pages)
+        print(f"\n{pages} pages ({len(data) / 1e6:.1f} MB):")
+        measure("baseline (serial list)", lambda: baseline_extract(BytesIO(data)))
+        measure("in-process", lambda: extract_text_from_pdf(BytesIO(data), max_pages=None))
+        for workers in args.workers:
+            measure(
+                f"process pool x{workers}",
+                lambda: extract_text_from_pdf(BytesIO(data), max_pages=None, workers=workers),
+            )
+
+
+if __name__ == "__main__":
+    main()
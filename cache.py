@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+# Directory holding the on-disk caches; override it to share caches between containers.
+CACHE_DIR = os.getenv(
+    "STUDYMATE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"),
+)
+
+
+class SQLiteCache:
+    """
+    Small disk-backed key/value cache with TTL and LRU eviction.
+
+    Values are stored as JSON (optionally zlib-compressed) in one SQLite file per
+    cache name, so they survive Streamlit reruns and process restarts and can be
+    shared by several worker processes. When the cache grows past max_entries or
+    max_bytes, the least recently read entries are evicted first.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 10_000,
+        max_bytes: int = 256 * 1024 * 1024,
+        default_ttl: Optional[float] = None,
+        compress: bool = False,
+        path: Optional[str] = None,
+    ) -> None:
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.compress = compress
+        self.path = path or os.path.join(CACHE_DIR, f"{name}.sqlite3")
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """
+        Build a fixed-length key from arbitrary JSON-serializable parts.
+        """
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _encode(self, value: Any) -> bytes:
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        return zlib.compress(data) if self.compress else data
+
+    def _decode(self, data: bytes) -> Any:
+        if self.compress:
+            data = zlib.decompress(data)
+        return json.loads(data.decode("utf-8"))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Return the cached value for key, or default if it is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._misses += 1
+                return default
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                self._misses += 1
+                return default
+            self._conn.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self._hits += 1
+        return self._decode(value)
+
+    def contains(self, key: str) -> bool:
+        """
+        Return True if key holds a live entry (does not count as a hit or miss).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None and (row[0] is None or row[0] > time.time())
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store value under key for ttl seconds (default_ttl when not given).
+        Entries without any TTL never expire and only leave through LRU eviction.
+        """
+        if ttl is None:
+            ttl = self.default_ttl
+        data = self._encode(value)
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO entries (key, value, size, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (key, sqlite3.Binary(data), len(data), expires_at, now),
+            )
+            self._evict_locked(now)
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        """
+        Remove key from the cache if present.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """
+        Remove every entry and reset the counters.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._hits = self._misses = self._evictions = 0
+
+    def _evict_locked(self, now: float) -> None:
+        expired = self._conn.execute(
+            "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        ).rowcount
+        self._evictions += max(expired, 0)
+
+        count, size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC"
+        ).fetchall()
+        victims = []
+        for key, entry_size in rows:
+            if count <= self.max_entries and size <= self.max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            size -= entry_size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        self._evictions += len(victims)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return hit/miss counters for this process plus the current size of the cache.
+        """
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+            lookups = self._hits + self._misses
+            return {
+                "name": self.name,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": (self._hits / lookups) if lookups else 0.0,
+                "evictions": self._evictions,
+                "entries": count,
+                "size_bytes": size,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_caches: Dict[str, SQLiteCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str, **kwargs: Any) -> SQLiteCache:
+    """
+    Return the process-wide cache called name, creating it with kwargs on first use.
+    """
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = SQLiteCache(name, **kwargs)
+            _caches[name] = cache
+        return cache
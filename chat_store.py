@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from history_store import DATA_DIR
+
+# SQLite file of the community chat, shared by every session and worker process.
+CHAT_DB = os.getenv("STUDYMATE_CHAT_DB", os.path.join(DATA_DIR, "chat.sqlite3"))
+# Most recent messages of each channel kept in memory.
+CHAT_RECENT_MESSAGES = int(os.getenv("STUDYMATE_CHAT_RECENT_MESSAGES", "500"))
+# Messages loaded per page of the chat.
+CHAT_PAGE_SIZE = int(os.getenv("STUDYMATE_CHAT_PAGE_SIZE", "50"))
+# Seconds between checks for new messages on the Community page.
+CHAT_REFRESH_SECONDS = float(os.getenv("STUDYMATE_CHAT_REFRESH_SECONDS", "3"))
+# Longest message accepted, in characters.
+CHAT_MAX_MESSAGE_LENGTH = 2000
+# Channel of the Community page and the bot message it starts with.
+CHAT_CHANNEL = "general"
+CHAT_BOT_USER = "StudyMate Bot"
+CHAT_WELCOME_MESSAGE = (
+    "Welcome to the StudyMate Community! Share your learning journey, ask questions, and help others."
+)
+
+Message = Dict[str, Any]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    user TEXT NOT NULL,
+    message TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    is_bot INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_messages_channel_id ON messages(channel, id);
+"""
+
+
+def _row_to_message(row: sqlite3.Row) -> Message:
+    return {
+        "id": row["id"],
+        "user": row["user"],
+        "message": row["message"],
+        "created_at": row["created_at"],
+        "is_bot": bool(row["is_bot"]),
+    }
+
+
+class ChatStore:
+    """
+    Shared chat messages, in SQLite (WAL) with an in-memory tail per channel.
+
+    Message ids only grow, so they double as cursors: since() returns the messages
+    after the last id a client has seen and before() pages back through older ones.
+    The newest CHAT_RECENT_MESSAGES of each channel are kept in a ring buffer that
+    answers most reads; before answering, it is topped up with whatever other
+    processes have written since, which is a single index seek. An empty
+    CHAT_CHANNEL is seeded with the welcome message when the store opens.
+    """
+
+    def __init__(self, path: Optional[str] = None, recent: int = CHAT_RECENT_MESSAGES) -> None:
+        self.path = path or CHAT_DB
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.recent = recent
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        # Check and insert in one write transaction, so concurrent first visitors or
+        # worker processes seed the welcome message once.
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "INSERT INTO messages (channel, user, message, created_at, is_bot)"
+                " SELECT ?, ?, ?, ?, 1 WHERE NOT EXISTS (SELECT 1 FROM messages WHERE channel = ?)",
+                (CHAT_CHANNEL, CHAT_BOT_USER, CHAT_WELCOME_MESSAGE, time.time(), CHAT_CHANNEL),
+            )
+        self._buffers: Dict[str, Deque[Message]] = {}
+
+    def _buffer_locked(self, channel: str) -> Deque[Message]:
+        """
+        The ring buffer of channel, loaded on first use and synced with the database.
+        """
+        buffer = self._buffers.get(channel)
+        if buffer is None:
+            rows = self._conn.execute(
+                "SELECT * FROM messages WHERE channel = ? ORDER BY id DESC LIMIT ?",
+                (channel, self.recent),
+            ).fetchall()
+            buffer = self._buffers[channel] = deque(
+                (_row_to_message(row) for row in reversed(rows)), maxlen=self.recent
+            )
+            return buffer
+        last_id = buffer[-1]["id"] if buffer else 0
+        rows = self._conn.execute(
+            "SELECT * FROM messages WHERE channel = ? AND id > ? ORDER BY id LIMIT ?",
+            (channel, last_id, self.recent),
+        ).fetchall()
+        if len(rows) == self.recent:
+            # Too far behind to top up: reload the tail.
+            del self._buffers[channel]
+            return self._buffer_locked(channel)
+        buffer.extend(_row_to_message(row) for row in rows)
+        return buffer
+
+    def post(self, channel: str, user: str, message: str, is_bot: bool = False) -> Message:
+        """
+        Store a message and return it with its id.
+        """
+        message = message.strip()[:CHAT_MAX_MESSAGE_LENGTH]
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                cur = self._conn.execute(
+                    "INSERT INTO messages (channel, user, message, created_at, is_bot) VALUES (?, ?, ?, ?, ?)",
+                    (channel, user, message, now, int(is_bot)),
+                )
+            self._buffer_locked(channel)
+            return {
+                "id": int(cur.lastrowid),
+                "user": user,
+                "message": message,
+                "created_at": now,
+                "is_bot": is_bot,
+            }
+
+    def since(self, channel: str, after_id: int = 0, limit: int = CHAT_PAGE_SIZE) -> List[Message]:
+        """
+        Up to limit messages newer than after_id, oldest first.
+
+        When more than limit are waiting, the newest ones are returned: a client
+        that fell far behind skips ahead and can page back with before().
+        """
+        with self._lock:
+            buffer = self._buffer_locked(channel)
+            if not buffer or buffer[-1]["id"] <= after_id:
+                return []
+            newer = [m for m in _tail(buffer, limit) if m["id"] > after_id]
+            if len(newer) == limit or buffer[0]["id"] <= after_id or len(buffer) < self.recent:
+                return newer
+            rows = self._conn.execute(
+                "SELECT * FROM messages WHERE channel = ? AND id > ? ORDER BY id DESC LIMIT ?",
+                (channel, after_id, limit),
+            ).fetchall()
+        return [_row_to_message(row) for row in reversed(rows)]
+
+    def before(self, channel: str, before_id: Optional[int] = None, limit: int = CHAT_PAGE_SIZE) -> List[Message]:
+        """
+        Up to limit messages older than before_id (the latest ones when None), oldest first.
+        """
+        with self._lock:
+            buffer = self._buffer_locked(channel)
+            if buffer and (before_id is None or before_id > buffer[0]["id"]):
+                older = [m for m in buffer if before_id is None or m["id"] < before_id]
+                if len(older) >= limit or len(buffer) < self.recent:
+                    # The buffer holds the whole page (or the whole channel).
+                    return older[-limit:]
+            rows = self._conn.execute(
+                "SELECT * FROM messages WHERE channel = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (channel, before_id if before_id is not None else 2 ** 63 - 1, limit),
+            ).fetchall()
+        return [_row_to_message(row) for row in reversed(rows)]
+
+    def latest_id(self, channel: str) -> int:
+        """
+        Id of the newest message of channel, 0 when it has none.
+        """
+        with self._lock:
+            buffer = self._buffer_locked(channel)
+            return buffer[-1]["id"] if buffer else 0
+
+    def count_since(self, channel: str, since: float) -> int:
+        """
+        Number of messages posted to channel since the given epoch time.
+        """
+        with self._lock:
+            buffer = self._buffer_locked(channel)
+            if buffer and (buffer[0]["created_at"] < since or len(buffer) < self.recent):
+                return sum(1 for m in buffer if m["created_at"] >= since)
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE channel = ? AND created_at >= ?", (channel, since)
+            ).fetchone()[0]
+
+
+def _tail(buffer: Deque[Message], limit: int) -> List[Message]:
+    start = max(0, len(buffer) - limit)
+    return [buffer[i] for i in range(start, len(buffer))]
+
+
+_store: Optional[ChatStore] = None
+_store_lock = threading.Lock()
+
+
+def get_chat_store() -> ChatStore:
+    """
+    Return the process-wide chat store, creating it on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChatStore()
+        return _store
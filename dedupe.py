@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import random
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a click came from and never change the page.
+TRACKING_PARAMS = frozenset(
+    """
+    fbclid gclid dclid msclkid mc_cid mc_eid igshid yclid ref ref_src ref_url
+    source si feature spm _hsenc _hsmi
+    """.split()
+)
+_TRACKING_PREFIXES = ("utm_",)
+_HOST_PREFIXES = ("www.", "m.", "mobile.")
+# GitHub pages that show the same README as the repository root.
+_GITHUB_README_RE = re.compile(r"^(/[^/]+/[^/]+)(?:/(?:blob|tree)/[^/]+(?:/readme(?:\.\w+)?)?)?/?$", re.I)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Word shingle size and MinHash signature length used for near-duplicate snippets.
+SHINGLE_SIZE = 3
+MINHASH_PERMUTATIONS = 64
+# Snippets whose estimated Jaccard similarity reaches this are treated as duplicates.
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1337)
+_PERMUTATIONS: List[Tuple[int, int]] = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Reduce a URL to a canonical form so the same page found twice compares equal.
+
+    The scheme is dropped, the host lowercased without "www."/"m." and default
+    ports, tracking parameters, fragments and trailing slashes removed, remaining
+    parameters sorted, and YouTube and GitHub README aliases folded together.
+    """
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    for prefix in _HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    params = [
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(_TRACKING_PREFIXES)
+    ]
+
+    if host == "youtu.be" and path.strip("/"):
+        host, path = "youtube.com", "/watch"
+        params = [("v", parts.path.strip("/"))]
+    elif host == "youtube.com":
+        shorts = re.match(r"^/(?:shorts|embed|live)/([^/]+)", path)
+        if shorts:
+            path, params = "/watch", [("v", shorts.group(1))]
+        elif path == "/watch":
+            # Playlist position and start time point at the same video.
+            params = [(key, value) for key, value in params if key == "v"]
+    elif host == "github.com":
+        readme = _GITHUB_README_RE.match(path)
+        if readme:
+            path = readme.group(1)
+        path = path.lower()
+
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = urlencode(sorted(params))
+    return urlunsplit(("", host, path, query, "")).lstrip("/")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    """
+    Set of lowercase word n-grams of text (the whole text when it is shorter).
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash_signature(items: Iterable[str]) -> Tuple[int, ...]:
+    """
+    MinHash signature of a set of strings; equal positions estimate Jaccard similarity.
+    """
+    hashes = [zlib.crc32(item.encode("utf-8")) for item in items]
+    if not hashes:
+        return ()
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS
+    )
+
+
+def estimated_similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """
+    Share of matching MinHash positions, an estimate of the Jaccard similarity.
+    """
+    if not sig_a or not sig_b:
+        return 0.0
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class ResultDeduper:
+    """
+    Remembers the search results seen so far and rejects repeats.
+
+    A result repeats an earlier one when their canonical URLs are equal or when
+    their title and snippet are near-duplicates (MinHash over word shingles), which
+    catches mirrors and syndicated copies of the same page. Snippets shorter than
+    min_words words are only compared by URL, and results without a link (such as
+    search errors) are always kept. One deduper can be shared by several
+    agents, also across threads, so a link shown by one of them is not repeated
+    by the next.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD, min_words: int = 8) -> None:
+        self.threshold = threshold
+        self.min_words = min_words
+        self._urls: Set[str] = set()
+        self._signatures: List[Tuple[int, ...]] = []
+        self._lock = threading.Lock()
+
+    def _fingerprint(self, result: Dict[str, str]) -> Tuple[str, Tuple[int, ...]]:
+        url = canonicalize_url(result.get("href") or result.get("url") or "")
+        text = " ".join(result.get(key) or "" for key in ("title", "body", "description"))
+        if not url or len(_WORD_RE.findall(text)) < self.min_words:
+            return url, ()
+        return url, minhash_signature(shingles(text))
+
+    def _seen(self, url: str, signature: Tuple[int, ...]) -> bool:
+        if not url:
+            return False
+        if url in self._urls:
+            return True
+        return bool(signature) and any(
+            estimated_similarity(signature, seen) >= self.threshold for seen in self._signatures
+        )
+
+    def is_duplicate(self, result: Dict[str, str]) -> bool:
+        """
+        Return True if result repeats a result already added.
+        """
+        url, signature = self._fingerprint(result)
+        with self._lock:
+            return self._seen(url, signature)
+
+    def add(self, result: Dict[str, str]) -> bool:
+        """
+        Record result and return True, or return False if it is a duplicate.
+        """
+        url, signature = self._fingerprint(result)
+        with self._lock:
+            if self._seen(url, signature):
+                return False
+            if url:
+                self._urls.add(url)
+            if signature:
+                self._signatures.append(signature)
+            return True
+
+    def filter(self, results: Iterable[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Keep the first occurrence of every result, in order, and record them.
+        """
+        return [result for result in results if self.add(result)]
+
+
+def dedupe_results(
+    results: Iterable[Dict[str, str]],
+    deduper: Optional[ResultDeduper] = None,
+) -> List[Dict[str, str]]:
+    """
+    Drop repeated results, optionally against those already seen by deduper.
+    """
+    return (deduper or ResultDeduper()).filter(results)
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Directory holding the app's durable data (study history, community chat, packs).
+DATA_DIR = os.getenv(
+    "STUDYMATE_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"),
+)
+# SQLite file of the study history.
+HISTORY_DB = os.getenv("STUDYMATE_HISTORY_DB", os.path.join(DATA_DIR, "history.sqlite3"))
+# Sessions shown per page on the History page.
+HISTORY_PAGE_SIZE = int(os.getenv("STUDYMATE_HISTORY_PAGE_SIZE", "50"))
+# Key prefix of anonymous students (see identity.py), and the days their history is
+# kept after their last session.
+ANONYMOUS_PREFIX = "anon:"
+ANONYMOUS_HISTORY_DAYS = float(os.getenv("STUDYMATE_ANONYMOUS_HISTORY_DAYS", "90"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    chapter TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    help_types TEXT NOT NULL,
+    resources INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_user_time ON sessions(user, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_sessions_user_subject ON sessions(user, subject, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_sessions_user_engine ON sessions(user, engine, created_at DESC);
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    user TEXT PRIMARY KEY,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    resources INTEGER NOT NULL DEFAULT 0,
+    subjects INTEGER NOT NULL DEFAULT 0,
+    engines INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS user_subjects (
+    user TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user, subject)
+);
+CREATE TABLE IF NOT EXISTS user_engines (
+    user TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user, engine)
+);
+"""
+
+
+class HistoryStore:
+    """
+    Durable study history of every user, in one SQLite file.
+
+    Sessions are indexed by user and time, subject and engine, so a page of them
+    is read straight off an index. The counters shown on the History page (total
+    sessions and resources, distinct subjects and engines) are kept up to date in
+    the same transaction as each insert, so reading them never scans the history.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path or HISTORY_DB
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def add(
+        self,
+        user: str,
+        subject: str,
+        chapter: str,
+        engine: str,
+        help_types: Iterable[str],
+        timestamp: Optional[str] = None,
+    ) -> int:
+        """
+        Record one study session and return its id.
+
+        timestamp ("%Y-%m-%d %H:%M:%S", local time) defaults to now; when given, the
+        session is ordered by it, e.g. for entries imported from an older session.
+        """
+        help_types = list(help_types)
+        now = time.time()
+        if timestamp:
+            try:
+                now = time.mktime(time.strptime(timestamp, "%Y-%m-%d %H:%M:%S"))
+            except ValueError:
+                pass
+        else:
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO sessions (user, created_at, timestamp, subject, chapter, engine, help_types, resources)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (user, now, timestamp, subject, chapter, engine, json.dumps(help_types), len(help_types)),
+            )
+            new_subject = self._bump(user, "user_subjects", "subject", subject)
+            new_engine = self._bump(user, "user_engines", "engine", engine)
+            self._conn.execute("INSERT OR IGNORE INTO user_stats (user) VALUES (?)", (user,))
+            self._conn.execute(
+                "UPDATE user_stats SET sessions = sessions + 1, resources = resources + ?,"
+                " subjects = subjects + ?, engines = engines + ? WHERE user = ?",
+                (len(help_types), int(new_subject), int(new_engine), user),
+            )
+            return int(cur.lastrowid)
+
+    def _bump(self, user: str, table: str, column: str, value: str) -> bool:
+        # Returns True when value is new for user.
+        cur = self._conn.execute(
+            f"INSERT OR IGNORE INTO {table} (user, {column}, sessions) VALUES (?, ?, 1)",
+            (user, value),
+        )
+        if cur.rowcount:
+            return True
+        self._conn.execute(
+            f"UPDATE {table} SET sessions = sessions + 1 WHERE user = ? AND {column} = ?",
+            (user, value),
+        )
+        return False
+
+    def _where(self, user: str, subject: Optional[str], engine: Optional[str]) -> Tuple[str, List[Any]]:
+        clauses: List[str] = ["user = ?"]
+        params: List[Any] = [user]
+        if subject:
+            clauses.append("subject = ?")
+            params.append(subject)
+        if engine:
+            clauses.append("engine = ?")
+            params.append(engine)
+        return " AND ".join(clauses), params
+
+    def sessions(
+        self,
+        user: str,
+        limit: int = HISTORY_PAGE_SIZE,
+        offset: int = 0,
+        subject: Optional[str] = None,
+        engine: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        One page of the sessions of user, newest first, optionally for one subject
+        or engine.
+        """
+        where, params = self._where(user, subject, engine)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, timestamp, subject, chapter, engine, help_types FROM sessions"
+                f" WHERE {where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [
+            {
+                "id": row["id"],
+                "timestamp": row["timestamp"],
+                "subject": row["subject"],
+                "chapter": row["chapter"],
+                "engine": row["engine"],
+                "help_types": json.loads(row["help_types"]),
+            }
+            for row in rows
+        ]
+
+    def count(self, user: str, subject: Optional[str] = None, engine: Optional[str] = None) -> int:
+        """
+        Number of sessions of user, optionally for one subject or engine.
+        """
+        if subject and engine:
+            where, params = self._where(user, subject, engine)
+            with self._lock:
+                return self._conn.execute(f"SELECT COUNT(*) FROM sessions WHERE {where}", params).fetchone()[0]
+        if subject or engine:
+            if subject:
+                table, column, value = "user_subjects", "subject", subject
+            else:
+                table, column, value = "user_engines", "engine", engine
+            with self._lock:
+                row = self._conn.execute(
+                    f"SELECT sessions FROM {table} WHERE user = ? AND {column} = ?", (user, value)
+                ).fetchone()
+            return row[0] if row else 0
+        return self.stats(user)["sessions"]
+
+    def stats(self, user: str) -> Dict[str, int]:
+        """
+        Pre-aggregated counters of user: sessions, resources, subjects and engines.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sessions, resources, subjects, engines FROM user_stats WHERE user = ?", (user,)
+            ).fetchone()
+        if row is None:
+            return {"sessions": 0, "resources": 0, "subjects": 0, "engines": 0}
+        return dict(row)
+
+    def subjects(self, user: str) -> List[str]:
+        """
+        Distinct subjects of user, most studied first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT subject FROM user_subjects WHERE user = ? ORDER BY sessions DESC, subject", (user,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def engines(self, user: str) -> List[str]:
+        """
+        Distinct engines of user, most used first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT engine FROM user_engines WHERE user = ? ORDER BY sessions DESC, engine", (user,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def clear(self, user: str) -> None:
+        """
+        Delete the whole history of user.
+        """
+        with self._lock, self._conn:
+            self._delete_user(user)
+
+    def _delete_user(self, user: str) -> None:
+        for table in ("sessions", "user_stats", "user_subjects", "user_engines"):
+            self._conn.execute(f"DELETE FROM {table} WHERE user = ?", (user,))
+
+    def prune(self, prefix: str, older_than: float) -> int:
+        """
+        Delete the history of every user whose key starts with prefix and whose last
+        session is older than older_than (epoch seconds); return how many users.
+        """
+        with self._lock, self._conn:
+            users = [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT user FROM user_stats WHERE substr(user, 1, ?) = ?"
+                    " AND NOT EXISTS (SELECT 1 FROM sessions"
+                    " WHERE sessions.user = user_stats.user AND created_at >= ?)",
+                    (len(prefix), prefix, older_than),
+                ).fetchall()
+            ]
+            for user in users:
+                self._delete_user(user)
+        return len(users)
+
+
+_store: Optional[HistoryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    """
+    Return the process-wide history store, creating it on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+            if ANONYMOUS_HISTORY_DAYS > 0:
+                _store.prune(ANONYMOUS_PREFIX, time.time() - ANONYMOUS_HISTORY_DAYS * 24 * 3600)
+        return _store
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import secrets
+from typing import Optional
+
+import streamlit as st
+
+from history_store import ANONYMOUS_PREFIX
+from ratelimit import current_session
+
+# Keys that do not identify one student: the former community default and the
+# session key used outside Streamlit. Per-student data is never cleared for them.
+SHARED_IDENTITIES = frozenset({"", "Student", "default"})
+# Query parameter holding an anonymous student's token, and its accepted format.
+STUDENT_TOKEN_PARAM = "student"
+_TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+
+def _login() -> Optional[dict]:
+    # The signed-in user (st.user, Streamlit >= 1.42 with authentication configured).
+    user = getattr(st, "user", None)
+    try:
+        if user is not None and user.get("is_logged_in") and user.get("email"):
+            return dict(user)
+    except Exception:
+        return None
+    return None
+
+
+def current_student() -> str:
+    """
+    Stable key of the student using this session, for the stores shared by every session.
+
+    A signed-in user is keyed by email, so their data follows them across devices.
+    An anonymous student gets a random token kept in the page URL (?student=...),
+    so refreshing or bookmarking the page keeps their history; whoever has the
+    link shares it, and history_store prunes tokens left unused for
+    ANONYMOUS_HISTORY_DAYS. Outside a Streamlit session the key is "default".
+    """
+    if "student_id" not in st.session_state:
+        login = _login()
+        if login:
+            student = f"user:{login['email'].lower()}"
+        elif current_session() == "default":
+            return "default"
+        else:
+            token = st.query_params.get(STUDENT_TOKEN_PARAM, "")
+            if not _TOKEN_RE.match(token):
+                token = st.query_params[STUDENT_TOKEN_PARAM] = secrets.token_urlsafe(16)
+            student = f"{ANONYMOUS_PREFIX}{token}"
+        st.session_state.student_id = student
+    return st.session_state.student_id
+
+
+def is_signed_in() -> bool:
+    return current_student().startswith("user:")
+
+
+def is_shared_identity(student: str) -> bool:
+    """
+    True when student may be shared by several people, e.g. outside a Streamlit session.
+    """
+    return student in SHARED_IDENTITIES
+
+
+# Longest display name accepted on the Community page, in characters.
+DISPLAY_NAME_MAX_LENGTH = 40
+
+
+def default_display_name() -> str:
+    """
+    The signed-in user's name, else "Student" and a short tag of current_student(),
+    so that authors in the shared chat can be told apart.
+    """
+    login = _login()
+    if login and login.get("name"):
+        return str(login["name"])[:DISPLAY_NAME_MAX_LENGTH]
+    tag = hashlib.sha1(current_student().encode("utf-8")).hexdigest()[:4]
+    return f"Student {tag}"
+
+
+def display_name() -> str:
+    """
+    Name shown next to the student's chat messages, as set on the Community page.
+    """
+    name = " ".join(str(st.session_state.get("display_name") or "").split())
+    return name[:DISPLAY_NAME_MAX_LENGTH] or default_display_name()
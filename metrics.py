@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import atexit
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# File rewritten with the Prometheus text export (empty to disable) and the minimum
+# number of seconds between two rewrites.
+METRICS_FILE = os.getenv("STUDYMATE_METRICS_FILE", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("STUDYMATE_METRICS_FLUSH_INTERVAL", "5"))
+# Port of the /metrics HTTP endpoint started by start_metrics_server() (0 = off).
+METRICS_PORT = int(os.getenv("STUDYMATE_METRICS_PORT", "0"))
+
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    def __init__(self) -> None:
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        for idx, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.buckets[idx] += 1
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and latency histograms, exportable in Prometheus text format.
+
+    Metric names and help texts are declared on first use; labels are plain
+    keyword arguments. Everything lives in memory for the life of the process.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+
+    @staticmethod
+    def _labels(labels: Dict[str, Any]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, help_text: str, amount: float = 1.0, **labels: Any) -> None:
+        """
+        Add amount to the counter name{labels}.
+        """
+        with self._lock:
+            self._help.setdefault(name, ("counter", help_text))
+            series = self._counters.setdefault(name, {})
+            key = self._labels(labels)
+            series[key] = series.get(key, 0.0) + amount
+
+    def observe(self, name: str, help_text: str, value: float, **labels: Any) -> None:
+        """
+        Record value in the latency histogram name{labels}.
+        """
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help_text))
+            series = self._histograms.setdefault(name, {})
+            key = self._labels(labels)
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram()
+            histogram.observe(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return every series as plain data: counters by labels, histograms as count/sum.
+        """
+        with self._lock:
+            data: Dict[str, Any] = {}
+            for name, series in self._counters.items():
+                data[name] = [{"labels": dict(key), "value": value} for key, value in series.items()]
+            for name, series in self._histograms.items():
+                data[name] = [
+                    {"labels": dict(key), "count": h.count, "sum": h.total}
+                    for key, h in series.items()
+                ]
+            return data
+
+    def reset(self) -> None:
+        """
+        Drop every recorded value.
+        """
+        with self._lock:
+            self._help.clear()
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_prometheus(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+        """
+
+        def fmt(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+            items = list(labels) + ([extra] if extra else [])
+            if not items:
+                return ""
+            escaped = (
+                key + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+                for key, value in items
+            )
+            return "{" + ",".join(escaped) + "}"
+
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._help):
+                kind, help_text = self._help[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for labels, value in sorted(self._counters.get(name, {}).items()):
+                        lines.append(f"{name}{fmt(labels)} {value:g}")
+                    continue
+                for labels, h in sorted(self._histograms.get(name, {}).items()):
+                    for bound, count in zip(LATENCY_BUCKETS, h.buckets):
+                        lines.append(f"{name}_bucket{fmt(labels, ('le', f'{bound:g}'))} {count}")
+                    lines.append(f"{name}_bucket{fmt(labels, ('le', '+Inf'))} {h.count}")
+                    lines.append(f"{name}_sum{fmt(labels)} {h.total:.6f}")
+                    lines.append(f"{name}_count{fmt(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+
+def write_prometheus(path: str) -> None:
+    """
+    Atomically write the Prometheus text export to path (e.g. for node_exporter's
+    textfile collector).
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        fh.write(registry.to_prometheus())
+    os.replace(tmp_path, path)
+
+
+def _maybe_flush() -> None:
+    global _last_flush
+    if not METRICS_FILE:
+        return
+    now = time.monotonic()
+    with _flush_lock:
+        if now - _last_flush < METRICS_FLUSH_INTERVAL:
+            return
+        _last_flush = now
+    try:
+        write_prometheus(METRICS_FILE)
+    except OSError as exc:
+        logger.warning("Could not write metrics to %s: %s", METRICS_FILE, exc)
+
+
+@atexit.register
+def _flush_on_exit() -> None:
+    if METRICS_FILE:
+        try:
+            write_prometheus(METRICS_FILE)
+        except OSError:
+            pass
+
+
+def _log_event(event: Dict[str, Any]) -> None:
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(event, ensure_ascii=False, sort_keys=True))
+
+
+def is_error_output(output: Any) -> bool:
+    """
+    True for the "[AgentName ERROR] ..." strings agents return instead of raising,
+    and for structured outputs (e.g. A7 quiz dicts) carrying an "error" entry.
+    """
+    if isinstance(output, dict):
+        return bool(output.get("error"))
+    if not isinstance(output, str):
+        return False
+    output = output.lstrip()
+    return output.startswith("[") and " ERROR]" in output[:80]
+
+
+def record_stage(stage: str, seconds: float, status: str) -> None:
+    """
+    Record one agent call: wall time and outcome ("ok" or "error").
+    """
+    registry.observe("studymate_stage_seconds", "Wall time of agent calls.", seconds, stage=stage)
+    registry.inc("studymate_stage_calls_total", "Agent calls by outcome.", stage=stage, status=status)
+    _log_event({"event": "stage", "stage": stage, "seconds": round(seconds, 4), "status": status})
+    _maybe_flush()
+
+
+def record_llm_call(
+    agent: str,
+    engine: str,
+    seconds: float,
+    status: str,
+    tokens_in: int = 0,
+    tokens_out: int = 0,
+) -> None:
+    """
+    Record one chain call: latency, outcome ("ok", "cached" or "error") and tokens.
+    """
+    registry.observe(
+        "studymate_llm_seconds", "Latency of LLM chain calls.", seconds, agent=agent, engine=engine
+    )
+    registry.inc(
+        "studymate_llm_calls_total",
+        "LLM chain calls by outcome (cached = served from the LLM cache).",
+        agent=agent,
+        engine=engine,
+        status=status,
+    )
+    if tokens_in:
+        registry.inc(
+            "studymate_llm_tokens_total", "Estimated prompt and answer tokens.", tokens_in,
+            agent=agent, engine=engine, direction="in",
+        )
+    if tokens_out:
+        registry.inc(
+            "studymate_llm_tokens_total", "Estimated prompt and answer tokens.", tokens_out,
+            agent=agent, engine=engine, direction="out",
+        )
+    _log_event(
+        {
+            "event": "llm_call",
+            "agent": agent,
+            "engine": engine,
+            "seconds": round(seconds, 4),
+            "status": status,
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+        }
+    )
+    _maybe_flush()
+
+
+def _timed_iterator(stage: str, iterator: Iterator[Any]) -> Iterator[Any]:
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        for item in iterator:
+            if is_error_output(item):
+                status = "error"
+            yield item
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - started, status)
+
+
+def instrument(stage: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Decorator recording the wall time and outcome of every call of an agent function.
+
+    Works on plain, async and streaming agents (for generators the time runs until
+    the stream is exhausted). A call fails when it raises or returns an
+    "[AgentName ERROR] ..." string.
+    """
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                started = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except BaseException:
+                    record_stage(stage, time.perf_counter() - started, "error")
+                    raise
+                status = "error" if is_error_output(result) else "ok"
+                record_stage(stage, time.perf_counter() - started, status)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if inspect.isgeneratorfunction(func):
+                return _timed_iterator(stage, func(*args, **kwargs))
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                record_stage(stage, time.perf_counter() - started, "error")
+                raise
+            if inspect.isgenerator(result):
+                return _timed_iterator(stage, result)
+            status = "error" if is_error_output(result) else "ok"
+            record_stage(stage, time.perf_counter() - started, status)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.to_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        return
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """
+    Serve GET /metrics on port from a daemon thread; safe to call on every rerun.
+    Returns None when port is 0.
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as exc:
+                logger.warning("Could not serve metrics on port %d: %s", port, exc)
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
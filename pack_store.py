@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import os
+import threading
+from concurrent.futures import CancelledError, Future, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from cache import SQLiteCache, get_cache
+from metrics import is_error_output
+
+# Days a complete study pack is served to later sessions.
+PACK_CACHE_TTL = float(os.getenv("STUDYMATE_PACK_TTL_DAYS", "7")) * 24 * 3600
+# Seconds a request waits for an identical one already in flight before building its own pack.
+PACK_WAIT_TIMEOUT = float(os.getenv("STUDYMATE_PACK_WAIT_TIMEOUT", "600"))
+
+Pack = Dict[str, Any]
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def pack_key(subject: str, chapter: str, engine: str, targets: Iterable[str], **options: Any) -> str:
+    """
+    Key of a study pack: the same request from any session maps to the same key.
+
+    Subject and chapter are compared case- and whitespace-insensitively; options
+    holds everything else that changes the pack (guide mode, uploaded file, ...).
+    """
+    return SQLiteCache.make_key(
+        "pack", _normalize(subject), _normalize(chapter), engine, sorted(set(targets)), options
+    )
+
+
+def is_complete(pack: Pack) -> bool:
+    """
+    True when no agent of pack failed, i.e. it is worth serving to other sessions.
+    """
+    return not pack.get("errors") and not any(
+        is_error_output(output) for output in pack.get("outputs", {}).values()
+    )
+
+
+class PackStore:
+    """
+    Study packs shared by every session of the process.
+
+    get_or_build() returns a stored pack when an identical request completed
+    before; when one is being generated right now, the request waits for it
+    (single flight) instead of starting the same agents again. Only complete
+    packs are stored, in the "packs" SQLite cache, so they also survive restarts
+    and are shared with other processes using the same cache directory. Waiting
+    is per process: two processes may still build the same pack once each.
+    """
+
+    def __init__(self, cache: Optional[SQLiteCache] = None) -> None:
+        self._cache = cache or get_cache("packs", default_ttl=PACK_CACHE_TTL, compress=True)
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, "Future[Pack]"] = {}
+        self._served = {"stored": 0, "shared": 0, "built": 0}
+
+    def _count(self, source: str) -> None:
+        with self._lock:
+            self._served[source] += 1
+
+    def get(self, key: str) -> Optional[Pack]:
+        return self._cache.get(key)
+
+    def put(self, key: str, pack: Pack) -> None:
+        if is_complete(pack):
+            self._cache.set(key, pack)
+
+    def _claim(self, key: str) -> Tuple["Future[Pack]", bool]:
+        # Returns the in-flight future of key and whether this caller must build it.
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _release(self, key: str, future: "Future[Pack]") -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def get_or_build(self, key: str, build: Callable[[], Pack]) -> Tuple[Pack, str]:
+        """
+        Return (pack, source) where source is "stored", "shared" or "built".
+        """
+        pack = self.get(key)
+        if pack is not None:
+            self._count("stored")
+            return pack, "stored"
+
+        future, leader = self._claim(key)
+        if not leader:
+            try:
+                pack = future.result(timeout=PACK_WAIT_TIMEOUT)
+            except (FutureTimeoutError, CancelledError):
+                # Too slow, or the first request was abandoned: build it here.
+                pack = build()
+                self._count("built")
+                return pack, "built"
+            self._count("shared")
+            return copy.deepcopy(pack), "shared"
+
+        try:
+            # An identical request may have finished between the lookup and the claim.
+            pack = self.get(key)
+            source = "stored"
+            if pack is None:
+                pack = build()
+                source = "built"
+                self.put(key, pack)
+            future.set_result(pack)
+        except Exception as exc:
+            future.set_exception(exc)
+            raise
+        except BaseException:
+            # Interrupted (e.g. cancelled): let the waiting requests build it themselves.
+            future.cancel()
+            raise
+        finally:
+            self._release(key, future)
+        self._count(source)
+        return copy.deepcopy(pack), source
+
+    async def aget_or_build(self, key: str, build: Callable[[], Awaitable[Pack]]) -> Tuple[Pack, str]:
+        """
+        Async get_or_build(); waiting requests do not block their event loop.
+        """
+        pack = await asyncio.to_thread(self.get, key)
+        if pack is not None:
+            self._count("stored")
+            return pack, "stored"
+
+        future, leader = self._claim(key)
+        if not leader:
+            try:
+                # shield() so that giving up does not cancel the other request's build.
+                pack = await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(future)), PACK_WAIT_TIMEOUT
+                )
+            except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+                if isinstance(exc, asyncio.CancelledError) and not future.cancelled():
+                    # This request itself was cancelled, not the one it waited for.
+                    raise
+                pack = await build()
+                self._count("built")
+                return pack, "built"
+            self._count("shared")
+            return copy.deepcopy(pack), "shared"
+
+        try:
+            pack = await asyncio.to_thread(self.get, key)
+            source = "stored"
+            if pack is None:
+                pack = await build()
+                source = "built"
+                await asyncio.to_thread(self.put, key, pack)
+            future.set_result(pack)
+        except Exception as exc:
+            future.set_exception(exc)
+            raise
+        except BaseException:
+            # Interrupted (e.g. cancelled): let the waiting requests build it themselves.
+            future.cancel()
+            raise
+        finally:
+            self._release(key, future)
+        self._count(source)
+        return copy.deepcopy(pack), source
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Packs served from the store, shared with an identical request, or built, and
+        how many are being built right now.
+        """
+        with self._lock:
+            return dict(self._served, in_flight=len(self._inflight))
+
+
+_store: Optional[PackStore] = None
+_store_lock = threading.Lock()
+
+
+def get_pack_store() -> PackStore:
+    """
+    Return the process-wide pack store, creating it on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PackStore()
+        return _store
@@ -1,22 +1,62 @@
 ﻿from __future__ import annotations
 
+import html
 import streamlit as st
 from datetime import datetime
 
+from chat_store import CHAT_CHANNEL as CHANNEL, CHAT_PAGE_SIZE, CHAT_REFRESH_SECONDS, get_chat_store
+from identity import DISPLAY_NAME_MAX_LENGTH, default_display_name, display_name
+
 
 def init_community_state():
     """Initialize community chat state."""
+    store = get_chat_store()
     if "chat_messages" not in st.session_state:
-        st.session_state.chat_messages = [
-            {
-                "user": "StudyMate Bot",
-                "message": "Welcome to the StudyMate Community! Share your learning journey, ask questions, and help others.",
-                "timestamp": datetime.now().strftime("%H:%M"),
-                "is_bot": True
-            }
-        ]
-    if "current_user" not in st.session_state:
-        st.session_state.current_user = "Student"
+        # Only the latest page is loaded; newer messages are fetched incrementally.
+        st.session_state.chat_messages = store.before(CHANNEL, limit=CHAT_PAGE_SIZE)
+        st.session_state.chat_window = CHAT_PAGE_SIZE
+    if "display_name" not in st.session_state:
+        st.session_state.display_name = default_display_name()
+
+
+def render_message(msg) -> str:
+    """HTML of one chat message; user text is escaped since the chat is shared."""
+    if msg.get("is_bot", False):
+        icon, color = "🤖", "#10b981"
+    else:
+        icon, color = "👤", "#3b82f6"
+    timestamp = datetime.fromtimestamp(msg["created_at"]).strftime("%H:%M")
+    return f"""
+        <div style='background: linear-gradient(135deg, #1e293b 0%, #0f172a 100%);
+                    padding: 1rem; border-radius: 12px; margin-bottom: 1rem;
+                    border-left: 4px solid {color};'>
+            <div style='display: flex; justify-content: space-between; align-items: center; margin-bottom: 0.5rem;'>
+                <strong style='color: {color};'>{icon} {html.escape(msg['user'])}</strong>
+                <span style='color: #64748b; font-size: 0.85rem;'>{timestamp}</span>
+            </div>
+            <p style='color: #94a3b8; margin: 0;'>{html.escape(msg['message'])}</p>
+        </div>
+    """
+
+
+@st.fragment(run_every=CHAT_REFRESH_SECONDS)
+def chat_feed():
+    """Fetch the messages posted since the last one shown and render the chat window."""
+    store = get_chat_store()
+    messages = st.session_state.chat_messages
+    last_id = messages[-1]["id"] if messages else 0
+    new_messages = store.since(CHANNEL, last_id, limit=st.session_state.chat_window)
+    if new_messages:
+        messages = (messages + new_messages)[-st.session_state.chat_window:]
+        st.session_state.chat_messages = messages
+
+    if messages and st.button("Load older messages", use_container_width=True):
+        older = store.before(CHANNEL, messages[0]["id"], limit=CHAT_PAGE_SIZE)
+        st.session_state.chat_window += len(older)
+        messages = older + messages
+        st.session_state.chat_messages = messages
+
+    st.markdown("".join(render_message(msg) for msg in messages), unsafe_allow_html=True)
 
 
 def show():
@@ -36,6 +76,8 @@ def show():
     
     # Community Stats
     col1, col2, col3 = st.columns(3)
+    midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    messages_today = get_chat_store().count_since(CHANNEL, midnight)
     
     with col1:
         st.markdown("""
@@ -47,10 +89,10 @@ def show():
         """, unsafe_allow_html=True)
     
     with col2:
-        st.markdown("""
+        st.markdown(f"""
             <div style='background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%);
                         padding: 1.5rem; border-radius: 12px; text-align: center;'>
-                <h3 style='color: white; margin: 0; font-size: 2rem;'>5,678</h3>
+                <h3 style='color: white; margin: 0; font-size: 2rem;'>{messages_today:,}</h3>
                 <p style='color: #f0f0f0; margin: 0.5rem 0 0 0;'>Messages Today</p>
             </div>
         """, unsafe_allow_html=True)
@@ -80,37 +122,12 @@ def show():
     messages_container = st.container()
     
     with messages_container:
-        for msg in st.session_state.chat_messages:
-            if msg.get("is_bot", False):
-                # Bot message
-                st.markdown(f"""
-                    <div style='background: linear-gradient(135deg, #1e293b 0%, #0f172a 100%);
-                                padding: 1rem; border-radius: 12px; margin-bottom: 1rem;
-                                border-left: 4px solid #10b981;'>
-                        <div style='display: flex; justify-content: space-between; align-items: center; margin-bottom: 0.5rem;'>
-                            <strong style='color: #10b981;'>🤖 {msg['user']}</strong>
-                            <span style='color: #64748b; font-size: 0.85rem;'>{msg['timestamp']}</span>
-                        </div>
-                        <p style='color: #94a3b8; margin: 0;'>{msg['message']}</p>
-                    </div>
-                """, unsafe_allow_html=True)
-            else:
-                # User message
-                st.markdown(f"""
-                    <div style='background: linear-gradient(135deg, #1e293b 0%, #0f172a 100%);
-                                padding: 1rem; border-radius: 12px; margin-bottom: 1rem;
-                                border-left: 4px solid #3b82f6;'>
-                        <div style='display: flex; justify-content: space-between; align-items: center; margin-bottom: 0.5rem;'>
-                            <strong style='color: #3b82f6;'>👤 {msg['user']}</strong>
-                            <span style='color: #64748b; font-size: 0.85rem;'>{msg['timestamp']}</span>
-                        </div>
-                        <p style='color: #94a3b8; margin: 0;'>{msg['message']}</p>
-                    </div>
-                """, unsafe_allow_html=True)
+        chat_feed()
     
     st.markdown("<br>", unsafe_allow_html=True)
     
     # Message Input
+    st.text_input("Your display name", key="display_name", max_chars=DISPLAY_NAME_MAX_LENGTH)
     with st.form("message_form", clear_on_submit=True):
         col_input, col_button = st.columns([4, 1])
         
@@ -126,14 +143,8 @@ def show():
             submit_button = st.form_submit_button("Send", use_container_width=True, type="primary")
         
         if submit_button and message_input.strip():
-            # Add message to chat
-            new_message = {
-                "user": st.session_state.current_user,
-                "message": message_input,
-                "timestamp": datetime.now().strftime("%H:%M"),
-                "is_bot": False
-            }
-            st.session_state.chat_messages.append(new_message)
+            # Share the message; the chat feed picks it up like any other new message
+            get_chat_store().post(CHANNEL, display_name(), message_input)
             st.rerun()
     
     # Quick Actions
@@ -3,6 +3,23 @@
 import streamlit as st
 import pandas as pd
 
+from history_store import HISTORY_PAGE_SIZE, get_history_store
+from identity import current_student, is_shared_identity, is_signed_in
+
+
+def _import_session_history(store, user: str) -> None:
+    """Move sessions still recorded in st.session_state.study_history into the store."""
+    for entry in st.session_state.get("study_history") or []:
+        store.add(
+            user,
+            entry["subject"],
+            entry["chapter"],
+            entry["engine"],
+            entry.get("help_types", []),
+            timestamp=entry.get("timestamp"),
+        )
+    st.session_state.study_history = []
+
 
 def show():
     """Display the enhanced study history page."""
@@ -17,12 +34,14 @@ def show():
         </div>
     """, unsafe_allow_html=True)
     
-    if "study_history" not in st.session_state:
-        st.session_state.study_history = []
+    store = get_history_store()
+    user = current_student()
+    _import_session_history(store, user)
+    if not is_signed_in():
+        st.caption("Your history is tied to this page's link: bookmark it to come back to it.")
+    stats = store.stats(user)
     
-    history = st.session_state.study_history
-    
-    if not history:
+    if not stats["sessions"]:
         st.markdown("""
             <div style='text-align: center; padding: 4rem 2rem;
                         background: linear-gradient(135deg, #1e293b 0%, #0f172a 100%);
@@ -38,15 +57,11 @@ def show():
     st.markdown("### Statistics")
     col1, col2, col3, col4 = st.columns(4)
     
-    subjects = list(set([h["subject"] for h in history]))
-    engines = list(set([h["engine"] for h in history]))
-    total_resources = sum([len(h["help_types"]) for h in history])
-    
     with col1:
         st.markdown(f"""
             <div style='background: linear-gradient(135deg, #10b981 0%, #059669 100%);
                         padding: 1.5rem; border-radius: 12px; text-align: center;'>
-                <h3 style='color: white; margin: 0; font-size: 2rem;'>{len(history)}</h3>
+                <h3 style='color: white; margin: 0; font-size: 2rem;'>{stats['sessions']}</h3>
                 <p style='color: #f0f0f0; margin: 0.5rem 0 0 0;'>Total Sessions</p>
             </div>
         """, unsafe_allow_html=True)
@@ -55,7 +70,7 @@ def show():
         st.markdown(f"""
             <div style='background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%);
                         padding: 1.5rem; border-radius: 12px; text-align: center;'>
-                <h3 style='color: white; margin: 0; font-size: 2rem;'>{len(subjects)}</h3>
+                <h3 style='color: white; margin: 0; font-size: 2rem;'>{stats['subjects']}</h3>
                 <p style='color: #f0f0f0; margin: 0.5rem 0 0 0;'>Unique Subjects</p>
             </div>
         """, unsafe_allow_html=True)
@@ -64,7 +79,7 @@ def show():
         st.markdown(f"""
             <div style='background: linear-gradient(135deg, #8b5cf6 0%, #7c3aed 100%);
                         padding: 1.5rem; border-radius: 12px; text-align: center;'>
-                <h3 style='color: white; margin: 0; font-size: 2rem;'>{len(engines)}</h3>
+                <h3 style='color: white; margin: 0; font-size: 2rem;'>{stats['engines']}</h3>
                 <p style='color: #f0f0f0; margin: 0.5rem 0 0 0;'>AI Engines Used</p>
             </div>
         """, unsafe_allow_html=True)
@@ -73,7 +88,7 @@ def show():
         st.markdown(f"""
             <div style='background: linear-gradient(135deg, #f59e0b 0%, #d97706 100%);
                         padding: 1.5rem; border-radius: 12px; text-align: center;'>
-                <h3 style='color: white; margin: 0; font-size: 2rem;'>{total_resources}</h3>
+                <h3 style='color: white; margin: 0; font-size: 2rem;'>{stats['resources']}</h3>
                 <p style='color: #f0f0f0; margin: 0.5rem 0 0 0;'>Total Resources</p>
             </div>
         """, unsafe_allow_html=True)
@@ -83,10 +98,20 @@ def show():
     
     st.markdown("### Session History")
     
+    col_filter, col_page = st.columns([3, 1])
+    with col_filter:
+        subject = st.selectbox("Subject", ["All subjects"] + store.subjects(user))
+    subject = None if subject == "All subjects" else subject
+    total = store.count(user, subject=subject)
+    pages = max(1, (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE)
+    with col_page:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1)
+    offset = (int(page) - 1) * HISTORY_PAGE_SIZE
+    
     df_data = []
-    for idx, entry in enumerate(reversed(history), 1):
+    for idx, entry in enumerate(store.sessions(user, HISTORY_PAGE_SIZE, offset, subject=subject)):
         df_data.append({
-            "#": len(history) - idx + 1,
+            "#": total - offset - idx,
             "Date & Time": entry["timestamp"],
             "Subject": entry["subject"],
             "Chapter": entry["chapter"],
@@ -115,6 +140,8 @@ def show():
     
     with col_clear2:
         st.markdown("<br>", unsafe_allow_html=True)
-        if st.button("Clear All History", type="secondary", use_container_width=True):
-            st.session_state.study_history = []
-            st.rerun()
+        shared = is_shared_identity(user)
+        if st.button("Clear All History", type="secondary", use_container_width=True, disabled=shared):
+            if not shared:
+                store.clear(user)
+                st.rerun()
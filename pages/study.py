@@ -1,5 +1,23 @@
 ﻿# ... (keeping all imports and functions from before)
 
+import hashlib
+import json
+
+import streamlit as st
+
+from quiz import load_quiz
+
+
+def get_quiz_data(quizzes):
+    """Parse the A7 output once per quiz and keep it in session state; option clicks rerun the page."""
+    raw = quizzes if isinstance(quizzes, str) else json.dumps(quizzes, sort_keys=True, default=str)
+    digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    cached = st.session_state.get("quiz_data")
+    if cached is None or cached[0] != digest:
+        cached = st.session_state.quiz_data = (digest, load_quiz(quizzes))
+    return cached[1]
+
+
 def show():
     """Display the study page."""
     init_session_state()
@@ -21,7 +39,7 @@ def show():
         st.markdown("### Quizzes and Exercises")
         
         if st.session_state.quizzes:
-            quiz_data = parse_quiz(st.session_state.quizzes)
+            quiz_data = get_quiz_data(st.session_state.quizzes)
             
             total_questions = len(quiz_data["questions"])
             max_score = 20
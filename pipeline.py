@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from dedupe import ResultDeduper
+from metrics import is_error_output
+from pack_store import get_pack_store, pack_key
+from ratelimit import session_scope
+from retrieval import get_document_index
+from utils import _hash_stream
+from agents import (
+    A4_RETRIEVAL_TOKENS,
+    a1_everything_results,
+    a2_cleaner_results_async,
+    a3_adapter,
+    a4_summarizer_async,
+    a5_collector_videos,
+    a6_relations_projects,
+    a7_ai_companion_quiz_structured_async,
+    a8_examiner,
+    a9_guide_async,
+    get_llm,
+)
+
+# A node function receives the outputs of its dependencies, keyed by node name.
+NodeFn = Callable[[Dict[str, Any]], Any]
+
+
+@dataclass(frozen=True)
+class Node:
+    """
+    One step of a pipeline: a sync or async function and the nodes it depends on.
+    """
+
+    name: str
+    func: NodeFn
+    deps: Tuple[str, ...] = ()
+
+
+@dataclass
+class NodeTiming:
+    """
+    Start and end of a node, in seconds since the pipeline started.
+    """
+
+    start: float
+    end: float
+
+    @property
+    def seconds(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class PipelineResult:
+    """
+    Outputs and timings of one pipeline run.
+    """
+
+    outputs: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, NodeTiming] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+    total_seconds: float = 0.0
+
+
+class Pipeline:
+    """
+    Dependency graph of agents executed with asyncio.
+
+    Every node starts as soon as all of its dependencies have finished, so
+    independent agents overlap and a run takes as long as its critical path.
+    Async node functions are awaited directly; blocking ones run in a worker
+    thread. A node that raises records "[name ERROR] ..." as its output (the same
+    convention the agents use). A node whose dependency produced such an error
+    output does not run: it records "[name ERROR] upstream dep failed" instead,
+    so no model call is spent on an error message.
+    """
+
+    def __init__(self, nodes: Iterable[Node]) -> None:
+        self.nodes: Dict[str, Node] = {}
+        for node in nodes:
+            if node.name in self.nodes:
+                raise ValueError(f"Duplicate pipeline node '{node.name}'.")
+            self.nodes[node.name] = node
+        for node in self.nodes.values():
+            for dep in node.deps:
+                if dep not in self.nodes:
+                    raise ValueError(f"Node '{node.name}' depends on unknown node '{dep}'.")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        state: Dict[str, int] = {}
+
+        def visit(name: str) -> None:
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f"Pipeline has a dependency cycle through '{name}'.")
+            state[name] = 1
+            for dep in self.nodes[name].deps:
+                visit(dep)
+            state[name] = 2
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    def subset(self, targets: Iterable[str]) -> "Pipeline":
+        """
+        Return a pipeline containing only targets and everything they depend on.
+        """
+        keep: Dict[str, Node] = {}
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name in keep:
+                continue
+            if name not in self.nodes:
+                raise ValueError(f"Unknown pipeline node '{name}'.")
+            keep[name] = self.nodes[name]
+            stack.extend(self.nodes[name].deps)
+        return Pipeline(node for name, node in self.nodes.items() if name in keep)
+
+    async def arun(self) -> PipelineResult:
+        """
+        Execute every node, overlapping independent ones, and return outputs and timings.
+        """
+        result = PipelineResult()
+        started = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def execute(node: Node) -> Any:
+            if node.deps:
+                await asyncio.gather(*(tasks[dep] for dep in node.deps))
+            inputs = {dep: result.outputs[dep] for dep in node.deps}
+            start = time.perf_counter() - started
+            failed = next((dep for dep in node.deps if is_error_output(inputs[dep])), None)
+            try:
+                if failed is not None:
+                    output = f"[{node.name} ERROR] upstream {failed} failed"
+                elif inspect.iscoroutinefunction(node.func):
+                    output = await node.func(inputs)
+                else:
+                    output = await asyncio.to_thread(node.func, inputs)
+                    if inspect.isawaitable(output):
+                        output = await output
+            except Exception as exc:
+                output = f"[{node.name} ERROR] {exc}"
+                result.errors[node.name] = str(exc)
+            result.timings[node.name] = NodeTiming(start, time.perf_counter() - started)
+            result.outputs[node.name] = output
+            return output
+
+        for name in self.order:
+            tasks[name] = asyncio.create_task(execute(self.nodes[name]))
+        await asyncio.gather(*tasks.values())
+        result.total_seconds = time.perf_counter() - started
+        return result
+
+    def run(self) -> PipelineResult:
+        """
+        Blocking wrapper around arun() for callers without an event loop (e.g. Streamlit).
+        The caller's session is bound for the run so rate limiters queue it fairly.
+        """
+        with session_scope():
+            return asyncio.run(self.arun())
+
+
+def build_study_pipeline(
+    llm,
+    subject: str,
+    chapter: str,
+    file=None,
+    guide_mode: bool = False,
+    self_score: Optional[int] = None,
+    total_questions: int = 3,
+    file_digest: Optional[str] = None,
+) -> Pipeline:
+    """
+    Declare the study-pack graph for one chapter.
+
+    A1 -> A2 -> A4 -> (A7, A9), where A4 summarizes the uploaded course (A3) when
+    a file is given and the cleaned web results otherwise. A5, A6 and A8 only
+    depend on the subject and chapter and run alongside everything else.
+    A1's output is its list of raw result dicts, which A2 scores one by one, and
+    A7's output is the quiz dict of quiz.py.
+
+    A5, A6 and A8 share a ResultDeduper, so a link is shown by one of them only.
+    A2 then skips A1 results those agents have already shown by the time it starts;
+    it never waits for them, as that would put the slowest search on the A1 -> A2
+    -> A4 critical path, so the cross-agent dedupe of A1 is best effort.
+
+    With a file, A3_Index builds (or loads) the BM25 index of the course. A4 gets
+    the whole course when it fits in A4_RETRIEVAL_TOKENS and otherwise the passages
+    most relevant to the chapter up to that size; either way, a context above
+    A4's prompt budget is map-reduced by the summarizer. A7 and A9 get the
+    passages closest to the summary as excerpts.
+    """
+
+    def index(deps: Dict[str, Any]):
+        return get_document_index(deps["A3_Adapter"])
+
+    def excerpts(deps: Dict[str, Any]) -> str:
+        doc_index = deps.get("A3_Index")
+        summary = deps["A4_Summarizer"]
+        if doc_index is None or is_error_output(summary):
+            return ""
+        return doc_index.passages(summary)
+
+    async def clean(deps: Dict[str, Any]) -> str:
+        results = deps["A1_Everything"]
+        if isinstance(results, list):
+            results = [r for r in results if not shown.is_duplicate(r)]
+        return await a2_cleaner_results_async(llm, subject, chapter, results)
+
+    async def summarize(deps: Dict[str, Any]) -> str:
+        context = deps[context_node]
+        doc_index = deps.get("A3_Index")
+        if doc_index is not None:
+            context = doc_index.context_for(f"{subject} {chapter}", A4_RETRIEVAL_TOKENS)
+        return await a4_summarizer_async(llm, context, guide_mode)
+
+    async def quiz(deps: Dict[str, Any]) -> Dict[str, Any]:
+        return await a7_ai_companion_quiz_structured_async(llm, deps["A4_Summarizer"], excerpts(deps))
+
+    async def guide(deps: Dict[str, Any]) -> str:
+        return await a9_guide_async(
+            llm, deps["A4_Summarizer"], self_score, total_questions, excerpts(deps)
+        )
+
+    shown = ResultDeduper()
+    context_node = "A3_Adapter" if file is not None else "A2_Cleaner"
+    course = ("A3_Index",) if file is not None else ()
+    nodes = [
+        Node("A1_Everything", lambda _: a1_everything_results(subject, chapter)),
+        Node("A2_Cleaner", clean, ("A1_Everything",)),
+        Node("A4_Summarizer", summarize, (context_node,) + course),
+        Node("A5_Collector", lambda _: a5_collector_videos(subject, chapter, shown)),
+        Node("A6_Relations", lambda _: a6_relations_projects(subject, chapter, shown)),
+        Node("A7_AI_Companion", quiz, ("A4_Summarizer",) + course),
+        Node("A8_Examiner", lambda _: a8_examiner(subject, chapter, shown)),
+        Node("A9_Guide", guide, ("A4_Summarizer",) + course),
+    ]
+    if file is not None:
+        nodes.append(Node("A3_Adapter", lambda _: a3_adapter(file, file_digest)))
+        nodes.append(Node("A3_Index", index, ("A3_Adapter",)))
+    return Pipeline(nodes)
+
+
+def _file_id(file) -> str:
+    # SHA-256 of an uploaded file, read in chunks, leaving its position unchanged.
+    position = file.tell()
+    try:
+        return _hash_stream(file)
+    finally:
+        file.seek(position)
+
+
+async def agenerate_study_pack(
+    engine: str,
+    subject: str,
+    chapter: str,
+    targets: Iterable[str],
+    file=None,
+    guide_mode: bool = False,
+    self_score: Optional[int] = None,
+    total_questions: int = 3,
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Outputs of the target nodes for one chapter, shared across sessions.
+
+    Identical requests (same subject, chapter, engine, targets, options and
+    uploaded file) from any session are generated once: later ones get the stored
+    pack and concurrent ones wait for the run in flight (see pack_store). Returns
+    (pack, source) with source "stored", "shared" or "built".
+    """
+    targets = tuple(targets)
+    file_digest = _file_id(file) if file is not None else ""
+    options: Dict[str, Any] = {"guide_mode": guide_mode, "file": file_digest}
+    if "A9_Guide" in targets:
+        options.update(self_score=self_score, total_questions=total_questions)
+    key = pack_key(subject, chapter, engine, targets, **options)
+
+    async def build() -> Dict[str, Any]:
+        llm = get_llm(engine)
+        pipeline = build_study_pipeline(
+            llm, subject, chapter, file, guide_mode, self_score, total_questions, file_digest or None
+        )
+        result = await pipeline.subset(targets).arun()
+        # Completeness covers every node that ran: an agent that failed upstream (say
+        # A2) returns an error string that never reaches the stored outputs.
+        errors = {
+            name: output["error"] if isinstance(output, dict) else output
+            for name, output in result.outputs.items()
+            if is_error_output(output)
+        }
+        errors.update(result.errors)
+        return {
+            "subject": subject,
+            "chapter": chapter,
+            "engine": engine,
+            "outputs": {name: result.outputs[name] for name in targets},
+            "errors": errors,
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    return await get_pack_store().aget_or_build(key, build)
+
+
+def generate_study_pack(*args: Any, **kwargs: Any) -> Tuple[Dict[str, Any], str]:
+    """
+    Blocking agenerate_study_pack() for Streamlit pages.
+    """
+    with session_scope():
+        return asyncio.run(agenerate_study_pack(*args, **kwargs))
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from ratelimit import current_session, session_scope
+
+T = TypeVar("T")
+
+# Worker threads that run LLM calls under a deadline or hedge (sync callers only).
+LLM_CALL_WORKERS = int(os.getenv("STUDYMATE_LLM_CALL_WORKERS", "32"))
+
+# HTTP status codes worth retrying: timeouts, conflicts, rate limits and server errors.
+TRANSIENT_STATUS_CODES = frozenset({408, 409, 425, 429, 500, 502, 503, 504, 529})
+_TRANSIENT_NAMES = ("Timeout", "Connection", "RateLimit", "ServiceUnavailable", "InternalServer", "ResourceExhausted")
+
+
+class LLMTimeoutError(TimeoutError):
+    """Raised when an engine does not answer before its deadline."""
+
+
+@dataclass(frozen=True)
+class EnginePolicy:
+    """
+    How calls to one engine are bounded and retried.
+
+    timeout: deadline in seconds of one attempt (0 = none).
+    retries: extra attempts after a transient failure (timeouts, rate limits, 5xx).
+    backoff: base delay in seconds before a retry, doubled on each further retry.
+    hedge_engine: engine to ask as well when this one is slow (empty = no hedging).
+    hedge_after: seconds to wait for this engine before also asking hedge_engine;
+        the first successful answer wins and the other call is abandoned.
+    """
+
+    timeout: float = 60.0
+    retries: int = 2
+    backoff: float = 1.0
+    hedge_engine: str = ""
+    hedge_after: float = 0.0
+
+    @property
+    def hedged(self) -> bool:
+        return bool(self.hedge_engine) and self.hedge_after > 0
+
+    def delay(self, attempt: int) -> float:
+        """
+        Seconds to wait before retry number attempt (1-based), with jitter.
+        """
+        base = self.backoff * (2 ** (attempt - 1))
+        return base / 2 + random.uniform(0, base / 2)
+
+
+def load_policy(engine: str) -> EnginePolicy:
+    """
+    Policy of engine from the environment.
+
+    STUDYMATE_LLM_TIMEOUT / _RETRIES / _BACKOFF set the defaults of every engine and
+    STUDYMATE_<ENGINE>_TIMEOUT / _RETRIES / _BACKOFF / _HEDGE_ENGINE / _HEDGE_AFTER
+    override them for one engine, e.g. STUDYMATE_OPENAI_HEDGE_ENGINE=deepseek with
+    STUDYMATE_OPENAI_HEDGE_AFTER=8.
+    """
+    prefix = f"STUDYMATE_{engine.upper()}_"
+
+    def setting(name: str, default: str) -> str:
+        return os.getenv(prefix + name) or os.getenv(f"STUDYMATE_LLM_{name}") or default
+
+    return EnginePolicy(
+        timeout=float(setting("TIMEOUT", "60")),
+        retries=int(setting("RETRIES", "2")),
+        backoff=float(setting("BACKOFF", "1")),
+        hedge_engine=(os.getenv(prefix + "HEDGE_ENGINE") or "").lower(),
+        hedge_after=float(os.getenv(prefix + "HEDGE_AFTER") or "0"),
+    )
+
+
+def is_transient(exc: BaseException) -> bool:
+    """
+    True when exc looks like a failure that a later attempt may not hit.
+    """
+    if isinstance(exc, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        return status in TRANSIENT_STATUS_CODES
+    return any(name in cls.__name__ for cls in type(exc).__mro__ for name in _TRANSIENT_NAMES)
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=LLM_CALL_WORKERS, thread_name_prefix="llm-call")
+    return _executor
+
+
+def _submit(call: Callable[[], T]) -> "Future[T]":
+    # Run in a copy of the caller's context so context variables follow the call. The
+    # worker thread has no Streamlit context, so the caller's session is bound
+    # explicitly: rate limiters must queue the call under it, not under "default".
+    session = current_session()
+
+    def run() -> T:
+        with session_scope(session):
+            return call()
+
+    return _get_executor().submit(contextvars.copy_context().run, run)
+
+
+def _attempt(call: Callable[[], T], policy: EnginePolicy, hedge: Optional[Callable[[], T]]) -> T:
+    if not policy.timeout and hedge is None:
+        return call()
+
+    deadline = time.monotonic() + policy.timeout if policy.timeout else None
+    futures: List[Future] = [_submit(call)]
+    if hedge is not None:
+        done, _ = wait(futures, timeout=_remaining(deadline, policy.hedge_after))
+        if not done:
+            futures.append(_submit(hedge))
+            hedge = None
+
+    errors: List[BaseException] = []
+    while futures:
+        remaining = _remaining(deadline)
+        if remaining is not None and remaining <= 0:
+            break
+        done, _ = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            futures.remove(future)
+            exc = future.exception()
+            if exc is None:
+                for other in futures:
+                    other.cancel()
+                return future.result()
+            errors.append(exc)
+        if not futures and hedge is not None:
+            # The engine failed before the hedge fired: ask the other engine right away.
+            futures.append(_submit(hedge))
+            hedge = None
+
+    if errors and not futures:
+        raise errors[0]
+    for other in futures:
+        other.cancel()
+    raise LLMTimeoutError(f"No answer within {policy.timeout:g} seconds.")
+
+
+def _remaining(deadline: Optional[float], cap: Optional[float] = None) -> Optional[float]:
+    if deadline is None:
+        return cap
+    remaining = deadline - time.monotonic()
+    return min(remaining, cap) if cap is not None else remaining
+
+
+def call_with_policy(
+    call: Callable[[], T],
+    policy: EnginePolicy,
+    hedge: Optional[Callable[[], T]] = None,
+    sleep: Callable[[float], Any] = time.sleep,
+) -> T:
+    """
+    Run call under policy: per-attempt deadline, hedging and retries with backoff.
+
+    hedge is the same request against policy.hedge_engine (None = no hedging). A
+    call still running at its deadline is abandoned, not interrupted; the client's
+    own HTTP timeout ends it. Non-transient errors are raised immediately.
+    """
+    attempt = 0
+    while True:
+        try:
+            return _attempt(call, policy, hedge if policy.hedged else None)
+        except Exception as exc:
+            attempt += 1
+            if attempt > policy.retries or not is_transient(exc):
+                raise
+        sleep(policy.delay(attempt))
+
+
+async def _aattempt(
+    call: Callable[[], Awaitable[T]],
+    policy: EnginePolicy,
+    hedge: Optional[Callable[[], Awaitable[T]]],
+) -> T:
+    deadline = time.monotonic() + policy.timeout if policy.timeout else None
+    tasks: List[asyncio.Task] = [asyncio.ensure_future(call())]
+    try:
+        if hedge is not None:
+            done, _ = await asyncio.wait(tasks, timeout=_remaining(deadline, policy.hedge_after))
+            if not done:
+                tasks.append(asyncio.ensure_future(hedge()))
+                hedge = None
+
+        errors: List[BaseException] = []
+        while tasks:
+            remaining = _remaining(deadline)
+            if remaining is not None and remaining <= 0:
+                break
+            done, _ = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                tasks.remove(task)
+                exc = task.exception()
+                if exc is None:
+                    return task.result()
+                errors.append(exc)
+            if not tasks and hedge is not None:
+                tasks.append(asyncio.ensure_future(hedge()))
+                hedge = None
+
+        if errors and not tasks:
+            raise errors[0]
+        raise LLMTimeoutError(f"No answer within {policy.timeout:g} seconds.")
+    finally:
+        # Unlike threads, losing and timed-out coroutines can really be cancelled.
+        for task in tasks:
+            task.cancel()
+
+
+async def acall_with_policy(
+    call: Callable[[], Awaitable[T]],
+    policy: EnginePolicy,
+    hedge: Optional[Callable[[], Awaitable[T]]] = None,
+    sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+) -> T:
+    """
+    Async call_with_policy; call and hedge return fresh coroutines on every attempt.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await _aattempt(call, policy, hedge if policy.hedged else None)
+        except Exception as exc:
+            attempt += 1
+            if attempt > policy.retries or not is_transient(exc):
+                raise
+        await sleep(policy.delay(attempt))
+
+
+_policies: Dict[str, EnginePolicy] = {}
+
+
+def get_policy(engine: str) -> EnginePolicy:
+    """
+    Return the (memoized) policy of engine.
+    """
+    policy = _policies.get(engine)
+    if policy is None:
+        policy = _policies[engine] = load_policy(engine)
+    return policy
+
+
+def set_policy(engine: str, policy: EnginePolicy) -> None:
+    """
+    Replace the policy of engine for this process (e.g. from an admin page or a test).
+    """
+    _policies[engine] = policy
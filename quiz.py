@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+OPTION_KEYS = ("A", "B", "C", "D")
+
+Quiz = Dict[str, Any]
+
+
+class QuizQuestion(BaseModel):
+    """One multiple choice question of an A7 quiz."""
+
+    question: str = Field(description="The question, without its number.")
+    options: List[str] = Field(
+        description="Exactly four answer options, in order A, B, C, D, without letters."
+    )
+    correct: Literal["A", "B", "C", "D"] = Field(description="Letter of the correct option.")
+
+
+class QuizOutput(BaseModel):
+    """Structured output of A7_AI_Companion."""
+
+    questions: List[QuizQuestion] = Field(description="The multiple choice questions.")
+    exercises: List[str] = Field(description="Short open questions or exercises, without their numbers.")
+
+
+def empty_quiz(error: Optional[str] = None) -> Quiz:
+    quiz: Quiz = {"questions": [], "exercises": []}
+    if error:
+        quiz["error"] = error
+    return quiz
+
+
+def quiz_from_output(output: QuizOutput) -> Quiz:
+    """
+    Convert the structured model output to the quiz dict used by the Study page:
+    {"questions": [{"number", "question", "options": {"A": ...}, "correct"}], "exercises": [...]}.
+    """
+    questions = []
+    for question in output.questions:
+        options = dict(zip(OPTION_KEYS, (option.strip() for option in question.options)))
+        if len(options) < 2 or question.correct not in options:
+            continue
+        questions.append(
+            {
+                "number": len(questions) + 1,
+                "question": question.question.strip(),
+                "options": options,
+                "correct": question.correct,
+            }
+        )
+    return {"questions": questions, "exercises": [e.strip() for e in output.exercises if e.strip()]}
+
+
+# One alternation per kind of line, so parse_quiz reads the text in a single pass.
+_LINE_RE = re.compile(
+    r"""
+    ^[ \t>*_#-]*
+    (?:
+        \[?(?P<section>QUIZ|EXERCISES?)\]?[ \t*_:]*$
+      | (?:Q(?:uestion)?[ \t]*)?(?P<qnum>\d{1,2})[ \t]*[:.)][ \t*_]*(?P<question>\S.*?)
+      | \(?(?P<opt>[A-D])[ \t]*[).:][ \t]*(?P<option>\S.*?)
+      | (?:Correct[ \t]*)?answer[ \t*_]*[:\-][ \t*_]*\(?(?P<correct>[A-D])\b.*?
+      | E(?:xercise)?[ \t]*(?P<enum>\d{1,2})[ \t]*[:.)][ \t*_]*(?P<exercise>\S.*?)
+      | (?P<text>\S.*?)
+    )?
+    [ \t*_]*$
+    """,
+    re.IGNORECASE | re.MULTILINE | re.VERBOSE,
+)
+
+
+def parse_quiz(text: str) -> Quiz:
+    """
+    Parse A7's free-text [QUIZ] / [EXERCISES] format in one pass over the text.
+
+    Tolerates markdown decoration, "Q1." / "1)" numbering, "A." / "(A)" options
+    and "Answer: B" lines; questions without a usable correct answer are dropped.
+    """
+    questions: List[Quiz] = []
+    exercises: List[str] = []
+    section = "quiz"
+    current: Optional[Quiz] = None
+    last_option: Optional[str] = None
+
+    def close() -> None:
+        if current is not None and len(current["options"]) >= 2 and current["correct"] in current["options"]:
+            current["number"] = len(questions) + 1
+            questions.append(current)
+
+    for match in _LINE_RE.finditer(text):
+        kind = match.lastgroup
+        if kind is None:
+            continue
+        if kind == "section":
+            close()
+            current, last_option = None, None
+            section = "exercises" if match.group("section").upper().startswith("EXERCISE") else "quiz"
+        elif kind == "question" and section == "quiz":
+            close()
+            current = {"number": 0, "question": match.group("question"), "options": {}, "correct": ""}
+            last_option = None
+        elif kind == "option" and current is not None:
+            last_option = match.group("opt").upper()
+            current["options"][last_option] = match.group("option")
+        elif kind == "correct" and current is not None:
+            current["correct"] = match.group("correct").upper()
+            last_option = None
+        elif kind == "exercise" or (kind == "question" and section == "exercises"):
+            exercises.append(match.group("exercise") or match.group("question"))
+        elif kind == "text":
+            # A wrapped line continues whatever came just before it.
+            line = match.group("text")
+            if section == "exercises" and exercises:
+                exercises[-1] += " " + line
+            elif current is not None and last_option is not None:
+                current["options"][last_option] += " " + line
+            elif current is not None and not current["options"]:
+                current["question"] += " " + line
+    close()
+    return {"questions": questions, "exercises": exercises}
+
+
+def load_quiz(output: Any) -> Quiz:
+    """
+    Quiz dict from whatever A7 produced: a structured quiz (dict or JSON text) or
+    the free-text format. Agent errors give an empty quiz carrying the error.
+    """
+    if isinstance(output, dict):
+        return output
+    text = str(output or "")
+    stripped = text.lstrip()
+    if stripped.startswith("[A7_AI_Companion ERROR]"):
+        return empty_quiz(stripped)
+    if stripped.startswith("{"):
+        try:
+            data = json.loads(stripped)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and "questions" in data:
+            return data
+    return parse_quiz(text)
+
+
+def format_quiz(quiz: Quiz) -> str:
+    """
+    Render a quiz dict in A7's free-text format (for exports and text-only callers).
+    """
+    lines = ["[QUIZ]"]
+    for question in quiz["questions"]:
+        lines.append(f"Q{question['number']}: {question['question']}")
+        lines.extend(f"{key}) {text}" for key, text in question["options"].items())
+        lines.append(f"Correct answer: {question['correct']}")
+        lines.append("")
+    lines.append("[EXERCISES]")
+    lines.extend(f"E{idx}: {exercise}" for idx, exercise in enumerate(quiz["exercises"], start=1))
+    return "\n".join(lines)
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, Optional
+
+from langchain_core.rate_limiters import BaseRateLimiter
+
+# Default request rate of each LLM engine (requests per minute) and burst size; set
+# STUDYMATE_<ENGINE>_RPM / _BURST to your account's limits (RPM 0 = unlimited).
+DEFAULT_LLM_RPM = float(os.getenv("STUDYMATE_LLM_RPM", "120"))
+DEFAULT_LLM_BURST = float(os.getenv("STUDYMATE_LLM_BURST", "20"))
+# Live web searches per minute and burst size shared by every session (RPM 0 = unlimited).
+SEARCH_RPM = float(os.getenv("STUDYMATE_SEARCH_RPM", "60"))
+SEARCH_BURST = float(os.getenv("STUDYMATE_SEARCH_BURST", "5"))
+
+_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("studymate_session", default=None)
+
+
+class RateLimitTimeout(TimeoutError):
+    """Raised when a rate limiter cannot grant a request before its timeout."""
+
+
+def current_session() -> str:
+    """
+    Key of the session a request belongs to, for fair queuing.
+
+    The key bound with session_scope() wins; otherwise the Streamlit session of
+    the running script thread is used, and "default" outside Streamlit.
+    """
+    key = _session.get()
+    if key is not None:
+        return key
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return "default"
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else "default"
+
+
+@contextmanager
+def session_scope(key: Optional[str] = None) -> Iterator[str]:
+    """
+    Bind key (the current session by default) to this context for its duration.
+
+    Worker threads and asyncio tasks started inside inherit it, so requests they
+    make are queued under the right session.
+    """
+    key = key or current_session()
+    token = _session.set(key)
+    try:
+        yield key
+    finally:
+        _session.reset(token)
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """
+    True when exc is a provider's "too many requests" answer (HTTP 429 or similar).
+    """
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    name = type(exc).__name__
+    return status == 429 or "RateLimit" in name or "Ratelimit" in name or "ResourceExhausted" in name
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """
+    Seconds from the Retry-After header of a rate-limit error, if it has one.
+    """
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Classic token bucket: rate tokens per second, holding at most capacity.
+
+    Not thread-safe on its own; FairRateLimiter serializes access to it.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens and return 0, or return the seconds until they will be available.
+        """
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    def drain(self, seconds: float) -> None:
+        """
+        Empty the bucket so nothing is granted for the next seconds (after a 429).
+        """
+        self._refill()
+        self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class FairRateLimiter(BaseRateLimiter):
+    """
+    Process-wide token bucket with a round-robin queue across sessions.
+
+    Waiting requests are queued per session (see current_session) and sessions are
+    served in turn, one request each, so a student generating many packs cannot
+    starve the others. It plugs into LangChain chat models as their rate_limiter
+    and can be acquired directly for other APIs. clock and sleep can be replaced
+    (e.g. by a fake clock in tests); a rate of 0 disables limiting.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        capacity: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Optional[Callable[[float], None]] = None,
+    ) -> None:
+        self.name = name
+        self.rate = rate
+        self._clock = clock
+        self._sleep = sleep
+        self._bucket = TokenBucket(rate, max(capacity, 1.0), clock) if rate > 0 else None
+        self._cond = threading.Condition()
+        self._queues: "OrderedDict[str, Deque[object]]" = OrderedDict()
+        self._granted = 0
+        self._waited = 0.0
+
+    def _wait(self, seconds: Optional[float]) -> None:
+        if seconds is not None and self._sleep is not None:
+            self._cond.release()
+            try:
+                self._sleep(seconds)
+            finally:
+                self._cond.acquire()
+        else:
+            self._cond.wait(seconds)
+
+    def _dequeue(self, session: str, ticket: object) -> None:
+        queue = self._queues.get(session)
+        if queue is None:
+            return
+        if queue and queue[0] is ticket:
+            queue.popleft()
+            # The session goes to the back of the rotation behind the others.
+            del self._queues[session]
+            if queue:
+                self._queues[session] = queue
+        else:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[session]
+        self._cond.notify_all()
+
+    def acquire_for(self, session: Optional[str] = None, timeout: Optional[float] = None) -> float:
+        """
+        Block until the request of session may go; return the seconds waited.
+        """
+        if self._bucket is None:
+            return 0.0
+        session = session or current_session()
+        ticket = object()
+        with self._cond:
+            started = self._clock()
+            self._queues.setdefault(session, deque()).append(ticket)
+            try:
+                while True:
+                    head = next(iter(self._queues))
+                    delay: Optional[float] = None
+                    if head == session and self._queues[session][0] is ticket:
+                        delay = self._bucket.take()
+                        if delay == 0.0:
+                            waited = self._clock() - started
+                            self._granted += 1
+                            self._waited += waited
+                            return waited
+                    if timeout is not None:
+                        remaining = timeout - (self._clock() - started)
+                        if remaining <= 0:
+                            raise RateLimitTimeout(f"{self.name}: no request slot within {timeout:g} seconds.")
+                        delay = remaining if delay is None else min(delay, remaining)
+                    self._wait(delay)
+            finally:
+                self._dequeue(session, ticket)
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        """
+        LangChain rate limiter API: wait for a slot (or only try when not blocking).
+        """
+        if blocking:
+            self.acquire_for()
+            return True
+        if self._bucket is None:
+            return True
+        with self._cond:
+            if self._queues or self._bucket.take() > 0.0:
+                return False
+            self._granted += 1
+            return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        """
+        Async acquire: waits in a worker thread so the event loop keeps running.
+        """
+        if not blocking:
+            return self.acquire(blocking=False)
+        if self._bucket is None:
+            return True
+        await asyncio.to_thread(self.acquire_for)
+        return True
+
+    def penalize(self, seconds: Optional[float] = None) -> None:
+        """
+        Hold every session back for seconds, e.g. the Retry-After of a 429 answer
+        (by default, the time to refill a full burst).
+        """
+        if self._bucket is None:
+            return
+        if seconds is None:
+            seconds = self._bucket.capacity / self.rate
+        with self._cond:
+            self._bucket.drain(seconds)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return the configured rate, queue length and how long requests waited.
+        """
+        with self._cond:
+            return {
+                "rate_per_second": self.rate,
+                "waiting": sum(len(queue) for queue in self._queues.values()),
+                "sessions_waiting": len(self._queues),
+                "granted": self._granted,
+                "total_wait_seconds": self._waited,
+            }
+
+
+_limiters: Dict[str, FairRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str) -> FairRateLimiter:
+    """
+    Return the process-wide limiter for an engine code or "search".
+
+    Rates come from STUDYMATE_<NAME>_RPM and STUDYMATE_<NAME>_BURST, defaulting to
+    SEARCH_RPM / SEARCH_BURST for search and DEFAULT_LLM_RPM / DEFAULT_LLM_BURST for
+    engines.
+    """
+    name = name.lower()
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            default_rpm, default_burst = (
+                (SEARCH_RPM, SEARCH_BURST) if name == "search" else (DEFAULT_LLM_RPM, DEFAULT_LLM_BURST)
+            )
+            rpm = float(os.getenv(f"STUDYMATE_{name.upper()}_RPM") or default_rpm)
+            burst = float(os.getenv(f"STUDYMATE_{name.upper()}_BURST") or default_burst)
+            limiter = _limiters[name] = FairRateLimiter(name, rpm / 60.0, burst)
+        return limiter
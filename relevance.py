@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Set
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Common English and French function words (the UI is used in both languages).
+STOPWORDS = frozenset(
+    """
+    a an and are as at be by for from how in into is it of on or that the this to
+    what with your you chapter course lesson introduction
+    au aux avec ce ces dans de des du en est et la le les leur un une par pour
+    sur qui que chapitre cours
+    """.split()
+)
+
+# Words are compared on their first PREFIX_LENGTH characters, a cheap stand-in for
+# stemming ("limits"/"limite"/"limit" all match).
+PREFIX_LENGTH = 5
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word tokens of text without stopwords or one-letter words.
+    """
+    return [
+        word
+        for word in _WORD_RE.findall(text.lower())
+        if len(word) > 1 and word not in STOPWORDS
+    ]
+
+
+def _stems(text: str) -> Set[str]:
+    return {word[:PREFIX_LENGTH] for word in tokenize(text)}
+
+
+def relevance_score(result: Dict[str, str], subject: str, chapter: str = "") -> float:
+    """
+    Score in [0, 1] of how well a search result matches the subject and chapter.
+
+    The score is the share of subject words found in the result's title, snippet
+    and URL, blended 2:1 with the share of chapter words (subject only when the
+    chapter has no content words).
+    """
+    text = " ".join(
+        result.get(key) or "" for key in ("title", "body", "description", "href", "url")
+    )
+    found = _stems(text.replace("/", " ").replace("-", " ").replace("_", " "))
+
+    subject_terms = _stems(subject)
+    chapter_terms = _stems(chapter) - subject_terms
+    subject_cover = len(subject_terms & found) / len(subject_terms) if subject_terms else 1.0
+    if not chapter_terms:
+        return subject_cover
+    chapter_cover = len(chapter_terms & found) / len(chapter_terms)
+    return (2 * subject_cover + chapter_cover) / 3
+
+
+@dataclass
+class RelevanceSplit:
+    """
+    Search results sorted into confidently relevant, uncertain and off-topic.
+    """
+
+    kept: List[Dict[str, str]] = field(default_factory=list)
+    uncertain: List[Dict[str, str]] = field(default_factory=list)
+    dropped: List[Dict[str, str]] = field(default_factory=list)
+
+    @property
+    def confident(self) -> bool:
+        return not self.uncertain
+
+
+def split_by_relevance(
+    results: Sequence[Dict[str, str]],
+    subject: str,
+    chapter: str = "",
+    keep_threshold: float = 0.6,
+    drop_threshold: float = 0.2,
+) -> RelevanceSplit:
+    """
+    Keep results scoring at least keep_threshold, drop those below drop_threshold
+    and mark everything in between as uncertain.
+    """
+    split = RelevanceSplit()
+    for result in results:
+        score = relevance_score(result, subject, chapter)
+        if score >= keep_threshold:
+            split.kept.append(result)
+        elif score < drop_threshold:
+            split.dropped.append(result)
+        else:
+            split.uncertain.append(result)
+    return split
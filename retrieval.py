@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from cache import SQLiteCache, get_cache
+from relevance import PREFIX_LENGTH, tokenize
+from tokens import count_tokens, iter_chunks
+
+# Size of the indexed passages and the overlap between neighbours, in tokens.
+RETRIEVAL_CHUNK_TOKENS = int(os.getenv("STUDYMATE_RETRIEVAL_CHUNK_TOKENS", "400"))
+RETRIEVAL_CHUNK_OVERLAP_TOKENS = int(os.getenv("STUDYMATE_RETRIEVAL_CHUNK_OVERLAP_TOKENS", "40"))
+# Token budget of the course excerpts added to the A7 and A9 prompts.
+RETRIEVAL_EXCERPT_TOKENS = int(os.getenv("STUDYMATE_RETRIEVAL_EXCERPT_TOKENS", "1500"))
+# Days a built index is kept on disk, and number of indexes kept in memory.
+RETRIEVAL_CACHE_TTL = float(os.getenv("STUDYMATE_RETRIEVAL_CACHE_TTL_DAYS", "30")) * 24 * 3600
+RETRIEVAL_MEMORY_ENTRIES = 16
+
+# BM25 parameters (the usual defaults).
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def _terms(text: str) -> List[str]:
+    return [word[:PREFIX_LENGTH] for word in tokenize(text)]
+
+
+class DocumentIndex:
+    """
+    BM25 index over the passages of one uploaded document.
+
+    The document is cut into RETRIEVAL_CHUNK_TOKENS-token passages along paragraph
+    boundaries; queries return the best passages, which are handed to the agents
+    instead of the whole document.
+    """
+
+    def __init__(self, doc_id: str, chunks: List[str], term_freqs: Optional[List[Dict[str, int]]] = None) -> None:
+        self.doc_id = doc_id
+        self.chunks = chunks
+        self.term_freqs = term_freqs if term_freqs is not None else [dict(Counter(_terms(c))) for c in chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        doc_freq: Counter = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+        self.tokens = sum(count_tokens(c) for c in chunks)
+
+    @classmethod
+    def build(cls, text: str, doc_id: Optional[str] = None) -> "DocumentIndex":
+        """
+        Chunk and index text.
+        """
+        chunks = list(iter_chunks(text, RETRIEVAL_CHUNK_TOKENS, RETRIEVAL_CHUNK_OVERLAP_TOKENS))
+        return cls(doc_id or document_id(text), chunks)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[int, float]]:
+        """
+        Return up to k (passage index, score) pairs, best first; passages sharing no
+        term with the query are never returned.
+        """
+        terms = [term for term in set(_terms(query)) if term in self.idf]
+        if not terms:
+            return []
+        scores: List[Tuple[int, float]] = []
+        for idx, tf in enumerate(self.term_freqs):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[idx] / (self.avg_length or 1))
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (BM25_K1 + 1) / (freq + norm)
+            if score > 0:
+                scores.append((idx, score))
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:k]
+
+    def passages(self, query: str, max_tokens: int = RETRIEVAL_EXCERPT_TOKENS) -> str:
+        """
+        Best passages for query that fit in max_tokens, joined in document order.
+        """
+        chosen: List[int] = []
+        used = 0
+        for idx, _ in self.search(query, k=len(self.chunks)):
+            size = count_tokens(self.chunks[idx])
+            if used + size > max_tokens:
+                continue
+            chosen.append(idx)
+            used += size
+            if used >= max_tokens:
+                break
+        return "\n\n[...]\n\n".join(self.chunks[idx] for idx in sorted(chosen))
+
+    def context_for(self, query: str, max_tokens: int) -> str:
+        """
+        The whole document when it fits in max_tokens, otherwise the passages most
+        relevant to query. Falls back to the whole document when nothing matches, so
+        the caller can still condense it.
+        """
+        if self.tokens <= max_tokens:
+            return "\n\n".join(self.chunks)
+        return self.passages(query, max_tokens) or "\n\n".join(self.chunks)
+
+    def to_json(self) -> Dict[str, object]:
+        return {"chunks": self.chunks, "term_freqs": self.term_freqs}
+
+
+def document_id(text: str) -> str:
+    """
+    Content hash identifying a document's text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _get_retrieval_cache() -> SQLiteCache:
+    return get_cache("retrieval", default_ttl=RETRIEVAL_CACHE_TTL, compress=True)
+
+
+_indexes: "OrderedDict[str, DocumentIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_document_index(text: str) -> DocumentIndex:
+    """
+    Return the index of text, building it once per document.
+
+    Indexes are kept in memory for the most recent documents and on disk (keyed by
+    content hash, with chunking settings) so re-uploads and later sessions skip the
+    build.
+    """
+    doc_id = document_id(text)
+    with _indexes_lock:
+        index = _indexes.get(doc_id)
+        if index is not None:
+            _indexes.move_to_end(doc_id)
+            return index
+
+    cache = _get_retrieval_cache()
+    key = SQLiteCache.make_key(doc_id, RETRIEVAL_CHUNK_TOKENS, RETRIEVAL_CHUNK_OVERLAP_TOKENS, PREFIX_LENGTH)
+    stored = cache.get(key)
+    if stored is not None:
+        index = DocumentIndex(doc_id, stored["chunks"], stored["term_freqs"])
+    else:
+        index = DocumentIndex.build(text, doc_id)
+        cache.set(key, index.to_json())
+
+    with _indexes_lock:
+        _indexes[doc_id] = index
+        while len(_indexes) > RETRIEVAL_MEMORY_ENTRIES:
+            _indexes.popitem(last=False)
+    return index
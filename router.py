@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage, BaseMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from ratelimit import get_limiter, is_rate_limited, retry_after
+
+# Engines the "auto" router may use, in order of preference when nothing is known yet.
+ROUTER_ENGINES = [
+    engine.strip().lower()
+    for engine in os.getenv("STUDYMATE_ROUTER_ENGINES", "openai,deepseek,gemini,grok").split(",")
+    if engine.strip()
+]
+# Consecutive failures that open an engine's circuit breaker, and how long it stays open.
+ROUTER_BREAKER_FAILURES = int(os.getenv("STUDYMATE_ROUTER_BREAKER_FAILURES", "3"))
+ROUTER_BREAKER_COOLDOWN = float(os.getenv("STUDYMATE_ROUTER_BREAKER_COOLDOWN", "30"))
+# Weight of the newest observation in the latency and error-rate moving averages.
+ROUTER_EWMA_ALPHA = 0.2
+
+_RATELIMIT_HEADERS = (
+    ("x-ratelimit-remaining-requests", "x-ratelimit-limit-requests"),
+    ("x-ratelimit-remaining-tokens", "x-ratelimit-limit-tokens"),
+)
+
+
+@dataclass
+class EngineHealth:
+    """
+    What the router has observed about one engine.
+
+    latency and error_rate are exponentially weighted moving averages; headroom is
+    the share of the engine's rate limit still available (1.0 when unknown).
+    """
+
+    latency: Optional[float] = None
+    error_rate: float = 0.0
+    headroom: float = 1.0
+    failures: int = 0
+    open_until: float = 0.0
+    calls: int = 0
+
+    def score(self) -> float:
+        """
+        Lower is better: expected latency inflated by errors and scarce rate limit.
+        """
+        latency = self.latency if self.latency is not None else 0.5
+        return latency * (1 + 4 * self.error_rate) / max(self.headroom, 0.05)
+
+
+def _as_chunk(message: BaseMessage) -> BaseMessageChunk:
+    # Models without native streaming yield their whole answer as one message.
+    if isinstance(message, BaseMessageChunk):
+        return message
+    return AIMessageChunk(content=message.content, response_metadata=message.response_metadata)
+
+
+def _headroom(message: BaseMessage) -> Optional[float]:
+    headers = (getattr(message, "response_metadata", None) or {}).get("headers") or {}
+    shares: List[float] = []
+    for remaining_key, limit_key in _RATELIMIT_HEADERS:
+        try:
+            remaining, limit = float(headers[remaining_key]), float(headers[limit_key])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if limit > 0:
+            shares.append(remaining / limit)
+    return min(shares) if shares else None
+
+
+class EngineRouter(BaseChatModel):
+    """
+    Chat model that spreads requests over several engines ("auto" in get_llm).
+
+    Each request goes to an engine drawn at random with weight 1/score, so faster,
+    healthier engines with more rate-limit headroom get most of the traffic while
+    the others keep being sampled. An engine whose call fails is skipped and the
+    next one is tried; after ROUTER_BREAKER_FAILURES consecutive failures (or a
+    rate-limit error) its circuit breaker opens for ROUTER_BREAKER_COOLDOWN seconds
+    (or the provider's Retry-After); the first call after the cooldown closes it
+    again or reopens it. Engines whose client cannot be built (e.g. no API key) are
+    skipped.
+    """
+
+    engines: List[str]
+    resolve: Callable[[str], Any]
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _health: Dict[str, EngineHealth] = PrivateAttr(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "auto-router"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"engines": list(self.engines)}
+
+    def _state(self, engine: str) -> EngineHealth:
+        health = self._health.get(engine)
+        if health is None:
+            health = self._health[engine] = EngineHealth()
+        return health
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Snapshot of the observed state of every engine.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return {
+                engine: {
+                    "latency": health.latency,
+                    "error_rate": health.error_rate,
+                    "headroom": health.headroom,
+                    "calls": health.calls,
+                    "open": health.open_until > now,
+                }
+                for engine, health in ((e, self._state(e)) for e in self.engines)
+            }
+
+    def _ranked(self) -> List[str]:
+        """
+        Engines in the order to try them for one request.
+        """
+        now = time.monotonic()
+        with self._lock:
+            ready: List[Tuple[str, float]] = []
+            blocked: List[str] = []
+            for engine in self.engines:
+                health = self._state(engine)
+                if health.open_until > now:
+                    blocked.append(engine)
+                    continue
+                ready.append((engine, 1.0 / health.score()))
+
+        order: List[str] = []
+        while ready:
+            pick = random.uniform(0, sum(weight for _, weight in ready))
+            for idx, (engine, weight) in enumerate(ready):
+                pick -= weight
+                if pick <= 0 or idx == len(ready) - 1:
+                    order.append(engine)
+                    ready.pop(idx)
+                    break
+        # Engines with an open breaker are a last resort when everything else failed.
+        return order + blocked
+
+    def _success(self, engine: str, seconds: float, message: Optional[BaseMessage]) -> None:
+        with self._lock:
+            health = self._state(engine)
+            health.calls += 1
+            health.latency = (
+                seconds
+                if health.latency is None
+                else (1 - ROUTER_EWMA_ALPHA) * health.latency + ROUTER_EWMA_ALPHA * seconds
+            )
+            health.error_rate *= 1 - ROUTER_EWMA_ALPHA
+            health.failures = 0
+            health.open_until = 0.0
+            headroom = _headroom(message) if message is not None else None
+            if headroom is None:
+                # No rate-limit headers: recover gradually from an earlier 429.
+                headroom = (1 - ROUTER_EWMA_ALPHA) * health.headroom + ROUTER_EWMA_ALPHA
+            health.headroom = headroom
+
+    def _failure(self, engine: str, exc: BaseException) -> None:
+        with self._lock:
+            health = self._state(engine)
+            health.calls += 1
+            health.error_rate = (1 - ROUTER_EWMA_ALPHA) * health.error_rate + ROUTER_EWMA_ALPHA
+            health.failures += 1
+            if is_rate_limited(exc):
+                health.headroom = 0.0
+                wait = retry_after(exc)
+                health.open_until = time.monotonic() + (wait or ROUTER_BREAKER_COOLDOWN)
+                # Direct users of the engine should back off as well.
+                get_limiter(engine).penalize(wait)
+            elif health.failures >= ROUTER_BREAKER_FAILURES or health.open_until:
+                # Also reopen at once when the first call after a cooldown fails.
+                health.open_until = time.monotonic() + ROUTER_BREAKER_COOLDOWN
+
+    def _client(self, engine: str) -> Optional[Any]:
+        try:
+            return self.resolve(engine)
+        except Exception:
+            return None
+
+    def reset(self) -> None:
+        """
+        Forget everything observed, e.g. after API keys changed.
+        """
+        with self._lock:
+            self._health.clear()
+
+    def _no_engine(self, errors: List[Tuple[str, BaseException]]) -> Exception:
+        if not errors:
+            return RuntimeError(
+                "No AI engine is configured for auto mode. Add an API key to your .env file."
+            )
+        if len(errors) == 1:
+            return errors[0][1]
+        return RuntimeError("All AI engines failed: " + "; ".join(f"{e}: {x}" for e, x in errors))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        errors: List[Tuple[str, BaseException]] = []
+        for engine in self._ranked():
+            client = self._client(engine)
+            if client is None:
+                continue
+            started = time.perf_counter()
+            try:
+                message = client.invoke(messages, stop=stop, **kwargs)
+            except Exception as exc:
+                self._failure(engine, exc)
+                errors.append((engine, exc))
+                continue
+            self._success(engine, time.perf_counter() - started, message)
+            return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"engine": engine})
+        raise self._no_engine(errors)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        errors: List[Tuple[str, BaseException]] = []
+        for engine in self._ranked():
+            client = self._client(engine)
+            if client is None:
+                continue
+            started = time.perf_counter()
+            try:
+                message = await client.ainvoke(messages, stop=stop, **kwargs)
+            except Exception as exc:
+                self._failure(engine, exc)
+                errors.append((engine, exc))
+                continue
+            self._success(engine, time.perf_counter() - started, message)
+            return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"engine": engine})
+        raise self._no_engine(errors)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        errors: List[Tuple[str, BaseException]] = []
+        for engine in self._ranked():
+            client = self._client(engine)
+            if client is None:
+                continue
+            started = time.perf_counter()
+            sent = False
+            try:
+                for chunk in client.stream(messages, stop=stop, **kwargs):
+                    generation = ChatGenerationChunk(message=_as_chunk(chunk))
+                    sent = True
+                    if run_manager is not None:
+                        run_manager.on_llm_new_token(generation.text, chunk=generation)
+                    yield generation
+            except Exception as exc:
+                self._failure(engine, exc)
+                if sent:
+                    # Part of the answer is already out; another engine cannot continue it.
+                    raise
+                errors.append((engine, exc))
+                continue
+            self._success(engine, time.perf_counter() - started, None)
+            return
+        raise self._no_engine(errors)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        errors: List[Tuple[str, BaseException]] = []
+        for engine in self._ranked():
+            client = self._client(engine)
+            if client is None:
+                continue
+            started = time.perf_counter()
+            sent = False
+            try:
+                async for chunk in client.astream(messages, stop=stop, **kwargs):
+                    generation = ChatGenerationChunk(message=_as_chunk(chunk))
+                    sent = True
+                    if run_manager is not None:
+                        await run_manager.on_llm_new_token(generation.text, chunk=generation)
+                    yield generation
+            except Exception as exc:
+                self._failure(engine, exc)
+                if sent:
+                    raise
+                errors.append((engine, exc))
+                continue
+            self._success(engine, time.perf_counter() - started, None)
+            return
+        raise self._no_engine(errors)
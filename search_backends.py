@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+)
+
+from ddgs import DDGS
+from ddgs.exceptions import DDGSException, RatelimitException, TimeoutException
+
+from ratelimit import FairRateLimiter, RateLimitTimeout, get_limiter
+
+# Maximum number of DDGS clients kept alive (and queries in flight) per process; at
+# least the 5 queries one study pack fans out, so none of them waits for a client.
+DDGS_POOL_SIZE = int(os.getenv("STUDYMATE_DDGS_POOL_SIZE", "8"))
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "studymate_search_deadline", default=None
+)
+
+
+@contextmanager
+def search_deadline(seconds: float) -> Iterator[None]:
+    """
+    Give the searches made inside the with-block seconds to finish.
+
+    utils.search_many sets it for every query; backends drop a query that is still
+    waiting for a rate limiter slot or a client when it runs out, instead of
+    spending the slot on an answer nobody waits for any more.
+    """
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def search_time_left() -> Optional[float]:
+    """
+    Seconds left before the current search_deadline(), or None without one.
+    """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class SearchBackend(Protocol):
+    """
+    Anything that can answer a web-style text query.
+
+    text() returns result dicts with "title", "href" and "body" keys and raises on
+    failure; utils turns exceptions into "Search error" results and caches answers.
+    """
+
+    name: str
+
+    def text(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        ...
+
+
+class DDGSPool:
+    """
+    Bounded, thread-safe pool of long-lived DDGS clients.
+
+    A DDGS instance keeps its search engines and their HTTP sessions between
+    queries, so reusing it skips TLS and cookie setup on every search. Each client
+    is lent to one thread at a time; at most max_size clients exist and callers
+    beyond that wait for a free one. A client whose query fails is dropped and
+    replaced by a fresh one on the next checkout.
+    """
+
+    def __init__(self, max_size: int = DDGS_POOL_SIZE, factory: Callable[[], Any] = DDGS) -> None:
+        self.max_size = max_size
+        self._factory = factory
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle: List[Any] = []
+        self._created = 0
+        self._reused = 0
+        self._discarded = 0
+
+    @contextmanager
+    def client(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        """
+        Check out a client for the duration of the with-block, waiting at most
+        timeout seconds for one (TimeoutError).
+        """
+        if not self._slots.acquire(timeout=None if timeout is None else max(0.0, timeout)):
+            raise TimeoutError(f"No DDGS client free within {timeout:g} seconds.")
+        try:
+            with self._lock:
+                client = self._idle.pop() if self._idle else None
+                if client is None:
+                    self._created += 1
+                else:
+                    self._reused += 1
+            if client is None:
+                client = self._factory()
+            try:
+                yield client
+            except Exception:
+                with self._lock:
+                    self._discarded += 1
+                raise
+            else:
+                with self._lock:
+                    self._idle.append(client)
+        finally:
+            self._slots.release()
+
+    def clear(self) -> None:
+        """
+        Drop every idle client so the next queries open fresh sessions.
+        """
+        with self._lock:
+            self._discarded += len(self._idle)
+            self._idle.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return how many clients were created, reused and discarded.
+        """
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "idle": len(self._idle),
+                "created": self._created,
+                "reused": self._reused,
+                "discarded": self._discarded,
+            }
+
+
+class DDGSBackend:
+    """
+    Live web search through DDGS, using a pool of long-lived clients.
+
+    Every query waits for a slot of the shared "search" rate limiter, so all
+    sessions together stay under the search engines' throttling threshold; a
+    rate-limit answer holds the limiter back for everyone. Under a
+    search_deadline() the query is dropped when no slot or client is free in time.
+    """
+
+    name = "ddgs"
+
+    def __init__(self, pool: Optional[DDGSPool] = None, limiter: Optional[FairRateLimiter] = None) -> None:
+        self.pool = pool or DDGSPool()
+        self.limiter = limiter or get_limiter("search")
+
+    def text(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        for attempt in range(2):
+            left = search_time_left()
+            if left is not None and left <= 0:
+                raise TimeoutError("Search deadline passed before the query was sent.")
+            try:
+                self.limiter.acquire_for(timeout=left)
+            except RateLimitTimeout as exc:
+                raise TimeoutError(f"Search dropped: {exc}") from exc
+            try:
+                with self.pool.client(timeout=search_time_left()) as ddgs:
+                    try:
+                        # ddgs.text returns a list of dicts: {"title","href","body",...}
+                        return list(ddgs.text(query, max_results=max_results))
+                    except DDGSException as exc:
+                        # DDGS reports an empty result set as an exception.
+                        if str(exc) == "No results found.":
+                            return []
+                        raise
+            except RatelimitException:
+                self.limiter.penalize()
+                raise
+            except (TimeoutException, TimeoutError):
+                raise
+            except Exception:
+                # The failed client was discarded; retry once on a fresh connection.
+                if attempt:
+                    raise
+        return []
+
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_OPERATOR_RE = re.compile(r"\b(site|filetype):(\S+)", re.IGNORECASE)
+# Words the agents add to every query to steer web search; they match most of a
+# curated course corpus and only slow down ranking, so the local index ignores them.
+_QUERY_NOISE = frozenset(
+    "and or course explanation pdf tutorial project example lab exercise exam".split()
+)
+
+
+class LocalIndexBackend:
+    """
+    Offline full-text search over a curated corpus of course links (SQLite FTS5).
+
+    Records are {"title", "href", "body"} dicts. Links containing all query words
+    come first, then links containing any of them, each ranked with BM25; the
+    site: and filetype: operators used by the agents become filters on the link.
+    Lookups need no network and take a few milliseconds on tens of thousands of
+    links; repeated queries are then answered by the search cache in utils.
+    """
+
+    name = "local"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS links USING fts5(
+                title, body, href UNINDEXED, tokenize = 'unicode61 remove_diacritics 2'
+            )
+            """
+        )
+        self._conn.commit()
+
+    def add_many(self, records: Iterable[Dict[str, str]]) -> int:
+        """
+        Add link records to the index and return how many were added.
+        """
+        rows = [
+            (
+                r.get("title") or "",
+                r.get("body") or r.get("description") or "",
+                r.get("href") or r.get("url") or "",
+            )
+            for r in records
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT INTO links (title, body, href) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+        return len(rows)
+
+    def load_json(self, path: str) -> int:
+        """
+        Add the records of a JSON file (a list of link dicts) to the index.
+        """
+        with open(path, "r", encoding="utf-8") as fh:
+            return self.add_many(json.load(fh))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+
+    @staticmethod
+    def _parse_query(query: str) -> Tuple[str, List[str]]:
+        filters: List[str] = []
+        for operator, value in _OPERATOR_RE.findall(query):
+            if operator.lower() == "site":
+                filters.append(value.lower())
+            else:
+                filters.append("." + value.lower())
+        words = [
+            word
+            for word in _WORD_RE.findall(_OPERATOR_RE.sub(" ", query))
+            if word.lower() not in _QUERY_NOISE
+        ]
+        return ['"' + word + '"' for word in words], filters
+
+    def _match(self, match: str, filters: List[str], limit: int) -> List[Tuple[str, str, str]]:
+        sql = "SELECT title, href, body FROM links WHERE links MATCH ?"
+        params: List[Any] = [match]
+        if filters:
+            sql += " AND (" + " OR ".join("lower(href) LIKE ?" for _ in filters) + ")"
+            params.extend(f"%{f}%" for f in filters)
+        # Title matches weigh more than body matches.
+        sql += " ORDER BY bm25(links, 5.0, 1.0) LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def text(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        terms, filters = self._parse_query(query)
+        if not terms:
+            return []
+        # Links containing every word first (selective, fast); any word only if needed.
+        rows = self._match(" ".join(terms), filters, max_results)
+        if len(rows) < max_results and len(terms) > 1:
+            seen = {href for _, href, _ in rows}
+            for row in self._match(" OR ".join(terms), filters, max_results + len(rows)):
+                if row[1] not in seen and len(rows) < max_results:
+                    rows.append(row)
+                    seen.add(row[1])
+        return [{"title": title, "href": href, "body": body} for title, href, body in rows]
+
+
+class TieredBackend:
+    """
+    Ask backends in order and return the first answer with at least min_results hits.
+
+    Typically the local index first and DDGS second, so popular queries are served
+    locally and only the long tail reaches the network.
+    """
+
+    def __init__(self, backends: Sequence[SearchBackend], min_results: int = 1) -> None:
+        if not backends:
+            raise ValueError("TieredBackend needs at least one backend.")
+        self.backends = list(backends)
+        self.min_results = min_results
+        self.name = "+".join(backend.name for backend in self.backends)
+
+    def text(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        results: List[Dict[str, str]] = []
+        last_error: Optional[Exception] = None
+        for backend in self.backends:
+            try:
+                results = backend.text(query, max_results=max_results)
+            except Exception as exc:
+                last_error = exc
+                continue
+            if len(results) >= min(self.min_results, max_results):
+                return results
+        if not results and last_error is not None:
+            raise last_error
+        return results
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from cache import SQLiteCache
+from pack_store import PackStore, is_complete, pack_key
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PackStore(SQLiteCache("packs", path=str(tmp_path / "packs.sqlite3")))
+
+
+def complete_pack():
+    return {"outputs": {"A4_Summarizer": "notes"}, "errors": {}}
+
+
+def test_pack_key_ignores_case_spacing_and_target_order():
+    assert pack_key("Physics ", "Optics", "openai", ["A4", "A7"]) == pack_key(
+        "physics", " OPTICS", "openai", ["A7", "A4"]
+    )
+    assert pack_key("Physics", "Optics", "openai", ["A4"], guide_mode=True) != pack_key(
+        "Physics", "Optics", "openai", ["A4"], guide_mode=False
+    )
+
+
+def test_concurrent_requests_build_once(store):
+    builds = []
+    release = threading.Event()
+
+    def build():
+        builds.append(1)
+        release.wait(5)
+        return complete_pack()
+
+    sources = []
+    lock = threading.Lock()
+
+    def request():
+        pack, source = store.get_or_build("key", build)
+        with lock:
+            sources.append(source)
+        assert pack == complete_pack()
+
+    threads = [threading.Thread(target=request) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while store.stats()["in_flight"] != 1 or not builds:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(builds) == 1
+    assert sorted(sources) == ["built"] + ["shared"] * 4
+    assert store.get_or_build("key", build) == (complete_pack(), "stored")
+    assert len(builds) == 1
+
+
+def test_async_requests_build_once(store):
+    builds = []
+
+    async def build():
+        builds.append(1)
+        await asyncio.sleep(0.05)
+        return complete_pack()
+
+    async def main():
+        return await asyncio.gather(*(store.aget_or_build("key", build) for _ in range(4)))
+
+    results = asyncio.run(main())
+    assert len(builds) == 1
+    assert sorted(source for _, source in results) == ["built"] + ["shared"] * 3
+
+
+def test_incomplete_pack_is_not_stored(store):
+    failed = {"outputs": {"A4_Summarizer": "[A4_Summarizer ERROR] boom"}, "errors": {}}
+    assert not is_complete(failed)
+    assert not is_complete({"outputs": {"A7_AI_Companion": {"error": "no questions"}}})
+    assert store.get_or_build("key", lambda: failed) == (failed, "built")
+    assert store.get("key") is None
+
+
+def test_build_error_reaches_waiting_requests(store):
+    started = threading.Event()
+    release = threading.Event()
+
+    def build():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("model down")
+
+    errors = []
+
+    def leader():
+        with pytest.raises(RuntimeError):
+            store.get_or_build("key", build)
+
+    def follower():
+        try:
+            store.get_or_build("key", lambda: pytest.fail("follower must not build"))
+        except RuntimeError as exc:
+            errors.append(str(exc))
+
+    first = threading.Thread(target=leader)
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=follower)
+    second.start()
+    time.sleep(0.05)
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert errors == ["model down"]
+    assert store.stats()["in_flight"] == 0
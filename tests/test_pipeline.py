@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from pipeline import Node, Pipeline
+
+
+def test_nodes_run_after_their_dependencies_and_overlap():
+    async def slow(name):
+        await asyncio.sleep(0.1)
+        return name
+
+    pipeline = Pipeline([
+        Node("a", lambda deps: slow("a")),
+        Node("b", lambda deps: slow("b")),
+        Node("c", lambda deps: deps["a"] + deps["b"], ("a", "b")),
+    ])
+    result = pipeline.run()
+    assert result.outputs == {"a": "a", "b": "b", "c": "ab"}
+    assert result.timings["c"].start >= max(result.timings["a"].end, result.timings["b"].end)
+    assert result.total_seconds < 0.19
+
+
+def test_raising_node_records_an_error_output():
+    def boom(deps):
+        raise RuntimeError("model down")
+
+    result = Pipeline([Node("a", boom)]).run()
+    assert result.outputs["a"] == "[a ERROR] model down"
+    assert result.errors == {"a": "model down"}
+
+
+def test_error_output_short_circuits_downstream_nodes():
+    calls = []
+
+    def record(name, value):
+        def func(deps):
+            calls.append(name)
+            return value
+
+        return func
+
+    pipeline = Pipeline([
+        Node("search", record("search", "[A1_Everything ERROR] no results")),
+        Node("quiz", record("quiz", {"error": "no questions"})),
+        Node("clean", record("clean", "ok"), ("search",)),
+        Node("summary", record("summary", "ok"), ("clean",)),
+        Node("guide", record("guide", "ok"), ("quiz",)),
+        Node("other", record("other", "ok")),
+    ])
+    result = pipeline.run()
+    assert sorted(calls) == ["other", "quiz", "search"]
+    assert result.outputs["clean"] == "[clean ERROR] upstream search failed"
+    assert result.outputs["summary"] == "[summary ERROR] upstream clean failed"
+    assert result.outputs["guide"] == "[guide ERROR] upstream quiz failed"
+    assert result.outputs["other"] == "ok"
+
+
+def test_subset_keeps_targets_and_their_dependencies():
+    pipeline = Pipeline([
+        Node("a", lambda deps: 1),
+        Node("b", lambda deps: deps["a"] + 1, ("a",)),
+        Node("c", lambda deps: 3),
+    ])
+    assert set(pipeline.subset(["b"]).nodes) == {"a", "b"}
+
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(ValueError):
+        Pipeline([Node("a", lambda deps: 1, ("missing",))])
+    with pytest.raises(ValueError):
+        Pipeline([Node("a", lambda deps: 1, ("b",)), Node("b", lambda deps: 1, ("a",))])
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+from ratelimit import FairRateLimiter, RateLimitTimeout
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.go = threading.Event()
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        # Time only moves once the test has queued every request.
+        self.go.wait(5)
+        self.now += seconds
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out waiting for the limiter"
+        time.sleep(0.001)
+
+
+def test_burst_is_granted_without_waiting():
+    clock = FakeClock()
+    limiter = FairRateLimiter("test", rate=1.0, capacity=3, clock=clock, sleep=clock.sleep)
+    assert [limiter.acquire_for(session="a") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire(blocking=False) is False
+    assert limiter.stats()["granted"] == 3
+
+
+def test_sessions_are_served_round_robin():
+    clock = FakeClock()
+    limiter = FairRateLimiter("test", rate=1.0, capacity=1, clock=clock, sleep=clock.sleep)
+    limiter.acquire_for(session="warmup")  # empty the bucket
+
+    waited = {}
+    threads = []
+    for label, session in [("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b"), ("b2", "b")]:
+        def request(label=label, session=session):
+            waited[label] = limiter.acquire_for(session=session)
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: limiter.stats()["waiting"] == len(threads))
+    clock.go.set()
+    for thread in threads:
+        thread.join(5)
+
+    # One request per second at rate 1, so the wait gives each request's turn.
+    order = sorted(waited, key=waited.get)
+    assert order == ["a1", "b1", "a2", "b2", "a3"]
+    assert [waited[label] for label in order] == pytest.approx([1.0, 2.0, 3.0, 4.0, 5.0])
+    assert limiter.stats()["waiting"] == 0
+
+
+def test_acquire_times_out_and_leaves_the_queue():
+    clock = FakeClock()
+    clock.go.set()
+    limiter = FairRateLimiter("test", rate=0.1, capacity=1, clock=clock, sleep=clock.sleep)
+    limiter.acquire_for(session="a")
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire_for(session="b", timeout=2.0)
+    assert clock.now == pytest.approx(2.0)
+    assert limiter.stats()["waiting"] == 0
+
+
+def test_zero_rate_disables_limiting():
+    limiter = FairRateLimiter("test", rate=0.0)
+    assert limiter.acquire_for(session="a", timeout=0) == 0.0
+    assert limiter.acquire(blocking=False) is True
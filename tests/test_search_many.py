@@ -0,0 +1,71 @@
+import threading
+import time
+
+from ratelimit import current_session, session_scope
+from search_backends import search_time_left
+from utils import search_many
+
+
+def stub_search(results, delay=0.0):
+    def search(query, max_results=5):
+        time.sleep(delay)
+        return [{"title": f"{query} {i}", "href": f"https://example.com/{i}", "body": ""} for i in range(results)][:max_results]
+
+    return search
+
+
+def test_yields_results_as_each_query_completes():
+    jobs = {
+        "slow": (stub_search(3, delay=0.3), "slow", 2),
+        "fast": (stub_search(3), "fast", 3),
+    }
+    got = list(search_many(jobs, timeout=5))
+    assert [key for key, _ in got] == ["fast", "slow"]
+    assert len(dict(got)["fast"]) == 3
+    assert len(dict(got)["slow"]) == 2
+
+
+def test_slow_query_times_out_without_delaying_the_others():
+    jobs = {
+        "hang": (stub_search(1, delay=2.0), "hang", 5),
+        "fast": (stub_search(1, delay=0.05), "fast", 5),
+    }
+    started = time.monotonic()
+    got = dict(search_many(jobs, timeout=0.3))
+    assert time.monotonic() - started < 1.5
+    assert got["fast"][0]["title"] == "fast 0"
+    assert got["hang"][0]["title"] == "Search error"
+    assert "timed out" in got["hang"][0]["body"]
+
+
+def test_timeout_counts_from_when_each_query_starts():
+    # With one worker the second query starts late but still gets its full budget.
+    jobs = {key: (stub_search(1, delay=0.2), key, 5) for key in ("first", "second")}
+    got = dict(search_many(jobs, timeout=0.35, max_workers=1))
+    assert got["first"][0]["title"] == "first 0"
+    assert got["second"][0]["title"] == "second 0"
+
+
+def test_failed_query_becomes_an_error_result():
+    def broken(query, max_results=5):
+        raise RuntimeError("backend down")
+
+    got = dict(search_many({"q": (broken, "q", 5)}, timeout=5))
+    assert got["q"][0]["title"] == "Search error"
+    assert "backend down" in got["q"][0]["body"]
+
+
+def test_workers_see_the_deadline_and_the_caller_session():
+    seen = {}
+    lock = threading.Lock()
+
+    def search(query, max_results=5):
+        with lock:
+            seen[query] = (search_time_left(), current_session())
+        return []
+
+    with session_scope("student-a"):
+        list(search_many({"q": (search, "q", 5)}, timeout=3))
+    left, session = seen["q"]
+    assert 0 < left <= 3
+    assert session == "student-a"
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import os
+import re
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Words, numbers and single punctuation marks, roughly what BPE tokenizers split on.
+_PIECE_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Cheap local estimate of the number of LLM tokens in text.
+
+    Each word or punctuation mark counts as one token, plus one more for every six
+    characters beyond the first in long words. This slightly over-counts compared
+    to real BPE tokenizers, which is the safe side for budgeting prompts.
+    """
+    if not text:
+        return 0
+    return sum(1 + (len(piece) - 1) // 6 for piece in _PIECE_RE.findall(text))
+
+
+# Exact tokenizers registered per engine; engines without one use count_tokens.
+_TOKENIZERS: Dict[str, Callable[[str], int]] = {}
+
+
+def register_tokenizer(engine: str, counter: Callable[[str], int]) -> None:
+    """
+    Use counter to count tokens for engine (e.g. a provider's own tokenizer library).
+    """
+    _TOKENIZERS[engine.lower()] = counter
+
+
+def get_token_counter(engine: Optional[str] = None) -> Callable[[str], int]:
+    """
+    Return the token counting function for engine, defaulting to count_tokens.
+    """
+    return _TOKENIZERS.get((engine or "").lower(), count_tokens)
+
+
+# tiktoken encoding used to count tokens for the openai engine (installed with
+# langchain-openai). Its vocabulary file is downloaded and cached on first use.
+OPENAI_ENCODING = os.getenv("STUDYMATE_OPENAI_ENCODING", "o200k_base")
+_openai_encoding = None  # tiktoken.Encoding once loaded, False if loading failed
+_openai_encoding_lock = threading.Lock()
+
+
+def _count_openai_tokens(text: str) -> int:
+    """
+    Exact token count for OpenAI models, or count_tokens when the encoding cannot
+    be loaded (e.g. offline without a cached vocabulary file).
+    """
+    global _openai_encoding
+    if _openai_encoding is None:
+        with _openai_encoding_lock:
+            if _openai_encoding is None:
+                try:
+                    _openai_encoding = tiktoken.get_encoding(OPENAI_ENCODING)
+                except Exception:
+                    _openai_encoding = False
+    if not _openai_encoding:
+        return count_tokens(text)
+    if not text:
+        return 0
+    return len(_openai_encoding.encode(text, disallowed_special=()))
+
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+else:
+    register_tokenizer("openai", _count_openai_tokens)
+
+
+def _split_oversized(unit: str, max_tokens: int) -> Iterator[str]:
+    """
+    Break a unit larger than max_tokens into sentences, then into word runs.
+    """
+    sentences = _SENTENCE_RE.split(unit)
+    if len(sentences) > 1:
+        for sentence in sentences:
+            if count_tokens(sentence) > max_tokens:
+                yield from _split_oversized(sentence, max_tokens)
+            elif sentence.strip():
+                yield sentence
+        return
+
+    words: List[str] = []
+    size = 0
+    for word in unit.split():
+        word_tokens = count_tokens(word)
+        if words and size + word_tokens > max_tokens:
+            yield " ".join(words)
+            words, size = [], 0
+        words.append(word)
+        size += word_tokens
+    if words:
+        yield " ".join(words)
+
+
+def _tail_tokens(text: str, max_tokens: int) -> str:
+    """
+    The last whole sentences of text that fit in max_tokens, or its last words when
+    even the final sentence is longer.
+    """
+    if max_tokens <= 0:
+        return ""
+    kept: List[str] = []
+    size = 0
+    for sentence in reversed(_SENTENCE_RE.split(text.strip())):
+        sentence_tokens = count_tokens(sentence)
+        if size + sentence_tokens > max_tokens:
+            break
+        kept.insert(0, sentence)
+        size += sentence_tokens
+    if kept:
+        return " ".join(kept)
+
+    words: List[str] = []
+    for word in reversed(text.split()):
+        word_tokens = count_tokens(word)
+        if size + word_tokens > max_tokens:
+            break
+        words.insert(0, word)
+        size += word_tokens
+    return " ".join(words)
+
+
+def iter_chunks(text: str, chunk_tokens: int = 3000, overlap_tokens: int = 200) -> Iterator[str]:
+    """
+    Yield pieces of text of at most chunk_tokens tokens, following paragraph and
+    sentence boundaries where possible.
+
+    Consecutive chunks share up to overlap_tokens tokens of trailing context so a
+    concept cut at a boundary still appears whole in one of them. Whole paragraphs
+    are carried over when they fit; otherwise the last sentences (or words) of the
+    previous one, so long units such as PDF pages still overlap.
+    """
+    if chunk_tokens <= 0:
+        raise ValueError("chunk_tokens must be positive.")
+    overlap_tokens = max(0, min(overlap_tokens, chunk_tokens // 2))
+
+    current: List[str] = []
+    sizes: List[int] = []
+    total = 0
+    for paragraph in _PARAGRAPH_RE.split(text):
+        if not paragraph.strip():
+            continue
+        if count_tokens(paragraph) > chunk_tokens:
+            units = list(_split_oversized(paragraph, chunk_tokens))
+        else:
+            units = [paragraph]
+        for unit in units:
+            unit_tokens = count_tokens(unit)
+            if current and total + unit_tokens > chunk_tokens:
+                yield "\n\n".join(current)
+                # Carry the tail of the previous chunk over as overlap.
+                budget = min(overlap_tokens, chunk_tokens - unit_tokens)
+                kept: List[str] = []
+                kept_sizes: List[int] = []
+                kept_total = 0
+                for prev, prev_size in zip(reversed(current), reversed(sizes)):
+                    if kept_total + prev_size > budget:
+                        tail = _tail_tokens(prev, budget - kept_total)
+                        if tail:
+                            kept.insert(0, tail)
+                            kept_sizes.insert(0, count_tokens(tail))
+                            kept_total += kept_sizes[0]
+                        break
+                    kept.insert(0, prev)
+                    kept_sizes.insert(0, prev_size)
+                    kept_total += prev_size
+                current, sizes, total = kept, kept_sizes, kept_total
+            current.append(unit)
+            sizes.append(unit_tokens)
+            total += unit_tokens
+    if current:
+        yield "\n\n".join(current)
+
+
+def split_into_chunks(text: str, chunk_tokens: int = 3000, overlap_tokens: int = 200) -> List[str]:
+    """
+    List version of iter_chunks.
+    """
+    return list(iter_chunks(text, chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens))
+
+
+def truncate_to_tokens(
+    text: str,
+    max_tokens: int,
+    marker: str = "[... truncated to fit the token budget]",
+    counter: Optional[Callable[[str], int]] = None,
+) -> str:
+    """
+    Return text cut to at most max_tokens tokens at a paragraph or sentence boundary.
+
+    Text already within budget is returned unchanged; otherwise marker is appended
+    so the model knows the input was shortened. counter measures the tokens (e.g.
+    get_token_counter(engine)); it defaults to count_tokens.
+    """
+    counter = counter or count_tokens
+    if counter(text) <= max_tokens:
+        return text
+    budget = max(1, max_tokens - counter(marker))
+    # iter_chunks sizes chunks with count_tokens: shrink its budget until the head
+    # also fits when measured with counter.
+    chunk_tokens = budget
+    while True:
+        head = next(iter_chunks(text, chunk_tokens=chunk_tokens, overlap_tokens=0), "")
+        tokens = counter(head)
+        if tokens <= budget:
+            return f"{head}\n\n{marker}"
+        if chunk_tokens == 1:
+            return marker
+        chunk_tokens = max(1, chunk_tokens * budget // tokens)
@@ -1,113 +1,628 @@
 from __future__ import annotations
 
-from typing import Dict, List
+import contextvars
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import IO, Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
 
 from io import BytesIO
 
-from ddgs import DDGS
 from pypdf import PdfReader
-from docx import Document
+from docx.oxml.ns import qn
+from lxml import etree
 
+from cache import SQLiteCache, get_cache
+from ratelimit import session_scope
+from search_backends import (
+    DDGSBackend,
+    DDGSPool,
+    LocalIndexBackend,
+    SearchBackend,
+    TieredBackend,
+    search_deadline,
+)
 
-def extract_text_from_pdf(file_obj) -> str:
+
+# PDF extraction limits: pages read per file, worker processes (0 = in-process) and
+# seconds allowed per page before it (or its page range, in process mode) is given up on.
+PDF_MAX_PAGES = int(os.getenv("STUDYMATE_PDF_MAX_PAGES", "1000"))
+PDF_WORKERS = int(os.getenv("STUDYMATE_PDF_WORKERS", "0"))
+PDF_PAGE_TIMEOUT = float(os.getenv("STUDYMATE_PDF_PAGE_TIMEOUT", "10"))
+
+# Version of the text extractors; bump it whenever their output changes so text
+# cached by an older version is not served again.
+EXTRACTOR_VERSION = 2
+
+# Start of the note appended when a slow page cut extraction short; such text is not cached.
+PDF_INCOMPLETE_NOTE = "[Incomplete extraction:"
+
+# PDF bytes shared with the extraction worker processes (set by _init_pdf_worker).
+_worker_pdf_data: Optional[bytes] = None
+
+
+class PdfPageTimeout(TimeoutError):
+    """Raised when a PDF page is not extracted within its timeout."""
+
+    def __init__(self, page: int, timeout: float) -> None:
+        super().__init__(f"Page {page + 1} could not be read within {timeout:g} seconds.")
+        self.page = page
+
+
+def _iter_reader_pages(reader: PdfReader, count: int, page_timeout: Optional[float]) -> Iterator[str]:
     """
-    Extract text from a PDF file-like object.
+    Yield the text of the first count pages of reader.
+
+    With page_timeout, pages are extracted in a background thread and PdfPageTimeout
+    is raised as soon as one takes longer; the thread cannot be interrupted, so it
+    is abandoned (it stops after the page it is stuck on).
     """
+    if not page_timeout:
+        for idx in range(count):
+            yield reader.pages[idx].extract_text() or ""
+        return
+
+    results: "queue.Queue[Tuple[str, Optional[BaseException]]]" = queue.Queue()
+    stop = threading.Event()
+
+    def work() -> None:
+        for idx in range(count):
+            if stop.is_set():
+                return
+            try:
+                results.put((reader.pages[idx].extract_text() or "", None))
+            except Exception as exc:
+                results.put(("", exc))
+                return
+
+    threading.Thread(target=work, name="pdf-pages", daemon=True).start()
     try:
-        reader = PdfReader(file_obj)
+        for idx in range(count):
+            try:
+                text, exc = results.get(timeout=page_timeout)
+            except queue.Empty:
+                raise PdfPageTimeout(idx, page_timeout) from None
+            if exc is not None:
+                raise exc
+            yield text
+    finally:
+        stop.set()
+
+
+def iter_pdf_pages(
+    file_obj,
+    max_pages: Optional[int] = None,
+    page_timeout: Optional[float] = None,
+) -> Iterator[str]:
+    """
+    Yield the text of each page of a PDF file-like object, one page at a time.
+    With page_timeout, a page slower than that raises PdfPageTimeout.
+    """
+    reader = PdfReader(file_obj)
+    count = len(reader.pages) if max_pages is None else min(len(reader.pages), max_pages)
+    yield from _iter_reader_pages(reader, count, page_timeout)
+
+
+def _init_pdf_worker(data: bytes) -> None:
+    global _worker_pdf_data
+    _worker_pdf_data = data
+
+
+def _extract_pdf_range(start: int, stop: int) -> List[str]:
+    reader = PdfReader(BytesIO(_worker_pdf_data or b""))
+    return [reader.pages[idx].extract_text() or "" for idx in range(start, stop)]
+
+
+def _read_bytes(file_obj) -> bytes:
+    # Only process mode needs the whole file in memory, to hand it to the workers.
+    if isinstance(file_obj, (bytes, bytearray, memoryview)):
+        return bytes(file_obj)
+    if hasattr(file_obj, "seek"):
+        file_obj.seek(0)
+    return file_obj.read()
+
+
+def _extract_pdf_parallel(
+    data: bytes,
+    page_count: int,
+    workers: int,
+    page_timeout: Optional[float],
+) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """
+    Extract page ranges of a PDF in worker processes.
+
+    Returns the text of the pages read and the (start, stop) ranges that did not
+    finish within page_timeout seconds per page and were skipped. The workers are
+    terminated once all ranges are collected.
+    """
+    range_size = max(1, -(-page_count // (workers * 4)))
+    ranges = [(start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+    context = multiprocessing.get_context("spawn")
+    pool = context.Pool(workers, initializer=_init_pdf_worker, initargs=(data,))
+    try:
+        pending = [pool.apply_async(_extract_pdf_range, r) for r in ranges]
         pages_text: List[str] = []
-        for page in reader.pages:
-            page_text = page.extract_text() or ""
-            pages_text.append(page_text)
-        return "\n\n".join(pages_text)
+        skipped: List[Tuple[int, int]] = []
+        for (start, stop), result in zip(ranges, pending):
+            timeout = page_timeout * (stop - start) if page_timeout else None
+            try:
+                pages_text.extend(result.get(timeout))
+            except multiprocessing.TimeoutError:
+                skipped.append((start, stop))
+        return pages_text, skipped
+    finally:
+        pool.terminate()
+
+
+def extract_text_from_pdf(
+    file_obj,
+    max_pages: Optional[int] = PDF_MAX_PAGES,
+    workers: int = PDF_WORKERS,
+    page_timeout: Optional[float] = PDF_PAGE_TIMEOUT,
+) -> str:
+    """
+    Extract text from a PDF file-like object.
+
+    Only the first max_pages pages are read. In-process, a page that takes longer
+    than page_timeout seconds ends extraction there, and the text read so far is
+    returned with a note. With workers > 0, page ranges are extracted in that many
+    processes and each range gets page_timeout seconds per page before it is
+    skipped, which adds the same note. Callers that want pages as they are read
+    can use iter_pdf_pages.
+    """
+    timed_out: Optional[PdfPageTimeout] = None
+    skipped: List[Tuple[int, int]] = []
+    try:
+        if workers and workers > 0:
+            data = _read_bytes(file_obj)
+            page_count = len(PdfReader(BytesIO(data)).pages)
+            read_count = min(page_count, max_pages) if max_pages is not None else page_count
+            pages_text, skipped = _extract_pdf_parallel(data, read_count, workers, page_timeout)
+            text = "\n\n".join(pages_text)
+        else:
+            reader = PdfReader(file_obj)
+            page_count = len(reader.pages)
+            read_count = min(page_count, max_pages) if max_pages is not None else page_count
+            pages_text = []
+            try:
+                for page_text in _iter_reader_pages(reader, read_count, page_timeout):
+                    pages_text.append(page_text)
+            except PdfPageTimeout as exc:
+                timed_out = exc
+            text = "\n\n".join(pages_text)
     except Exception as exc:
         raise RuntimeError(f"Error while reading PDF: {exc}") from exc
 
+    if timed_out is not None:
+        text += f"\n\n{PDF_INCOMPLETE_NOTE} {timed_out} Pages after it were skipped.]"
+    elif skipped:
+        pages = ", ".join(f"{start + 1}-{stop}" if stop - start > 1 else str(stop) for start, stop in skipped[:5])
+        if len(skipped) > 5:
+            pages += ", ..."
+        text += (
+            f"\n\n{PDF_INCOMPLETE_NOTE} Pages {pages} could not be read within"
+            f" {page_timeout:g} seconds per page and were skipped.]"
+        )
+    elif read_count < page_count:
+        text += f"\n\n[Only the first {read_count} of {page_count} pages were read.]"
+    return text
+
+
+# DOCX limits: size of the uploaded file and characters of text returned.
+DOCX_MAX_BYTES = int(os.getenv("STUDYMATE_DOCX_MAX_MB", "50")) * 1024 * 1024
+DOCX_MAX_CHARS = int(os.getenv("STUDYMATE_DOCX_MAX_CHARS", "5000000"))
+
+_W_BODY = qn("w:body")
+_W_P = qn("w:p")
+_W_TBL = qn("w:tbl")
+_W_TR = qn("w:tr")
+_W_TC = qn("w:tc")
+_W_T = qn("w:t")
+_W_TAB = qn("w:tab")
+_W_BREAKS = (qn("w:br"), qn("w:cr"))
+_OFFICE_DOCUMENT_REL = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+)
 
-def extract_text_from_docx(file_obj) -> str:
+
+def _as_seekable_stream(file_obj) -> IO[bytes]:
     """
-    Extract text from a DOCX file-like object.
+    Return a seekable binary stream over file_obj without copying the document.
+
+    Seekable file objects (such as Streamlit uploads) are rewound and handed through
+    as-is; bytes are wrapped in a BytesIO, which shares the buffer until written to.
     """
+    if isinstance(file_obj, (bytes, bytearray, memoryview)):
+        return BytesIO(file_obj)
+    if hasattr(file_obj, "seek") and hasattr(file_obj, "read"):
+        file_obj.seek(0)
+        return file_obj
+    return BytesIO(file_obj.read())
+
+
+def _docx_main_part(archive: zipfile.ZipFile) -> str:
     try:
-        if hasattr(file_obj, "read"):
-            data = file_obj.read()
+        rels = etree.fromstring(archive.read("_rels/.rels"))
+    except KeyError:
+        return "word/document.xml"
+    for rel in rels:
+        if rel.get("Type") == _OFFICE_DOCUMENT_REL:
+            return rel.get("Target", "word/document.xml").lstrip("/")
+    return "word/document.xml"
+
+
+def _docx_paragraph_text(paragraph) -> str:
+    parts: List[str] = []
+    for node in paragraph.iter(_W_T, _W_TAB, *_W_BREAKS):
+        if node.tag == _W_T:
+            parts.append(node.text or "")
+        elif node.tag == _W_TAB:
+            parts.append("\t")
         else:
-            data = file_obj
-        doc = Document(BytesIO(data))
-        paragraphs = [p.text for p in doc.paragraphs]
-        return "\n".join(paragraphs)
+            parts.append("\n")
+    return "".join(parts)
+
+
+def iter_docx_blocks(file_obj) -> Iterator[str]:
+    """
+    Yield the text of a DOCX document block by block, in document order.
+
+    Paragraphs are yielded as-is and each table row as its non-empty cell texts
+    joined with " | ", so content kept in tables is not lost. The document XML is
+    parsed incrementally and every block is freed once yielded, so memory use is
+    bounded by the largest single block rather than the document size.
+    """
+    stream = _as_seekable_stream(file_obj)
+    size = stream.seek(0, os.SEEK_END)
+    stream.seek(0)
+    if size > DOCX_MAX_BYTES:
+        raise ValueError(
+            f"DOCX file is {size / 1e6:.1f} MB, above the {DOCX_MAX_BYTES / 1e6:.0f} MB limit."
+        )
+
+    with zipfile.ZipFile(stream) as archive, archive.open(_docx_main_part(archive)) as xml:
+        for _, elem in etree.iterparse(xml, events=("end",), tag=(_W_P, _W_TBL)):
+            parent = elem.getparent()
+            if parent is None or parent.tag != _W_BODY:
+                continue
+            if elem.tag == _W_P:
+                yield _docx_paragraph_text(elem)
+            else:
+                for row in elem.iterchildren(_W_TR):
+                    cells = [
+                        "\n".join(_docx_paragraph_text(p) for p in cell.iter(_W_P)).strip()
+                        for cell in row.iterchildren(_W_TC)
+                    ]
+                    cells = [text for text in cells if text]
+                    if cells:
+                        yield " | ".join(cells)
+            # Free the finished block and everything before it.
+            elem.clear()
+            while elem.getprevious() is not None:
+                del parent[0]
+
+
+def extract_text_from_docx(file_obj, max_chars: Optional[int] = DOCX_MAX_CHARS) -> str:
+    """
+    Extract text from a DOCX file-like object (or its bytes), tables included.
+    Reading stops after max_chars characters.
+    """
+    try:
+        parts: List[str] = []
+        total = 0
+        truncated = False
+        for block in iter_docx_blocks(file_obj):
+            if max_chars is not None and total + len(block) > max_chars:
+                parts.append(block[: max(0, max_chars - total)])
+                truncated = True
+                break
+            parts.append(block)
+            total += len(block) + 1
+        text = "\n".join(parts)
     except Exception as exc:
         raise RuntimeError(f"Error while reading DOCX: {exc}") from exc
 
+    if truncated:
+        text += f"\n\n[Only the first {max_chars} characters of the document were read.]"
+    return text
+
+
+# Extracted-text cache for uploaded documents, keyed by the SHA-256 of the file bytes,
+# the extractor version and the extraction limits; entries expire after the TTL (days).
+DOCUMENT_CACHE_TTL = float(os.getenv("STUDYMATE_DOCUMENT_CACHE_TTL_DAYS", "30")) * 24 * 3600
+DOCUMENT_CACHE_MAX_ENTRIES = int(os.getenv("STUDYMATE_DOCUMENT_CACHE_MAX_ENTRIES", "2000"))
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv("STUDYMATE_DOCUMENT_CACHE_MAX_MB", "512")) * 1024 * 1024
+
 
-def extract_text_from_file(uploaded_file) -> str:
+def _get_document_cache() -> SQLiteCache:
+    return get_cache(
+        "documents",
+        max_entries=DOCUMENT_CACHE_MAX_ENTRIES,
+        max_bytes=DOCUMENT_CACHE_MAX_BYTES,
+        default_ttl=DOCUMENT_CACHE_TTL,
+        compress=True,
+    )
+
+
+def document_cache_stats() -> Dict[str, Any]:
+    """
+    Return hit/miss counters and size of the extracted-text cache.
+    """
+    return _get_document_cache().stats()
+
+
+# Bytes read at a time while hashing an upload.
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def _hash_stream(stream: IO[bytes]) -> str:
+    """
+    SHA-256 of a seekable stream, read in chunks and rewound afterwards.
+    """
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(HASH_CHUNK_BYTES), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def _extract_text(filename: str, stream: IO[bytes]) -> str:
+    if filename.endswith(".pdf"):
+        return extract_text_from_pdf(stream)
+    if filename.endswith(".docx"):
+        return extract_text_from_docx(stream)
+    try:
+        stream.seek(0)
+        return stream.read().decode("utf-8", errors="ignore")
+    except Exception as exc:
+        raise RuntimeError(f"Error while reading TXT file: {exc}") from exc
+
+
+def extract_text_from_file(uploaded_file, digest: Optional[str] = None) -> str:
     """
     Detect file type (by extension) and extract text.
     Supports PDF, DOCX, and plain TXT.
+
+    Extracted text is cached on disk (compressed) under the SHA-256 of the file
+    bytes, so re-uploading the same course skips parsing entirely. The upload is
+    hashed and parsed straight from its file object, without a copy of its bytes;
+    a caller that already hashed it passes digest so it is not read twice.
     """
     if uploaded_file is None:
         raise ValueError("No file uploaded.")
 
     filename = uploaded_file.name.lower()
-    if filename.endswith(".pdf"):
-        return extract_text_from_pdf(uploaded_file)
-    if filename.endswith(".docx"):
-        return extract_text_from_docx(uploaded_file)
-    if filename.endswith(".txt"):
-        try:
-            content = uploaded_file.read()
-            if isinstance(content, bytes):
-                return content.decode("utf-8", errors="ignore")
-            return str(content)
-        except Exception as exc:
-            raise RuntimeError(f"Error while reading TXT file: {exc}") from exc
+    if not filename.endswith((".pdf", ".docx", ".txt")):
+        raise ValueError("Unsupported file type. Please upload a PDF, DOCX, or TXT file.")
+
+    try:
+        stream = _as_seekable_stream(uploaded_file)
+        if isinstance(stream.read(0), str):
+            # Already text (a file opened in text mode).
+            stream.seek(0)
+            return stream.read()
+        digest = digest or _hash_stream(stream)
+    except Exception as exc:
+        raise RuntimeError(f"Error while reading uploaded file: {exc}") from exc
+
+    key = SQLiteCache.make_key(
+        EXTRACTOR_VERSION, digest, os.path.splitext(filename)[1], PDF_MAX_PAGES, DOCX_MAX_CHARS
+    )
+    cache = _get_document_cache()
+    text = cache.get(key)
+    if text is None:
+        text = _extract_text(filename, stream)
+        # The note is the last paragraph of a cut-short extraction.
+        if PDF_INCOMPLETE_NOTE not in text[-300:]:
+            cache.set(key, text)
+    return text
+
+
+SearchFn = Callable[..., List[Dict[str, str]]]
+
+# Seconds a single query may take inside search_many before it is reported as timed out.
+SEARCH_TIMEOUT = float(os.getenv("STUDYMATE_SEARCH_TIMEOUT", "15"))
+
+
+def _search_error(message: str) -> List[Dict[str, str]]:
+    """
+    Build the single-item result list used to report a failed search.
+    """
+    return [
+        {
+            "title": "Search error",
+            "href": "",
+            "body": message,
+        }
+    ]
+
+
+# Search result cache: seconds to keep non-empty and empty result lists, and maximum entry count.
+SEARCH_CACHE_TTL = float(os.getenv("STUDYMATE_SEARCH_CACHE_TTL", str(24 * 3600)))
+SEARCH_CACHE_NEGATIVE_TTL = float(os.getenv("STUDYMATE_SEARCH_CACHE_NEGATIVE_TTL", "3600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("STUDYMATE_SEARCH_CACHE_MAX_ENTRIES", "20000"))
+
+
+def _get_search_cache() -> SQLiteCache:
+    return get_cache(
+        "search",
+        max_entries=SEARCH_CACHE_MAX_ENTRIES,
+        default_ttl=SEARCH_CACHE_TTL,
+    )
 
-    raise ValueError("Unsupported file type. Please upload a PDF, DOCX, or TXT file.")
 
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
 
-def _ddg_text(query: str, max_results: int = 5) -> List[Dict[str, str]]:
+
+def search_cache_stats() -> Dict[str, Any]:
+    """
+    Return hit/miss counters and size of the search result cache.
+    """
+    return _get_search_cache().stats()
+
+
+# Search backend: "ddgs" (live web), "local" (offline index at STUDYMATE_LOCAL_INDEX)
+# or "local+ddgs" (local index first, web search when it has no answer).
+SEARCH_BACKEND = os.getenv("STUDYMATE_SEARCH_BACKEND", "ddgs").lower()
+LOCAL_INDEX_PATH = os.getenv(
+    "STUDYMATE_LOCAL_INDEX",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "local_index.sqlite3"),
+)
+
+# Module-level pool: Streamlit keeps imported modules across reruns, so sessions persist.
+ddgs_pool = DDGSPool()
+
+
+def _default_search_backend() -> SearchBackend:
+    if SEARCH_BACKEND == "local":
+        return LocalIndexBackend(LOCAL_INDEX_PATH)
+    if SEARCH_BACKEND == "local+ddgs":
+        return TieredBackend([LocalIndexBackend(LOCAL_INDEX_PATH), DDGSBackend(ddgs_pool)])
+    if SEARCH_BACKEND != "ddgs":
+        raise ValueError(
+            f"Unknown search backend '{SEARCH_BACKEND}'. Use ddgs, local or local+ddgs."
+        )
+    return DDGSBackend(ddgs_pool)
+
+
+_search_backend: SearchBackend = _default_search_backend()
+
+
+def get_search_backend() -> SearchBackend:
+    """
+    Return the backend currently answering search_text and friends.
+    """
+    return _search_backend
+
+
+def set_search_backend(backend: SearchBackend) -> None:
     """
-    Helper wrapper around DDGS().text for general web search.
+    Route every search through backend (e.g. a local index for offline load tests).
     """
+    global _search_backend
+    _search_backend = backend
+
+
+def _search(query: str, max_results: int = 5) -> List[Dict[str, str]]:
+    """
+    Run query on the active search backend.
+
+    Results are served from the on-disk search cache when the same normalized query
+    was answered recently by the same backend. Empty result lists are cached for a
+    shorter time; failures are never cached.
+    """
+    backend = _search_backend
+    use_cache = SEARCH_CACHE_TTL > 0
+    key = SQLiteCache.make_key(backend.name, _normalize_query(query), max_results)
+    if use_cache:
+        cached = _get_search_cache().get(key)
+        if cached is not None:
+            return cached
+
     try:
-        with DDGS() as ddgs:
-            # ddgs.text returns an iterator of dicts: {"title","href","body",...}
-            results_iter = ddgs.text(query, max_results=max_results)
-            results = list(results_iter)
-        return results
+        results = backend.text(query, max_results=max_results)
     except Exception as exc:
-        return [
-            {
-                "title": "Search error",
-                "href": "",
-                "body": f"DDGS search failed: {exc}",
-            }
-        ]
+        return _search_error(f"{backend.name.upper()} search failed: {exc}")
+
+    if use_cache:
+        ttl = SEARCH_CACHE_TTL if results else SEARCH_CACHE_NEGATIVE_TTL
+        _get_search_cache().set(key, results, ttl=ttl)
+    return results
 
 
 def search_text(query: str, max_results: int = 5) -> List[Dict[str, str]]:
     """
     General-purpose text search.
     """
-    return _ddg_text(query, max_results=max_results)
+    return _search(query, max_results=max_results)
 
 
 def search_videos(query: str, max_results: int = 5) -> List[Dict[str, str]]:
     """
     Search for video tutorials.
     """
-    return _ddg_text(query, max_results=max_results)
+    return _search(query, max_results=max_results)
 
 
 def search_projects(query: str, max_results: int = 5) -> List[Dict[str, str]]:
     """
     Search for GitHub / DockerHub projects.
     """
-    return _ddg_text(query, max_results=max_results)
+    return _search(query, max_results=max_results)
 
 
 def search_exams(query: str, max_results: int = 5) -> List[Dict[str, str]]:
     """
     Search for past exam PDFs.
     """
-    return _ddg_text(query, max_results=max_results)
+    return _search(query, max_results=max_results)
+
+
+def search_many(
+    jobs: Dict[Hashable, Tuple[SearchFn, str, int]],
+    timeout: float = SEARCH_TIMEOUT,
+    max_workers: Optional[int] = None,
+) -> Iterator[Tuple[Hashable, List[Dict[str, str]]]]:
+    """
+    Run several searches concurrently and yield (key, results) as each one completes.
+
+    jobs maps a caller-chosen key to (search_fn, query, max_results), where search_fn
+    has the signature of search_text. Every job starts immediately, so the search
+    phase takes as long as the slowest query instead of the sum of all of them.
+    timeout applies to each query on its own, from the moment a worker starts it
+    (right away unless max_workers is smaller than the number of jobs): a query
+    still running after that is yielded as a "Search error" result, and the
+    others keep their full budget.
+    """
+    if not jobs:
+        return
+
+    executor = ThreadPoolExecutor(
+        max_workers=max_workers or len(jobs),
+        thread_name_prefix="search",
+    )
+    started: Dict[Hashable, float] = {}
+
+    def run(key: Hashable, search_fn: SearchFn, query: str, max_results: int) -> List[Dict[str, str]]:
+        started[key] = time.monotonic()
+        # Backends stop waiting for a rate limiter slot once the query is given up on.
+        with search_deadline(timeout):
+            return search_fn(query, max_results=max_results)
+
+    # Workers run in copies of this context so the rate limiter sees the caller's session.
+    with session_scope():
+        pending = {
+            executor.submit(
+                contextvars.copy_context().run, run, key, search_fn, query, max_results
+            ): key
+            for key, (search_fn, query, max_results) in jobs.items()
+        }
+    try:
+        while pending:
+            now = time.monotonic()
+            for future, key in list(pending.items()):
+                if key in started and now - started[key] >= timeout and not future.done():
+                    del pending[future]
+                    yield key, _search_error(f"Search timed out after {timeout:g} seconds.")
+            deadlines = [started[key] + timeout for key in pending.values() if key in started]
+            done, _ = wait(
+                pending,
+                timeout=max(0.0, min(deadlines) - now) if deadlines else timeout,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                key = pending.pop(future)
+                try:
+                    results = future.result()
+                except Exception as exc:
+                    results = _search_error(f"Search failed: {exc}")
+                yield key, results
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)